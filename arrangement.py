@@ -0,0 +1,225 @@
+"""
+Arrangement - A song's chord blocks stored as sorted NumPy columns
+"""
+
+import numpy as np
+
+from theory import transpose_chord
+
+# One row per block; 30 bytes, so 100k blocks take about 3 MB. Little-endian
+# and packed, as the rows are also the record layout of binary song files
+BLOCK_DTYPE = np.dtype([
+    ('chord', '<i4'),  # Index into Arrangement.chord_names
+    ('position', '<f8'),  # Start in beats
+    ('duration', '<f8'),  # Length in beats
+    ('track', '<i2'),
+    ('velocity', '<f8'),  # Gain applied to the block's audio
+])
+
+
+class ChordBlock:
+    """Represents a chord block on the timeline"""
+    __slots__ = ('chord_name', 'position', 'duration', 'track', 'velocity', 'canvas_id', 'text_id')
+
+    def __init__(self, chord_name, position, duration=1.0, track=0, velocity=1.0):
+        self.chord_name = chord_name
+        self.position = position  # Position in beats
+        self.duration = duration  # Duration in beats
+        self.track = track  # Track/row number (0, 1, 2, ...)
+        self.velocity = velocity  # 1.0 plays the chord as rendered
+        self.canvas_id = None
+        self.text_id = None
+
+
+class Arrangement:
+    """Chord blocks as one structured array, always sorted by (position, track)
+
+    Blocks that tie keep the order they were added in, exactly as sorting a
+    list of them would. Chord names are stored once each and referenced by
+    id. Bulk edits work on index arrays (as returned by select()) and are
+    vectorized; iterating or indexing hands out ChordBlock copies of rows.
+    """
+
+    def __init__(self, blocks=()):
+        self.chord_names = []  # Chord id -> name
+        self._chord_ids = {}  # Name -> chord id
+        self._rows = np.zeros(0, dtype=BLOCK_DTYPE)
+        self.extend(blocks)
+
+    @classmethod
+    def from_columns(cls, chord_names, position, duration, track=0, velocity=1.0):
+        """Build an arrangement from parallel sequences (scalars are broadcast)"""
+        arrangement = cls()
+        position = np.asarray(position, dtype=np.float64)
+        rows = np.zeros(len(position), dtype=BLOCK_DTYPE)
+        names, chords = np.unique(np.asarray(chord_names, dtype=str), return_inverse=True)
+        rows['chord'] = np.array([arrangement.chord_id(name) for name in names.tolist()],
+                                 dtype=np.int32)[chords.ravel()]
+        rows['position'] = position
+        rows['duration'] = duration
+        rows['track'] = track
+        rows['velocity'] = velocity
+        arrangement._insert(rows)
+        return arrangement
+
+    @classmethod
+    def from_rows(cls, chord_names, rows):
+        """Wrap rows that are already sorted, e.g. memory-mapped from a file, without copying"""
+        arrangement = cls()
+        for name in chord_names:
+            arrangement.chord_id(name)
+        arrangement._rows = rows
+        return arrangement
+
+    def detach(self):
+        """Copy memory-mapped rows into memory, so the file they came from can be replaced"""
+        if isinstance(self._rows, np.memmap):
+            self._rows = np.array(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        for i in range(len(self._rows)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        row = self._rows[i]
+        return ChordBlock(self.chord_names[row['chord']], float(row['position']),
+                          float(row['duration']), int(row['track']), float(row['velocity']))
+
+    @property
+    def rows(self):
+        """The sorted rows as a read-only structured array"""
+        rows = self._rows.view()
+        rows.flags.writeable = False
+        return rows
+
+    def chord_id(self, name):
+        """Id of a chord name, adding it to the name table if it's new"""
+        chord = self._chord_ids.get(name)
+        if chord is None:
+            chord = self._chord_ids[name] = len(self.chord_names)
+            self.chord_names.append(name)
+        return chord
+
+    def names(self, indices=slice(None)):
+        """Chord names of the given rows as an object array"""
+        return np.array(self.chord_names, dtype=object)[self._rows['chord'][indices]]
+
+    def extend(self, blocks):
+        """Add ChordBlocks (or anything with the same attributes)"""
+        blocks = list(blocks)
+        rows = np.zeros(len(blocks), dtype=BLOCK_DTYPE)
+        rows['chord'] = [self.chord_id(block.chord_name) for block in blocks]
+        rows['position'] = [block.position for block in blocks]
+        rows['duration'] = [block.duration for block in blocks]
+        rows['track'] = [block.track for block in blocks]
+        rows['velocity'] = [getattr(block, 'velocity', 1.0) for block in blocks]
+        self._insert(rows)
+
+    def _insert(self, rows):
+        """Merge new rows in and return the indices they end up at"""
+        count = len(self._rows)
+        rows = np.concatenate([self._rows, rows])
+        # lexsort is stable, so ties stay in the order they were added
+        order = np.lexsort((rows['track'], rows['position']))
+        self._rows = rows[order]
+        return np.flatnonzero(order >= count)
+
+    def end_beat(self):
+        """Beat where the last block ends (0 for an empty arrangement)"""
+        if not len(self._rows):
+            return 0
+        return float(np.max(self._rows['position'] + self._rows['duration']))
+
+    def track_count(self):
+        """Number of tracks up to and including the highest one in use"""
+        return int(self._rows['track'].max()) + 1 if len(self._rows) else 0
+
+    def select(self, start, end, tracks=None):
+        """Indices of the rows overlapping the beats [start, end), in order
+
+        tracks optionally limits the selection to a collection of tracks.
+        """
+        # Rows are sorted by position, so only those starting before end qualify
+        last = np.searchsorted(self._rows['position'], end, side='left')
+        candidates = self._rows[:last]
+        mask = candidates['position'] + candidates['duration'] > start
+        if tracks is not None:
+            mask &= np.isin(candidates['track'], list(tracks))
+        return np.flatnonzero(mask)
+
+    def remove(self, indices):
+        """Delete rows"""
+        self._rows = np.delete(self._rows, indices)
+
+    def shift(self, indices, beats=0.0, tracks=0):
+        """Move rows by a number of beats and/or tracks; returns their new indices"""
+        moved = self._rows[indices].copy()
+        moved['position'] += beats
+        moved['track'] += tracks
+        if np.any(moved['position'] < 0) or np.any(moved['track'] < 0):
+            raise ValueError("blocks can't move before the start of the song or above track 0")
+        self.remove(indices)
+        return self._insert(moved)
+
+    def duplicate(self, indices, beats=0.0, tracks=0):
+        """Copy rows, moved by a number of beats and/or tracks; returns the copies' indices"""
+        copies = self._rows[indices].copy()
+        copies['position'] += beats
+        copies['track'] += tracks
+        if np.any(copies['position'] < 0) or np.any(copies['track'] < 0):
+            raise ValueError("blocks can't move before the start of the song or above track 0")
+        return self._insert(copies)
+
+    def transpose(self, indices, semitones):
+        """Transpose the chords of rows; raises ValueError for unparseable names"""
+        ids, inverse = np.unique(self._rows['chord'][indices], return_inverse=True)
+        # Each distinct chord is respelled once, however many rows use it
+        transposed = np.array([self.chord_id(transpose_chord(self.chord_names[chord], semitones))
+                               for chord in ids], dtype=np.int32)
+        self._rows['chord'][indices] = transposed[inverse]
+
+    def scale_velocity(self, indices, factor):
+        """Multiply the velocity of rows"""
+        self._rows['velocity'][indices] *= factor
+
+    def batches(self, wanted=None):
+        """Group rows that start together with the same length, in mix order
+
+        Returns a list of ChordBlock lists: positions in order, and within a
+        position one batch per duration in order of first appearance. Each
+        batch is synthesized in one go and batches are always mixed in this
+        order. wanted (a boolean mask over the rows) keeps only the batches
+        with at least one wanted row.
+        """
+        rows = self._rows
+        if not len(rows):
+            return []
+        # Rows are sorted by position, so ordering the (position, duration)
+        # groups by their first row puts positions in order and durations in
+        # first-appearance order within each position
+        pairs = np.stack([rows['position'], rows['duration']], axis=1)
+        _, first, group = np.unique(pairs, axis=0, return_index=True, return_inverse=True)
+        group = group.ravel()
+        order = np.argsort(first[group], kind='stable')
+        bounds = np.flatnonzero(np.diff(first[group][order])) + 1
+
+        if wanted is not None:
+            keep = np.bincount(group, weights=wanted, minlength=len(first)) > 0
+        names = self.names().tolist()
+        positions, durations = rows['position'].tolist(), rows['duration'].tolist()
+        tracks, velocities = rows['track'].tolist(), rows['velocity'].tolist()
+        batches = []
+        for members in np.split(order, bounds):
+            if wanted is not None and not keep[group[members[0]]]:
+                continue
+            batches.append([ChordBlock(names[i], positions[i], durations[i], tracks[i], velocities[i])
+                            for i in members.tolist()])
+        return batches
+
+
+def as_arrangement(blocks):
+    """The blocks as an Arrangement (arrangements are passed through as is)"""
+    return blocks if isinstance(blocks, Arrangement) else Arrangement(blocks)
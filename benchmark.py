@@ -0,0 +1,252 @@
+"""
+Benchmark - Times synthesis, song rendering and effects headlessly, with real-time factors
+
+    python benchmark.py                              # Everything
+    python benchmark.py --suite tone --suite chord --quick
+    python benchmark.py --output today.json --baseline yesterday.json
+
+Each case reports wall time (best of --repeat runs), real-time factor (wall
+time / audio length; below 1 is faster than real time) and peak traced
+memory from a separate tracemalloc run. Results can be written as JSON and
+compared against an earlier results file; slowdowns beyond --threshold
+make the command exit with status 1.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from arrangement import Arrangement
+from chord_generator import DEFAULT_SAMPLE_RATE, INSTRUMENTS, ChordGenerator
+from dsp import REVERB_PRESETS, ConvolutionReverb
+from renderer import REVERB_PARTITION, mix_song
+
+TONE_DURATIONS = [0.25, 1.0, 4.0]  # Seconds
+TONE_PITCHES = ['C2', 'A4', 'C7']
+CHORD_SIZES = {1: 'C4n', 3: 'C', 4: 'C7', 5: 'C9', 6: 'C13'}  # Notes -> a chord with that many
+SONG_BLOCKS = [10, 100, 1000, 10000, 100000]
+SONG_TRACKS = [1, 8, 64]
+SONG_CHORDS = ['C', 'G', 'Am', 'F', 'Dm7', 'G7', 'Cmaj7', 'E4n', 'A3n', 'Bdim']
+SONG_DURATIONS = [1.0, 0.5, 0.5, 2.0]  # Beats, cycled along each track
+SONG_BPM = 120
+REVERB_SECONDS = [10.0, 60.0]  # Length of the signal sent through each master reverb
+REVERB_PARTITIONS = {'live': 1024, 'export': REVERB_PARTITION}
+
+# --quick keeps every suite but drops the slowest sizes
+QUICK_LIMITS = {'durations': [1.0], 'blocks': [10, 100, 1000], 'tracks': [1, 8], 'seconds': [10.0]}
+
+
+def synthetic_arrangement(blocks, tracks, seed=0):
+    """A reproducible song: blocks spread evenly over the tracks, back to back"""
+    rng = np.random.default_rng(seed)
+    track = np.arange(blocks) % tracks
+    step = np.arange(blocks) // tracks  # Block number along its track
+    # Every track plays the same rhythm of SONG_DURATIONS
+    step_durations = np.resize(SONG_DURATIONS, -(-blocks // tracks))
+    step_starts = np.cumsum(step_durations) - step_durations
+    names = rng.choice(SONG_CHORDS, blocks)
+    return Arrangement.from_columns(names, step_starts[step], step_durations[step], track)
+
+
+def measure(run, audio_seconds, repeat):
+    """Time run() repeat times (best wins), then once more under tracemalloc"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    wall = min(times)
+    return {
+        'wall_seconds': wall,
+        'audio_seconds': audio_seconds,
+        'real_time_factor': wall / audio_seconds if audio_seconds else None,
+        'peak_bytes': peak,
+    }
+
+
+def tone_cases(sample_rate, quick, max_blocks=None):
+    """Single-note synthesis per instrument, duration and pitch (max_blocks is for songs)"""
+    generator = ChordGenerator(sample_rate=sample_rate)
+    durations = QUICK_LIMITS['durations'] if quick else TONE_DURATIONS
+    for instrument in INSTRUMENTS:
+        for duration in durations:
+            for pitch in TONE_PITCHES:
+                def run(frequency=generator.note_frequency(pitch), duration=duration,
+                        instrument=instrument):
+                    generator.generate_tone(frequency, duration, instrument=instrument)
+
+                yield (f"tone/{instrument}/{duration:g}s/{pitch}",
+                       {'instrument': instrument, 'duration': duration, 'pitch': pitch},
+                       run, duration)
+
+
+def chord_cases(sample_rate, quick, max_blocks=None):
+    """Chord synthesis by number of notes (uncached, as for a chord heard the first time)"""
+    generator = ChordGenerator(sample_rate=sample_rate)
+    durations = QUICK_LIMITS['durations'] if quick else TONE_DURATIONS
+    for instrument in ('Piano', 'Organ', 'Synth'):
+        for notes, chord in CHORD_SIZES.items():
+            for duration in durations:
+                def run(chord=chord, duration=duration, instrument=instrument):
+                    generator.invalidate_cache()
+                    generator.render_chord(chord, duration, instrument)
+
+                yield (f"chord/{instrument}/{notes} notes/{duration:g}s",
+                       {'instrument': instrument, 'notes': notes, 'chord': chord, 'duration': duration},
+                       run, duration)
+
+
+def song_cases(sample_rate, quick, max_blocks):
+    """Whole-song renders of synthetic arrangements, as export runs them (up to max_blocks)
+
+    Chunks are thrown away as they are produced, so the biggest songs are
+    measured without holding hours of audio in memory. Each run starts
+    with a fresh generator, so its render cache starts cold.
+    """
+    sizes = QUICK_LIMITS['blocks'] if quick else SONG_BLOCKS
+    track_counts = QUICK_LIMITS['tracks'] if quick else SONG_TRACKS
+    for blocks in sizes:
+        if max_blocks and blocks > max_blocks:
+            continue
+        for tracks in track_counts:
+            if tracks > blocks:
+                continue
+            arrangement = synthetic_arrangement(blocks, tracks)
+            audio_seconds = arrangement.end_beat() * 60.0 / SONG_BPM
+
+            def run(arrangement=arrangement):
+                mix_song(ChordGenerator(sample_rate=sample_rate), arrangement, SONG_BPM,
+                         lambda chunk: None)
+
+            yield (f"song/{blocks} blocks/{tracks} tracks",
+                   {'blocks': blocks, 'tracks': tracks, 'bpm': SONG_BPM},
+                   run, audio_seconds)
+
+
+def reverb_cases(sample_rate, quick, max_blocks=None):
+    """Master-bus convolution reverb per preset, fed in playback-sized blocks"""
+    lengths = QUICK_LIMITS['seconds'] if quick else REVERB_SECONDS
+    noise = np.random.default_rng(0).standard_normal((int(max(lengths) * sample_rate), 2))
+    for name in REVERB_PRESETS:
+        for use, partition in REVERB_PARTITIONS.items():
+            reverb = ConvolutionReverb.preset(name, sample_rate, partition=partition)
+            for seconds in lengths:
+                def run(reverb=reverb, signal=noise[:int(seconds * sample_rate)]):
+                    reverb.reset()
+                    for start in range(0, len(signal), 1024):
+                        reverb.process(signal[start:start + 1024])
+
+                yield (f"reverb/{name}/{use}/{seconds:g}s",
+                       {'preset': name, 'partition': partition, 'seconds': seconds},
+                       run, seconds)
+
+
+SUITES = {
+    'tone': tone_cases,
+    'chord': chord_cases,
+    'song': song_cases,
+    'reverb': reverb_cases,
+}
+
+
+def run_benchmarks(suites, sample_rate=DEFAULT_SAMPLE_RATE, repeat=3, quick=False, max_blocks=None,
+                   report=print):
+    """Run the chosen suites and return the results as a list of dicts"""
+    results = []
+    for suite in suites:
+        for name, params, run, audio_seconds in SUITES[suite](sample_rate, quick, max_blocks):
+            result = {'name': name, 'suite': suite, 'params': params}
+            result.update(measure(run, audio_seconds, repeat))
+            results.append(result)
+            report(format_result(result))
+    return results
+
+
+def format_result(result, baseline=None):
+    line = (f"{result['name']:<40} {result['wall_seconds'] * 1000:10.2f} ms"
+            f"  rtf {result['real_time_factor']:8.4f}"
+            f"  peak {result['peak_bytes'] / (1024 * 1024):8.1f} MB")
+    if baseline is not None:
+        change = result['wall_seconds'] / baseline['wall_seconds'] - 1
+        line += f"  {change:+7.1%} vs baseline"
+    return line
+
+
+def compare(results, baseline_results, threshold):
+    """Lines comparing results to a baseline and the names of cases that got slower"""
+    baseline = {result['name']: result for result in baseline_results}
+    lines = []
+    slower = []
+    for result in results:
+        old = baseline.get(result['name'])
+        if old is None:
+            continue
+        lines.append(format_result(result, old))
+        if result['wall_seconds'] > old['wall_seconds'] * (1 + threshold):
+            slower.append(result['name'])
+    return lines, slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python benchmark.py',
+        description="Benchmark tone, chord, whole-song and reverb rendering without the GUI"
+    )
+    parser.add_argument('--suite', action='append', choices=list(SUITES),
+                        help="Suite to run (repeat for several; default: all)")
+    parser.add_argument('--quick', action='store_true',
+                        help="Fewer durations, songs up to 1000 blocks and 8 tracks, 10s of reverb")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Timed runs per case; the best one counts")
+    parser.add_argument('--max-blocks', type=int,
+                        help="Skip songs with more blocks than this")
+    parser.add_argument('--sample-rate', type=int, default=DEFAULT_SAMPLE_RATE)
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--baseline', help="Results JSON file from an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Slowdown vs the baseline that counts as a regression (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    suites = args.suite or list(SUITES)
+    results = run_benchmarks(suites, args.sample_rate, max(1, args.repeat), args.quick, args.max_blocks)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'platform': platform.platform(),
+                'sample_rate': args.sample_rate,
+                'results': results,
+            }, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        lines, slower = compare(results, baseline['results'], args.threshold)
+        print(f"\nCompared with {args.baseline}:")
+        for line in lines:
+            print(line)
+        if slower:
+            print(f"{len(slower)} case(s) slower than the baseline by more than "
+                  f"{args.threshold:.0%}: " + ", ".join(slower))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
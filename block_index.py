@@ -0,0 +1,229 @@
+"""
+Block Index - The song's chord blocks, indexed by track and beat for fast lookup
+"""
+
+from bisect import bisect_left, bisect_right, insort
+
+import numpy as np
+
+from arrangement import BLOCK_DTYPE, Arrangement
+
+
+class BlockIndex:
+    """Ordered collection of chord blocks with per-track interval lookups
+
+    Iterates in insertion order like the plain list it replaces. Each track
+    keeps its blocks sorted by start and by end beat, so finding the block
+    under the mouse or a stretch handle is a binary search, and the canvas
+    items of every drawn block map straight back to it.
+
+    A loaded arrangement stays as rows until a query reaches them; only then
+    do they become ChordBlocks, so opening a huge song costs next to nothing.
+    """
+
+    def __init__(self, blocks=()):
+        self._blocks = {}  # Block -> sequence number; dicts keep insertion order
+        self._next_seq = 0
+        self._starts = {}  # Track -> sorted [(position, seq, block)]
+        self._ends = {}  # Track -> sorted [(position + duration, seq, block)]
+        self._longest = {}  # Track -> longest duration ever added (bounds overlap searches)
+        self._items = {}  # Canvas item id -> block
+        self._mapped = {}  # Block -> the canvas item ids mapped to it
+        self._pending = None  # Loaded arrangement whose rows become blocks on demand
+        self._unloaded = None  # Mask of its rows that haven't become blocks yet
+        self._unloaded_count = 0
+        self._pending_longest = 0  # Longest duration among its rows
+        self._pending_ends = None  # (sorted end beats, row of each) of its rows, made when needed
+        for block in blocks:
+            self.append(block)
+
+    def __len__(self):
+        return len(self._blocks) + self._unloaded_count
+
+    def __iter__(self):
+        if self._pending is None:
+            return iter(list(self._blocks))
+        # Loaded rows became blocks in whatever order they were reached
+        self._load(np.flatnonzero(self._unloaded))
+        return iter(sorted(self._blocks, key=self._blocks.get))
+
+    def __contains__(self, block):
+        return block in self._blocks
+
+    def load(self, arrangement):
+        """Replace everything with an arrangement's blocks, without creating them yet
+
+        The arrangement is kept as is (it may be memory-mapped) and must not
+        be changed afterwards.
+        """
+        self.clear()
+        rows = arrangement.rows
+        self._pending = arrangement
+        self._unloaded = np.ones(len(rows), dtype=bool)
+        self._unloaded_count = len(rows)
+        self._pending_longest = float(rows['duration'].max()) if len(rows) else 0
+        # Row numbers serve as the loaded blocks' sequence numbers
+        self._next_seq = len(rows)
+
+    def detach(self):
+        """Stop reading the loaded arrangement from its file (see Arrangement.detach)"""
+        if self._pending is not None:
+            self._pending.detach()
+
+    def append(self, block):
+        """Add a block (blocks are compared by identity)"""
+        seq = self._next_seq
+        self._next_seq += 1
+        self._add(block, seq)
+
+    def _add(self, block, seq):
+        self._blocks[block] = seq
+        insort(self._starts.setdefault(block.track, []), (block.position, seq, block))
+        insort(self._ends.setdefault(block.track, []), (block.position + block.duration, seq, block))
+        self._longest[block.track] = max(self._longest.get(block.track, 0), block.duration)
+
+    def remove(self, block):
+        """Remove a block; raises ValueError if it isn't in the index"""
+        seq = self._blocks.pop(block, None)
+        if seq is None:
+            raise ValueError("block is not in the index")
+        self._discard(self._starts[block.track], (block.position, seq, block))
+        self._discard(self._ends[block.track], (block.position + block.duration, seq, block))
+        self.unmap_items(block)
+
+    def clear(self):
+        self._pending = None
+        self._unloaded = None
+        self._unloaded_count = 0
+        self._pending_longest = 0
+        self._pending_ends = None
+        self._blocks.clear()
+        self._starts.clear()
+        self._ends.clear()
+        self._longest.clear()
+        self._items.clear()
+        self._mapped.clear()
+
+    def resize(self, block, duration):
+        """Change a block's duration and keep its end in order"""
+        seq = self._blocks[block]
+        ends = self._ends[block.track]
+        self._discard(ends, (block.position + block.duration, seq, block))
+        block.duration = duration
+        insort(ends, (block.position + block.duration, seq, block))
+        self._longest[block.track] = max(self._longest[block.track], duration)
+
+    def last_beat(self):
+        """Beat where the last block ends (0 for an empty song)"""
+        last = max((ends[-1][0] for ends in self._ends.values() if ends), default=0)
+        if self._unloaded_count:
+            rows = self._pending.rows[self._unloaded]
+            last = max(last, float(np.max(rows['position'] + rows['duration'])))
+        return last
+
+    def track_count(self):
+        """Number of tracks up to and including the highest one in use"""
+        count = max((track + 1 for track, starts in self._starts.items() if starts), default=0)
+        if self._unloaded_count:
+            count = max(count, int(self._pending.rows['track'][self._unloaded].max()) + 1)
+        return count
+
+    def block_ending_near(self, track, beat, tolerance):
+        """A block on the track whose end lies within tolerance beats of beat, or None"""
+        if self._unloaded_count:
+            # Pending rows sorted by end, like loaded ones, so only a slice can match
+            if self._pending_ends is None:
+                rows = self._pending.rows
+                ends = rows['position'] + rows['duration']
+                order = np.argsort(ends, kind='stable')
+                self._pending_ends = (ends[order], order)
+            ends, order = self._pending_ends
+            first = np.searchsorted(ends, beat - tolerance)
+            last = np.searchsorted(ends, beat + tolerance, side='right')
+            candidates = order[first:last]
+            self._load(candidates[self._unloaded[candidates]
+                                  & (self._pending.rows['track'][candidates] == track)])
+        ends = self._ends.get(track, [])
+        i = bisect_left(ends, (beat - tolerance,))
+        while i < len(ends) and ends[i][0] <= beat + tolerance:
+            if abs(ends[i][0] - beat) < tolerance:
+                return ends[i][2]
+            i += 1
+        return None
+
+    def blocks_between(self, track, start, end):
+        """Blocks on the track that overlap the beats [start, end), in start order"""
+        if self._unloaded_count:
+            # Pending rows are sorted by position, so only a slice can overlap
+            rows = self._pending.rows
+            first = np.searchsorted(rows['position'], start - self._pending_longest)
+            last = np.searchsorted(rows['position'], end)
+            window = rows[first:last]
+            self._load(first + np.flatnonzero(self._unloaded[first:last] & (window['track'] == track)
+                                              & (window['position'] + window['duration'] > start)))
+        starts = self._starts.get(track, [])
+        first = bisect_left(starts, (start - self._longest.get(track, 0),))
+        last = bisect_right(starts, (end,))
+        return [block for position, _, block in starts[first:last]
+                if position < end and position + block.duration > start]
+
+    def to_arrangement(self):
+        """All blocks, loaded or not, as an Arrangement in song order"""
+        if self._pending is None:
+            return Arrangement(list(self._blocks))
+
+        # Snapshot first: the GUI thread may load rows while playback reads
+        unloaded = self._unloaded.copy()
+        loaded = list(self._blocks.items())
+        pending = self._pending
+        unloaded[[seq for _, seq in loaded if seq < len(unloaded)]] = False
+
+        # Loaded blocks go into a copy of the pending chord name table
+        chord_ids = {name: chord for chord, name in enumerate(pending.chord_names)}
+        indices = np.flatnonzero(unloaded)
+        blocks = [block for block, _ in loaded]
+        rows = np.zeros(len(indices) + len(blocks), dtype=BLOCK_DTYPE)
+        rows[:len(indices)] = pending.rows[indices]
+        added = rows[len(indices):]
+        added['chord'] = [chord_ids.setdefault(block.chord_name, len(chord_ids)) for block in blocks]
+        added['position'] = [block.position for block in blocks]
+        added['duration'] = [block.duration for block in blocks]
+        added['track'] = [block.track for block in blocks]
+        added['velocity'] = [block.velocity for block in blocks]
+        seqs = np.concatenate([indices, np.array([seq for _, seq in loaded], dtype=np.int64)])
+        # Ties in position and track keep the order the blocks were added in
+        order = np.lexsort((seqs, rows['track'], rows['position']))
+        return Arrangement.from_rows(list(chord_ids), rows[order])
+
+    def _load(self, indices):
+        """Turn pending rows into blocks"""
+        for i in indices:
+            if self._unloaded[i]:
+                self._unloaded[i] = False
+                self._unloaded_count -= 1
+                self._add(self._pending[i], int(i))
+
+    def map_items(self, block):
+        """Point the block's current canvas items back at it"""
+        self.unmap_items(block)
+        items = tuple(item for item in (block.canvas_id, block.text_id) if item)
+        for item in items:
+            self._items[item] = block
+        self._mapped[block] = items
+
+    def unmap_items(self, block):
+        """Forget the canvas items last mapped to the block"""
+        for item in self._mapped.pop(block, ()):
+            if self._items.get(item) is block:
+                del self._items[item]
+
+    def block_for_item(self, item):
+        """The block a canvas item belongs to, or None"""
+        return self._items.get(item)
+
+    @staticmethod
+    def _discard(entries, entry):
+        i = bisect_left(entries, entry[:2])
+        while entries[i][2] is not entry[2]:
+            i += 1
+        del entries[i]
@@ -0,0 +1,124 @@
+"""
+Track Buses - Per-track gain, pan, mute and solo, applied when the tracks are mixed together
+"""
+
+import threading
+
+import numpy as np
+
+
+class TrackBus:
+    """Fader settings of one track
+
+    gain is linear, pan runs from -1 (left) through 0 to 1 (right).
+    """
+
+    __slots__ = ('gain', 'pan', 'mute', 'solo')
+
+    def __init__(self, gain=1.0, pan=0.0, mute=False, solo=False):
+        self.gain = gain
+        self.pan = pan
+        self.mute = mute
+        self.solo = solo
+
+    def is_default(self):
+        return self.gain == 1.0 and self.pan == 0.0 and not self.mute and not self.solo
+
+    def stereo_gain(self):
+        """(left, right) gain; constant power, with both at the track gain in the centre"""
+        angle = (self.pan + 1) * np.pi / 4
+        return (self.gain * np.sqrt(2) * np.cos(angle), self.gain * np.sqrt(2) * np.sin(angle))
+
+
+class TrackBuses:
+    """Fader settings of every track of a song; tracks never touched play at unity
+
+    The mixers read the settings while they mix, so changes take effect on
+    the next block mixed, without rendering anything again.
+    """
+
+    def __init__(self):
+        self._buses = {}  # Track -> TrackBus, only for tracks that were changed
+        self._lock = threading.Lock()  # The GUI changes settings while playback mixes
+
+    def __getitem__(self, track):
+        """Settings of a track (a copy; change them with set())"""
+        with self._lock:
+            bus = self._buses.get(track)
+            return TrackBus() if bus is None else TrackBus(bus.gain, bus.pan, bus.mute, bus.solo)
+
+    def set(self, track, gain=None, pan=None, mute=None, solo=None):
+        """Change some of a track's settings"""
+        with self._lock:
+            bus = self._buses.setdefault(track, TrackBus())
+            if gain is not None:
+                bus.gain = float(gain)
+            if pan is not None:
+                bus.pan = float(min(max(pan, -1.0), 1.0))
+            if mute is not None:
+                bus.mute = bool(mute)
+            if solo is not None:
+                bus.solo = bool(solo)
+            if bus.is_default():
+                del self._buses[track]
+
+    def reset(self):
+        """Put every track back to unity"""
+        with self._lock:
+            self._buses.clear()
+
+    def key(self):
+        """Hashable snapshot of the settings, for telling whether they changed"""
+        with self._lock:
+            return tuple(sorted((track, bus.gain, bus.pan, bus.mute, bus.solo)
+                                for track, bus in self._buses.items()))
+
+    def gains(self, tracks):
+        """(tracks, 2) float32 (left, right) gains, with mute and solo applied"""
+        with self._lock:
+            soloing = any(bus.solo for bus in self._buses.values())
+            gains = np.ones((len(tracks), 2), dtype=np.float32)
+            for i, track in enumerate(tracks):
+                bus = self._buses.get(int(track))
+                if bus is None:
+                    if soloing:
+                        gains[i] = 0
+                elif bus.mute or (soloing and not bus.solo):
+                    gains[i] = 0
+                else:
+                    gains[i] = bus.stereo_gain()
+            return gains
+
+    def mix(self, buffers, out=None):
+        """Sum {track: (samples, 2) float32 buffer} through the faders, in track order
+
+        Every mixer goes through here, so the same buffers and settings
+        always give the same samples.
+        """
+        tracks = sorted(buffers)
+        length = len(buffers[tracks[0]]) if tracks else 0
+        if out is None:
+            out = np.zeros((length, 2), dtype=np.float32)
+        else:
+            out[:] = 0
+        for track, gain in zip(tracks, self.gains(tracks)):
+            if gain[0] == 1 and gain[1] == 1:
+                out += buffers[track]
+            elif gain.any():
+                out += buffers[track] * gain
+        return out
+
+    def to_list(self):
+        """Changed tracks as JSON-ready dicts"""
+        with self._lock:
+            return [{'track': track, 'gain': bus.gain, 'pan': bus.pan,
+                     'mute': bus.mute, 'solo': bus.solo}
+                    for track, bus in sorted(self._buses.items())]
+
+    @classmethod
+    def from_list(cls, tracks_data):
+        buses = cls()
+        for track_data in tracks_data:
+            buses.set(int(track_data['track']), track_data.get('gain', 1.0), track_data.get('pan', 0.0),
+                      track_data.get('mute', False), track_data.get('solo', False))
+        return buses
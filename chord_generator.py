@@ -2,114 +2,84 @@
 Chord Generator - Creates high-quality audio for musical chords
 """
 
+import zlib
+
 import numpy as np
-import pygame
-from scipy import signal
+from dsp import smoothing_filter
+from render_cache import RenderCache
+from theory import A4_FREQUENCY, midi_to_frequency, note_to_midi, parse_chord
+from wavetable import WavetableBank
+
+# Engine-wide sample rate: synthesis, playback and export all run at it
+# unless a different rate is asked for explicitly
+DEFAULT_SAMPLE_RATE = 44100
+
+# Part of every on-disk cache key. Bump it whenever a change to synthesis
+# changes how a chord sounds, so renders from older versions aren't reused
+SYNTHESIS_VERSION = 5
+
+# Audio stays float32 at 16-bit scale (full scale is 32767) from synthesis
+# through mixing, and is quantized once, where it leaves the engine
+FULL_SCALE = 32767
+
+# Fixed gain staging: notes are synthesized at this volume and a chord is
+# the mean of its notes, so it never peaks above its loudest note
+NOTE_VOLUME = 0.9
+
+# Every instrument the synthesizer has a voice for, in the order menus show them
+INSTRUMENTS = ['Piano', 'Guitar', 'Strings', 'Organ', 'Synth', 'Bass',
+               'Flute', 'Saxophone', 'Trumpet', 'Trombone', 'Violin', 'Cello']
+
+# Instruments with random parts (phases, noise, detune); only their renders
+# depend on the generator's seed
+NOISY_INSTRUMENTS = frozenset(['Guitar', 'Bass', 'Flute', 'Violin'])
 
 class ChordGenerator:
     """Generates high-quality chord sounds using advanced synthesis"""
     
-    def __init__(self, sample_rate=48000):  # Higher sample rate for better quality
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE, cache_bytes=64 * 1024 * 1024, disk_cache=None):
         self.sample_rate = sample_rate
         
-        # Note frequencies (A4 = 440 Hz standard)
-        self.note_frequencies = {
-            'C2': 65.41, 'C#2': 69.30, 'Db2': 69.30, 'D2': 73.42, 'D#2': 77.78, 'Eb2': 77.78,
-            'E2': 82.41, 'F2': 87.31, 'F#2': 92.50, 'Gb2': 92.50, 'G2': 98.00, 'G#2': 103.83, 'Ab2': 103.83,
-            'A2': 110.00, 'A#2': 116.54, 'Bb2': 116.54, 'B2': 123.47,
-            'C3': 130.81, 'C#3': 138.59, 'Db3': 138.59, 'D3': 146.83, 'D#3': 155.56, 'Eb3': 155.56,
-            'E3': 164.81, 'F3': 174.61, 'F#3': 185.00, 'Gb3': 185.00, 'G3': 196.00, 'G#3': 207.65, 'Ab3': 207.65,
-            'A3': 220.00, 'A#3': 233.08, 'Bb3': 233.08, 'B3': 246.94,
-            'C4': 261.63, 'C#4': 277.18, 'Db4': 277.18, 'D4': 293.66, 'D#4': 311.13, 'Eb4': 311.13,
-            'E4': 329.63, 'F4': 349.23, 'F#4': 369.99, 'Gb4': 369.99, 'G4': 392.00, 'G#4': 415.30, 'Ab4': 415.30,
-            'A4': 440.00, 'A#4': 466.16, 'Bb4': 466.16, 'B4': 493.88,
-            'C5': 523.25, 'C#5': 554.37, 'Db5': 554.37, 'D5': 587.33, 'D#5': 622.25, 'Eb5': 622.25,
-            'E5': 659.25, 'F5': 698.46, 'F#5': 739.99, 'Gb5': 739.99, 'G5': 783.99, 'G#5': 830.61, 'Ab5': 830.61,
-            'A5': 880.00, 'A#5': 932.33, 'Bb5': 932.33, 'B5': 987.77,
-            'C6': 1046.50, 'C#6': 1108.73, 'Db6': 1108.73, 'D6': 1174.66, 'D#6': 1244.51, 'Eb6': 1244.51,
-            'E6': 1318.51, 'F6': 1396.91, 'F#6': 1479.98, 'Gb6': 1479.98, 'G6': 1567.98, 'G#6': 1661.22, 'Ab6': 1661.22,
-            'A6': 1760.00, 'A#6': 1864.66, 'Bb6': 1864.66, 'B6': 1975.53
-        }
+        # Rendered chord buffers, keyed on (chord, instrument, samples, sample rate,
+        # seed for noisy instruments else None, tuning)
+        self.cache = RenderCache(cache_bytes)
         
-        # Chord definitions (notes in each chord)
-        self.chord_notes = {
-            # Major Chords
-            'C': ['C4', 'E4', 'G4'], 'D': ['D4', 'F#4', 'A4'], 'E': ['E4', 'G#4', 'B4'],
-            'F': ['F4', 'A4', 'C5'], 'G': ['G4', 'B4', 'D5'], 'A': ['A4', 'C#5', 'E5'], 'B': ['B4', 'D#5', 'F#5'],
-            'Db': ['Db4', 'F4', 'Ab4'], 'Eb': ['Eb4', 'G4', 'Bb4'], 'Gb': ['Gb4', 'Bb4', 'Db5'],
-            'Ab': ['Ab4', 'C5', 'Eb5'], 'Bb': ['Bb4', 'D5', 'F5'],
-            
-            # Minor Chords
-            'Cm': ['C4', 'Eb4', 'G4'], 'Dm': ['D4', 'F4', 'A4'], 'Em': ['E4', 'G4', 'B4'],
-            'Fm': ['F4', 'Ab4', 'C5'], 'Gm': ['G4', 'Bb4', 'D5'], 'Am': ['A4', 'C5', 'E5'], 'Bm': ['B4', 'D5', 'F#5'],
-            'C#m': ['C#4', 'E4', 'G#4'], 'Ebm': ['Eb4', 'Gb4', 'Bb4'], 'F#m': ['F#4', 'A4', 'C#5'],
-            'Abm': ['Ab4', 'B4', 'Eb5'], 'Bbm': ['Bb4', 'Db5', 'F5'],
-            
-            # Seventh Chords
-            'C7': ['C4', 'E4', 'G4', 'Bb4'], 'D7': ['D4', 'F#4', 'A4', 'C5'], 'E7': ['E4', 'G#4', 'B4', 'D5'],
-            'F7': ['F4', 'A4', 'C5', 'Eb5'], 'G7': ['G4', 'B4', 'D5', 'F5'], 'A7': ['A4', 'C#5', 'E5', 'G5'], 'B7': ['B4', 'D#5', 'F#5', 'A5'],
-            'Bb7': ['Bb4', 'D5', 'F5', 'Ab5'], 'Eb7': ['Eb4', 'G4', 'Bb4', 'Db5'], 'Ab7': ['Ab4', 'C5', 'Eb5', 'Gb5'],
-            
-            # Major Seventh Chords
-            'Cmaj7': ['C4', 'E4', 'G4', 'B4'], 'Dmaj7': ['D4', 'F#4', 'A4', 'C#5'], 'Emaj7': ['E4', 'G#4', 'B4', 'D#5'],
-            'Fmaj7': ['F4', 'A4', 'C5', 'E5'], 'Gmaj7': ['G4', 'B4', 'D5', 'F#5'], 'Amaj7': ['A4', 'C#5', 'E5', 'G#5'],
-            'Bmaj7': ['B4', 'D#5', 'F#5', 'A#5'],
-            
-            # Minor Seventh Chords
-            'Cm7': ['C4', 'Eb4', 'G4', 'Bb4'], 'Dm7': ['D4', 'F4', 'A4', 'C5'], 'Em7': ['E4', 'G4', 'B4', 'D5'],
-            'Fm7': ['F4', 'Ab4', 'C5', 'Eb5'], 'Gm7': ['G4', 'Bb4', 'D5', 'F5'], 'Am7': ['A4', 'C5', 'E5', 'G5'],
-            'Bm7': ['B4', 'D5', 'F#5', 'A5'],
-            
-            # Diminished Chords
-            'Cdim': ['C4', 'Eb4', 'Gb4'], 'Ddim': ['D4', 'F4', 'Ab4'], 'Edim': ['E4', 'G4', 'Bb4'],
-            'Fdim': ['F4', 'Ab4', 'B4'], 'Gdim': ['G4', 'Bb4', 'Db5'], 'Adim': ['A4', 'C5', 'Eb5'], 'Bdim': ['B4', 'D5', 'F5'],
-            
-            # Augmented Chords
-            'Caug': ['C4', 'E4', 'G#4'], 'Daug': ['D4', 'F#4', 'A#4'], 'Eaug': ['E4', 'G#4', 'B#4'],
-            'Faug': ['F4', 'A4', 'C#5'], 'Gaug': ['G4', 'B4', 'D#5'], 'Aaug': ['A4', 'C#5', 'E#5'],
-            
-            # Sus Chords
-            'Csus2': ['C4', 'D4', 'G4'], 'Csus4': ['C4', 'F4', 'G4'],
-            'Dsus2': ['D4', 'E4', 'A4'], 'Dsus4': ['D4', 'G4', 'A4'],
-            'Esus2': ['E4', 'F#4', 'B4'], 'Esus4': ['E4', 'A4', 'B4'],
-            'Fsus2': ['F4', 'G4', 'C5'], 'Fsus4': ['F4', 'Bb4', 'C5'],
-            'Gsus2': ['G4', 'A4', 'D5'], 'Gsus4': ['G4', 'C5', 'D5'],
-            'Asus2': ['A4', 'B4', 'E5'], 'Asus4': ['A4', 'D5', 'E5'],
-            
-            # 9th Chords (dominant 9th)
-            'C9': ['C4', 'E4', 'G4', 'Bb4', 'D5'], 'D9': ['D4', 'F#4', 'A4', 'C5', 'E5'], 
-            'E9': ['E4', 'G#4', 'B4', 'D5', 'F#5'], 'F9': ['F4', 'A4', 'C5', 'Eb5', 'G5'], 
-            'G9': ['G4', 'B4', 'D5', 'F5', 'A5'], 'A9': ['A4', 'C#5', 'E5', 'G5', 'B5'],
-            
-            # Minor 9th Chords
-            'Cm9': ['C4', 'Eb4', 'G4', 'Bb4', 'D5'], 'Dm9': ['D4', 'F4', 'A4', 'C5', 'E5'],
-            'Em9': ['E4', 'G4', 'B4', 'D5', 'F#5'], 'Am9': ['A4', 'C5', 'E5', 'G5', 'B5'],
-            
-            # 6th Chords
-            'C6': ['C4', 'E4', 'G4', 'A4'], 'D6': ['D4', 'F#4', 'A4', 'B4'], 
-            'E6': ['E4', 'G#4', 'B4', 'C#5'], 'F6': ['F4', 'A4', 'C5', 'D5'],
-            'G6': ['G4', 'B4', 'D5', 'E5'], 'A6': ['A4', 'C#5', 'E5', 'F#5'],
-            
-            # Minor 6th Chords
-            'Cm6': ['C4', 'Eb4', 'G4', 'A4'], 'Dm6': ['D4', 'F4', 'A4', 'B4'],
-            'Em6': ['E4', 'G4', 'B4', 'C#5'], 'Am6': ['A4', 'C5', 'E5', 'F#5'],
-            
-            # Add9 Chords (major triad + 9th)
-            'Cadd9': ['C4', 'E4', 'G4', 'D5'], 'Dadd9': ['D4', 'F#4', 'A4', 'E5'],
-            'Eadd9': ['E4', 'G#4', 'B4', 'F#5'], 'Fadd9': ['F4', 'A4', 'C5', 'G5'],
-            'Gadd9': ['G4', 'B4', 'D5', 'A5'], 'Aadd9': ['A4', 'C#5', 'E5', 'B5'],
-            
-            # Power Chords (root + 5th, common in guitar/rock)
-            'C5': ['C3', 'G3', 'C4'], 'D5': ['D3', 'A3', 'D4'], 'E5': ['E3', 'B3', 'E4'],
-            'F5': ['F3', 'C4', 'F4'], 'G5': ['G3', 'D4', 'G4'], 'A5': ['A3', 'E4', 'A4'], 
-            'B5': ['B3', 'F#4', 'B4'],
-            
-            # Single Notes (for melodies)
-            'C3n': ['C3'], 'D3n': ['D3'], 'E3n': ['E3'], 'F3n': ['F3'], 'G3n': ['G3'], 'A3n': ['A3'], 'B3n': ['B3'],
-            'C4n': ['C4'], 'D4n': ['D4'], 'E4n': ['E4'], 'F4n': ['F4'], 'G4n': ['G4'], 'A4n': ['A4'], 'B4n': ['B4'],
-            'C5n': ['C5'], 'D5n': ['D5'], 'E5n': ['E5'], 'F5n': ['F5'], 'G5n': ['G5'], 'A5n': ['A5'], 'B5n': ['B5'],
+        # Optional DiskRenderCache behind it that outlives the session, keyed
+        # on what the audio is made of: notes, instrument, length, rate, tuning
+        self.disk_cache = disk_cache
+        
+        # Tuning reference; notes are MIDI numbers and chords are built from
+        # their names (root, quality, slash bass) by the theory module
+        self.tuning = A4_FREQUENCY
+        
+        # Song seed for the random parts of noisy instruments. Each note draws
+        # from its own generator seeded with this and the note itself, so the
+        # same song renders the same samples every time, in any process
+        self.seed = 0
+        
+        # Harmonic amplitudes for the additive instruments (fundamental first).
+        # Organ drawbars sit at 0.5, 1, 1.5, 2, 3, 4, 5, 6 and 8 times the fundamental
+        self.instrument_harmonics = {
+            'Piano': [1.0, 0.6, 0.4, 0.3, 0.2, 0.15, 0.1, 0.08, 0.05],
+            'Guitar': [1.0, 0.5, 0.35, 0.2, 0.12, 0.08, 0.05],
+            'Strings': [1.0, 0.7, 0.5, 0.35, 0.25, 0.18, 0.12, 0.08, 0.05],
+            'Organ': [0.8, 1.0, 0.6, 0.5, 0.4, 0.3, 0.25, 0.2, 0.15],
+            'Bass': [1.2, 0.9, 0.5, 0.3, 0.15, 0.08],  # Emphasis on low
+            'Flute': [1.0, 0.35, 0.18, 0.1, 0.05],
+            # Odd harmonics slightly stronger (reed characteristic)
+            'Saxophone': [1.0 * 1.15, 0.8, 0.6 * 1.15, 0.5, 0.35 * 1.15, 0.25, 0.18 * 1.15, 0.12],
+            # Upper harmonics stronger for brightness
+            'Trumpet': [1.0, 0.7, 0.6, 0.5 * 1.1, 0.4 * 1.1, 0.35 * 1.1, 0.3 * 1.1, 0.25 * 1.1, 0.2 * 1.1],
+            'Trombone': [1.0, 0.75, 0.55, 0.4, 0.28, 0.18, 0.12],
+            'Violin': [1.0, 0.7, 0.5, 0.4, 0.3, 0.22, 0.16, 0.12, 0.08],
+            # Lower harmonics stronger for warmth
+            'Cello': [1.0 * 1.1, 0.8 * 1.1, 0.6 * 1.1, 0.45, 0.32, 0.22, 0.15, 0.1],
         }
         
+        # Sustained instruments play from precomputed single-cycle tables
+        self.wavetables = WavetableBank()
+        self.wavetable_instruments = {'Organ', 'Strings', 'Violin', 'Cello', 'Flute', 'Saxophone'}
+        
         # Current instrument
         self.current_instrument = 'Piano'
     
@@ -118,235 +88,291 @@ class ChordGenerator:
         self.current_instrument = instrument_name
     
     def generate_tone(self, frequency, duration=1.0, volume=0.3, instrument='Piano'):
-        """Generate a high-quality tone with advanced synthesis"""
+        """Generate a high-quality tone as stereo float32 at 16-bit scale"""
+        wave = self._synthesize_notes([frequency], duration, volume, instrument)[0]
+        
+        # Make stereo with slight stereo widening
+        left = wave
+        right = wave
+        stereo_wave = np.column_stack((left, right))
+        
+        return stereo_wave
+    
+    def _synthesize_notes(self, frequencies, duration=1.0, volume=0.3, instrument='Piano'):
+        """Synthesize several notes at once as a (notes, samples) float32 array
+        
+        All notes share one time base, envelope and modulation curves, and the
+        harmonic series of every note is evaluated in the same array operation.
+        """
+        freqs = np.asarray(frequencies, dtype=np.float64)
         num_samples = int(self.sample_rate * duration)
+        # Shared by every note. Kept in double precision, as it is only one row
+        # and phases of long notes are taken from it
         t = np.linspace(0, duration, num_samples, False)
+        rngs = self._note_rngs(freqs, instrument, num_samples) if instrument in NOISY_INSTRUMENTS else []
         
-        # Anti-aliasing: band-limit harmonics to prevent aliasing
-        nyquist = self.sample_rate / 2
-        max_harmonic = int(nyquist / frequency) - 1
+        # Only the raw wave outlives the instrument's own temporaries
+        wave = self._instrument_wave(freqs, t, duration, instrument, rngs)
+        
+        # Apply envelope (ADSR - instrument specific), volume and the 16-bit scale
+        # in one pass; the instrument levels keep peaks near 0.8 * volume
+        envelope = self.create_envelope(num_samples, instrument)
+        wave *= envelope * (volume * FULL_SCALE)
+        
+        # Apply gentle low-pass filter to remove harsh high frequencies
+        return self.apply_lowpass(wave)
+    
+    def _instrument_wave(self, freqs, t, duration, instrument, rngs):
+        """The instrument's (notes, samples) float32 wave, before envelope and filtering"""
+        num_samples = len(t)
         
         # Generate wave based on instrument type with high-quality synthesis
         if instrument == 'Piano':
             # Piano with inharmonicity and complex decay
-            wave = np.zeros(num_samples)
-            harmonics = [1.0, 0.6, 0.4, 0.3, 0.2, 0.15, 0.1, 0.08, 0.05]
-            for i, amp in enumerate(harmonics[:min(len(harmonics), max_harmonic)]):
-                h = i + 1
-                # Add slight inharmonicity for realistic piano sound
-                inharm = 1 + 0.0001 * h * h
-                decay = np.exp(-3 * h * t / duration)  # Different decay per harmonic
-                wave += amp * np.sin(2 * np.pi * frequency * h * inharm * t) * decay
-            wave = wave / 2.5
+            h = np.arange(1, 10)
+            inharm = 1 + 0.0001 * h * h  # Slight inharmonicity for realistic piano sound
+            decay = lambda tt: np.exp(-3 * h[:, np.newaxis] * tt / duration)  # Different decay per harmonic
+            wave = self._partial_sum(freqs[:, np.newaxis] * h * inharm,
+                                     self._band_limited_amplitudes(freqs, instrument), t, decay)
+            wave /= 2.5
             
         elif instrument == 'Guitar':
             # High-quality guitar with realistic pluck and body resonance
-            wave = np.zeros(num_samples)
-            harmonics = [1.0, 0.5, 0.35, 0.2, 0.12, 0.08, 0.05]
-            for i, amp in enumerate(harmonics[:min(len(harmonics), max_harmonic)]):
-                h = i + 1
-                # Exponential decay per harmonic (higher harmonics decay faster)
-                decay = np.exp(-2.5 * h * t / duration)
-                phase = np.random.uniform(0, 0.1)  # Slight random phase for realism
-                wave += amp * np.sin(2 * np.pi * frequency * h * t + phase) * decay
+            h = np.arange(1, 8)
+            # Exponential decay per harmonic (higher harmonics decay faster)
+            decay = lambda tt: np.exp(-2.5 * h[:, np.newaxis] * tt / duration)
+            phases = _draw(rngs, 'uniform', 0, 0.1, len(h))  # Slight random phase for realism
+            wave = self._partial_sum(freqs[:, np.newaxis] * h,
+                                     self._band_limited_amplitudes(freqs, instrument), t, decay, phases)
             # Add body resonance
             resonance = 0.02 * np.sin(2 * np.pi * 100 * t) * np.exp(-8 * t / duration)
-            wave = (wave + resonance) / 1.9
+            wave += resonance
+            wave /= 1.9
             
         elif instrument == 'Strings':
             # Smooth orchestral strings with rich overtones
-            wave = np.zeros(num_samples)
-            harmonics = [1.0, 0.7, 0.5, 0.35, 0.25, 0.18, 0.12, 0.08, 0.05]
-            for i, amp in enumerate(harmonics[:min(len(harmonics), max_harmonic)]):
-                h = i + 1
-                wave += amp * np.sin(2 * np.pi * frequency * h * t)
+            wave = self._wavetable_oscillator(freqs, t, instrument)
             # Enhanced vibrato for warmth
             vibrato_freq = 5.5 + 0.5 * np.sin(2 * np.pi * 0.2 * t)  # Variable vibrato
             vibrato = 1 + 0.008 * np.sin(2 * np.pi * vibrato_freq * t)
-            wave = wave * vibrato / 3.0
+            wave *= vibrato / 3.0
             
         elif instrument == 'Organ':
-            # Hammond-style organ with drawbar harmonics
-            wave = np.zeros(num_samples)
-            drawbars = [0.8, 1.0, 0.6, 0.5, 0.4, 0.3, 0.25, 0.2, 0.15]  # Drawbar settings
-            drawbar_harmonics = [0.5, 1, 1.5, 2, 3, 4, 5, 6, 8]  # Sub-octave to high harmonics
-            for amp, h in zip(drawbars[:min(len(drawbars), max_harmonic)], drawbar_harmonics):
-                wave += amp * np.sin(2 * np.pi * frequency * h * t)
+            # Hammond-style organ with drawbar harmonics, sub-octave to high harmonics.
+            # Drawbars sit on multiples of half the fundamental, so the table's
+            # fundamental is the sub-octave
+            wave = self._wavetable_oscillator(freqs / 2, t, instrument, freqs)
             # Add slight Leslie effect (rotary speaker)
             tremolo = 1 + 0.03 * np.sin(2 * np.pi * 6 * t)
-            wave = wave * tremolo / 3.5
+            wave *= tremolo / 3.5
             
         elif instrument == 'Synth':
             # Analog synthesizer with PWM and filter
             # Create pulse width modulation
             pwm = 0.5 + 0.3 * np.sin(2 * np.pi * 0.5 * t)
-            wave = signal.square(2 * np.pi * frequency * t, duty=pwm)
+            cycles = self._cycles(freqs, t)
+            # Square wave: high for the first pwm fraction of every cycle
+            wave = np.where(cycles < pwm, np.float32(1), np.float32(-1))
             # Add harmonics
-            wave += 0.4 * np.sin(2 * np.pi * frequency * 2 * t)
-            wave += 0.25 * np.sin(2 * np.pi * frequency * 3 * t)
+            wave += self._harmonic_series(cycles, np.array([[0.0, 0.4, 0.25]]))
             # Low-pass filter sweep
             cutoff_sweep = 0.3 + 0.7 * np.exp(-4 * t / duration)
-            wave = wave * cutoff_sweep / 2.0
+            wave *= cutoff_sweep / 2.0
             
         elif instrument == 'Bass':
             # Electric bass with strong fundamental and sub-bass
-            wave = np.zeros(num_samples)
-            harmonics = [1.2, 0.9, 0.5, 0.3, 0.15, 0.08]  # Emphasis on low
-            for i, amp in enumerate(harmonics[:min(len(harmonics), max_harmonic)]):
-                h = i + 1
-                wave += amp * np.sin(2 * np.pi * frequency * h * t)
+            wave = self._harmonic_series(self._cycles(freqs, t),
+                                         self._band_limited_amplitudes(freqs, instrument))
             # Add subtle attack click for pick sound
-            click = 0.1 * np.exp(-50 * t) * np.random.normal(0, 1, num_samples)
-            wave = (wave + click) / 2.6
+            click = _draw(rngs, 'normal', 0, 1, num_samples, np.float32)
+            click *= 0.1 * np.exp(-50 * t)
+            wave += click
+            wave /= 2.6
             
         elif instrument == 'Flute':
             # Flute - airy with filtered noise for breath
-            wave = np.zeros(num_samples)
-            harmonics = [1.0, 0.35, 0.18, 0.1, 0.05]
-            for i, amp in enumerate(harmonics[:min(len(harmonics), max_harmonic)]):
-                h = i + 1
-                wave += amp * np.sin(2 * np.pi * frequency * h * t)
+            wave = self._wavetable_oscillator(freqs, t, instrument)
             # Enhanced vibrato
             vibrato_depth = 0.01 * (1 + 0.3 * t / duration)  # Growing vibrato
             vibrato = 1 + vibrato_depth * np.sin(2 * np.pi * 5.5 * t)
-            wave = wave * vibrato
+            wave *= vibrato
             # Breath noise through band-pass filter
-            noise = np.random.normal(0, 0.04, len(t))
-            # Simple band-pass (frequency range for breath)
-            breath = noise * np.sin(2 * np.pi * frequency * 0.5 * t) * 0.3
-            wave = (wave + breath) / 1.7
+            noise = _draw(rngs, 'normal', 0, 0.04, num_samples, np.float32)
+            # Simple band-pass (frequency range for breath), at half the fundamental
+            band = self._cycles(freqs / 2, t)
+            band *= np.float32(2 * np.pi)
+            noise *= np.sin(band, out=band)
+            noise *= 0.3
+            wave += noise
+            wave /= 1.7
             
         elif instrument == 'Saxophone':
             # Saxophone - reedy with odd/even harmonic balance
-            wave = np.zeros(num_samples)
-            # Odd and even harmonics for reed character
-            harmonics = [1.0, 0.8, 0.6, 0.5, 0.35, 0.25, 0.18, 0.12]
-            for i, amp in enumerate(harmonics[:min(len(harmonics), max_harmonic)]):
-                h = i + 1
-                # Odd harmonics slightly stronger (reed characteristic)
-                if h % 2 == 1:
-                    amp *= 1.15
-                wave += amp * np.sin(2 * np.pi * frequency * h * t)
+            wave = self._wavetable_oscillator(freqs, t, instrument)
             # Expressive vibrato with depth variation
             vib_depth = 0.015 * (1 + 0.2 * np.sin(2 * np.pi * 0.3 * t))
             vibrato = 1 + vib_depth * np.sin(2 * np.pi * 6 * t)
-            wave = wave * vibrato / 3.5
+            wave *= vibrato / 3.5
             
         elif instrument == 'Trumpet':
             # Trumpet - bright brass with strong upper harmonics
-            wave = np.zeros(num_samples)
-            harmonics = [1.0, 0.7, 0.6, 0.5, 0.4, 0.35, 0.3, 0.25, 0.2]
-            for i, amp in enumerate(harmonics[:min(len(harmonics), max_harmonic)]):
-                h = i + 1
-                # Upper harmonics stronger for brightness
-                if h > 3:
-                    amp *= 1.1
-                wave += amp * np.sin(2 * np.pi * frequency * h * t)
+            wave = self._harmonic_series(self._cycles(freqs, t),
+                                         self._band_limited_amplitudes(freqs, instrument))
             # Sharp attack with overshoot
             attack = np.minimum(1.0, t * 80)
             overshoot = 1 + 0.2 * np.exp(-15 * t)
-            wave = wave * attack * overshoot / 3.5
+            wave *= attack * overshoot / 3.5
             
         elif instrument == 'Trombone':
             # Trombone - warm, mellow brass with slide
-            wave = np.zeros(num_samples)
-            harmonics = [1.0, 0.75, 0.55, 0.4, 0.28, 0.18, 0.12]
-            for i, amp in enumerate(harmonics[:min(len(harmonics), max_harmonic)]):
-                h = i + 1
-                wave += amp * np.sin(2 * np.pi * frequency * h * t)
+            wave = self._harmonic_series(self._cycles(freqs, t),
+                                         self._band_limited_amplitudes(freqs, instrument))
             # Portamento/slide effect at start
             slide_time = min(0.05, duration * 0.15)
             slide_mask = t < slide_time
             slide_bend = np.where(slide_mask, 
                                  1 - 0.05 * (1 - t / slide_time), 1)
-            wave = wave * slide_bend / 3.0
+            wave *= slide_bend / 3.0
             
         elif instrument == 'Violin':
             # Violin - rich harmonics with bow pressure simulation
-            wave = np.zeros(num_samples)
-            harmonics = [1.0, 0.7, 0.5, 0.4, 0.3, 0.22, 0.16, 0.12, 0.08]
-            for i, amp in enumerate(harmonics[:min(len(harmonics), max_harmonic)]):
-                h = i + 1
-                # Add slight detuning for chorus effect
-                detune = 1 + np.random.uniform(-0.001, 0.001)
-                wave += amp * np.sin(2 * np.pi * frequency * h * detune * t)
+            # Add slight detuning for chorus effect: two table voices per note
+            detune = 1 + _draw(rngs, 'uniform', -0.001, 0.001, 2).T
+            wave = (self._wavetable_oscillator(freqs * detune[0], t, instrument, freqs) +
+                    self._wavetable_oscillator(freqs * detune[1], t, instrument, freqs)) / 2
             # Realistic vibrato with depth crescendo
             vib_depth = 0.012 * np.minimum(1.0, t * 3)  # Vibrato grows
             vib_rate = 6 + 0.5 * np.sin(2 * np.pi * 0.2 * t)  # Variable rate
             vibrato = 1 + vib_depth * np.sin(2 * np.pi * vib_rate * t)
-            wave = wave * vibrato / 3.2
+            wave *= vibrato / 3.2
             
         elif instrument == 'Cello':
             # Cello - deep, resonant with body formants
-            wave = np.zeros(num_samples)
-            harmonics = [1.0, 0.8, 0.6, 0.45, 0.32, 0.22, 0.15, 0.1]
-            for i, amp in enumerate(harmonics[:min(len(harmonics), max_harmonic)]):
-                h = i + 1
-                # Lower harmonics stronger for warmth
-                if h <= 3:
-                    amp *= 1.1
-                wave += amp * np.sin(2 * np.pi * frequency * h * t)
+            wave = self._wavetable_oscillator(freqs, t, instrument)
             # Subtle vibrato (less than violin)
             vibrato = 1 + 0.009 * np.sin(2 * np.pi * 5.2 * t)
-            wave = wave * vibrato
+            wave *= vibrato
             # Body resonance (formant around 200-300Hz)
             resonance = 0.08 * np.sin(2 * np.pi * 250 * t) * np.exp(-3 * t / duration)
-            wave = (wave + resonance) / 3.3
+            wave += resonance
+            wave /= 3.3
             
         else:
             # Default to piano
-            wave = np.sin(2 * np.pi * frequency * t)
-            wave += 0.5 * np.sin(2 * np.pi * frequency * 2 * t)
-            wave += 0.3 * np.sin(2 * np.pi * frequency * 3 * t)
-            wave = wave / 1.8
+            wave = self._harmonic_series(self._cycles(freqs, t), np.array([[1.0, 0.5, 0.3]]))
+            wave /= 1.8
         
-        # Apply envelope (ADSR - instrument specific)
-        envelope = self.create_envelope(num_samples, instrument)
-        wave = wave * envelope * volume
+        return wave
+    
+    def _note_rngs(self, freqs, instrument, num_samples):
+        """A random generator per note, seeded from the seed, the note and its length
         
-        # Add subtle reverb for depth (simple comb filter)
-        wave = self.add_reverb(wave, duration)
+        A note draws the same numbers whatever chord or batch it is rendered
+        in, so cached, batched and parallel renders all agree.
+        """
+        instrument_id = zlib.crc32(instrument.encode())
+        return [np.random.default_rng([self.seed, instrument_id, num_samples, *bits])
+                for bits in freqs.view(np.uint32).reshape(-1, 2).tolist()]
+    
+    def _band_limited_amplitudes(self, frequencies, instrument):
+        """Return (notes, harmonics) amplitudes with harmonics above Nyquist zeroed"""
+        amplitudes = np.asarray(self.instrument_harmonics[instrument], dtype=np.float64)
         
-        # Apply gentle low-pass filter to remove harsh high frequencies
-        wave = self.apply_lowpass(wave)
+        # Anti-aliasing: band-limit harmonics to prevent aliasing
+        nyquist = self.sample_rate / 2
+        max_harmonic = (nyquist / frequencies).astype(int) - 1
+        
+        if instrument == 'Organ':
+            # Drawbars are indexed on half-fundamental multiples, but the
+            # band limit counts drawbars in order
+            positions = np.array([1, 2, 3, 4, 6, 8, 10, 12, 16]) - 1
+            kept = np.arange(len(amplitudes)) < max_harmonic[:, np.newaxis]
+            dense = np.zeros((len(frequencies), positions[-1] + 1))
+            dense[:, positions] = amplitudes * kept
+            return dense
         
-        # Normalize to prevent clipping
-        if np.max(np.abs(wave)) > 0:
-            wave = wave / np.max(np.abs(wave)) * 0.9
+        kept = np.arange(len(amplitudes)) < max_harmonic[:, np.newaxis]
+        return amplitudes * kept
+    
+    def _wavetable_oscillator(self, table_freqs, t, instrument, note_freqs=None):
+        """Play each note from its band-limited wavetable, as a (notes, samples) array
         
-        # Convert to 16-bit integers
-        wave = (wave * 32767).astype(np.int16)
+        table_freqs is the frequency of each table's fundamental; note_freqs
+        (defaults to the same) decides which harmonics survive band-limiting.
+        The cost per sample does not depend on how many harmonics there are.
+        """
+        if note_freqs is None:
+            note_freqs = table_freqs
+        amplitudes = self._band_limited_amplitudes(note_freqs, instrument)
         
-        # Make stereo with slight stereo widening
-        left = wave
-        right = wave
-        stereo_wave = np.column_stack((left, right))
+        wave = np.empty((len(table_freqs), len(t)), dtype=np.float32)
+        for i, freq in enumerate(table_freqs):
+            table = self.wavetables.table(instrument, amplitudes[i])
+            wave[i] = self.wavetables.lookup(table, freq, t)
+        return wave
+    
+    def _cycles(self, freqs, t, block_size=4096):
+        """Phase of each note in cycles, wrapped to [0, 1), as a (notes, samples) float32 array
         
-        return stereo_wave
+        Worked out a block at a time in double precision, so long notes stay
+        accurate without ever holding a (notes, samples) float64 array.
+        """
+        cycles = np.empty((len(freqs), len(t)), dtype=np.float32)
+        for start in range(0, len(t), block_size):
+            block = freqs[:, np.newaxis] * t[start:start + block_size]
+            block -= np.floor(block)
+            cycles[:, start:start + block_size] = block
+        return cycles
     
-    def add_reverb(self, wave, duration):
-        """Add simple reverb using comb filtering"""
-        # Short reverb for natural room sound
-        delay_samples = int(self.sample_rate * 0.03)  # 30ms delay
-        reverb = np.zeros_like(wave)
-        
-        if len(wave) > delay_samples:
-            reverb[delay_samples:] = wave[:-delay_samples] * 0.15
-            # Add second reflection
-            delay2 = int(self.sample_rate * 0.047)
-            if len(wave) > delay2:
-                reverb[delay2:] += wave[:-delay2] * 0.08
-        
-        return wave + reverb
+    def _harmonic_series(self, cycles, amplitudes, block_size=4096):
+        """Sum amplitudes[:, k] * sin(2 * pi * (k + 1) * cycles) for every note
+        
+        Uses Clenshaw's recurrence, so only one sin/cos pair is evaluated per
+        sample; each further harmonic costs a multiply-add, done in float32
+        which is far below 16-bit resolution. cycles is the fundamental's
+        wrapped phase from _cycles(), (notes, samples), and amplitudes is
+        (notes, harmonics).
+        """
+        wave = np.empty(cycles.shape, dtype=np.float32)
+        for start in range(0, cycles.shape[1], block_size):
+            block = cycles[:, start:start + block_size] * np.float32(2 * np.pi)
+            two_cos = 2 * np.cos(block)
+            b1 = np.zeros_like(block)
+            b2 = np.zeros_like(block)
+            for k in range(amplitudes.shape[1] - 1, -1, -1):
+                b0 = two_cos * b1
+                b0 -= b2
+                b0 += np.float32(amplitudes[:, k, np.newaxis])
+                b1, b2 = b0, b1
+            np.multiply(np.sin(block), b1, out=wave[:, start:start + block_size])
+        return wave
+    
+    def _partial_sum(self, partials, amplitudes, t, decay=None, phases=0.0, block_size=4096):
+        """Sum inharmonic partials as one (notes, partials, samples) array operation
+        
+        partials holds the frequency of every partial per note, decay (if
+        given) maps a block of times to (partials, samples) gains.
+        """
+        partials = partials[:, :, np.newaxis]
+        phases = (np.broadcast_to(phases, partials.shape[:2]) / (2 * np.pi))[:, :, np.newaxis]
+        wave = np.empty((len(partials), len(t)), dtype=np.float32)
+        for start in range(0, len(t), block_size):
+            tt = t[start:start + block_size]
+            # Phase in cycles, wrapped to [0, 1) so the sines can run in
+            # single precision
+            cycles = partials * tt + phases
+            cycles -= np.floor(cycles)
+            sines = np.sin(cycles.astype(np.float32) * np.float32(2 * np.pi))
+            if decay is not None:
+                sines *= decay(tt).astype(np.float32)
+            wave[:, start:start + block_size] = np.einsum('npt,np->nt', sines, amplitudes)
+        return wave
     
     def apply_lowpass(self, wave):
         """Apply gentle low-pass filter to smooth the sound"""
-        # Simple moving average for smoothing
-        window_size = 3
-        kernel = np.ones(window_size) / window_size
-        filtered = np.convolve(wave, kernel, mode='same')
-        # Mix with original for subtle effect
-        return 0.7 * wave + 0.3 * filtered
+        # Centred 3-tap smoothing (0.1, 0.8, 0.1) along the last (time) axis,
+        # so a whole (notes, samples) batch is filtered at once
+        return smoothing_filter().run(wave.T).T
     
     def create_envelope(self, num_samples, instrument='Piano'):
         """Create an ADSR envelope for more natural sound based on instrument"""
@@ -418,7 +444,7 @@ class ChordGenerator:
             sustain_level = 0.6
             release = int(num_samples * 0.4)
         
-        envelope = np.ones(num_samples)
+        envelope = np.ones(num_samples, dtype=np.float32)
         
         # Attack - exponential curve for natural sound
         if attack > 0:
@@ -439,66 +465,133 @@ class ChordGenerator:
         
         return envelope
     
-    def generate_chord(self, chord_name, duration=0.8, instrument='Piano'):
-        """Generate a chord sound by combining multiple notes"""
-        if chord_name not in self.chord_notes:
-            # Default to C major if chord not found
-            chord_name = 'C'
-        
-        notes = self.chord_notes[chord_name]
-        
-        # Generate each note in the chord
-        chord_waves = []
-        for note in notes:
-            if note in self.note_frequencies:
-                freq = self.note_frequencies[note]
-                wave = self.generate_tone(freq, duration, volume=0.25, instrument=instrument)
-                chord_waves.append(wave)
-        
-        # Mix all notes together
-        if chord_waves:
-            mixed = np.sum(chord_waves, axis=0)
-            
-            # Add simple reverb effect
-            mixed = self.add_reverb(mixed)
+    def render_chord(self, chord_name, duration=0.8, instrument='Piano', out=None):
+        """Render a chord to a stereo float32 array at 16-bit scale, reusing cached buffers
+        
+        The array returned may be the cached one, which is read-only. Pass
+        out, a (samples, 2) float32 array, to have the render written there.
+        """
+        if out is not None:
+            return self.render_chords([chord_name], duration, instrument, out[np.newaxis])[0]
+        return self.render_chords([chord_name], duration, instrument)[0]
+    
+    def render_chords(self, chord_names, duration=0.8, instrument='Piano', out=None):
+        """Render several chords of the same length, e.g. blocks that start together
+        
+        Every note of every uncached chord is synthesized in a single batch.
+        Returns a list of (possibly cached, read-only) arrays; with out, a
+        (chords, samples, 2) float32 array, fills that and returns it.
+        Rendering never needs pygame or an audio device.
+        """
+        num_samples = int(self.sample_rate * duration)
+        keys = self._cache_keys(chord_names, instrument, num_samples)
+        
+        rendered = {key: self.cache.get(key) for key in dict.fromkeys(keys)}
+        missing = [key for key, mixed in rendered.items() if mixed is None]
+        chord_midi = {key: parse_chord(key[0]) for key in missing}
+        
+        if missing and self.disk_cache is not None:
+            for key in missing:
+                mixed = self.disk_cache.get(self._disk_key(chord_midi[key], instrument, num_samples))
+                if mixed is not None:
+                    rendered[key] = self.cache.put(key, mixed)
+            missing = [key for key in missing if rendered[key] is None]
+        
+        if missing:
+            # Build the notes of every missing chord, then turn all of them
+            # into frequencies and synthesize them together
+            all_freqs = midi_to_frequency(np.concatenate([chord_midi[key] for key in missing]),
+                                          self.tuning)
+            notes = self._synthesize_notes(all_freqs, duration, NOTE_VOLUME, instrument)
             
-            # Normalize to prevent clipping with headroom
-            max_val = np.max(np.abs(mixed))
-            if max_val > 0:
-                mixed = mixed * (28000 / max_val)  # Leave headroom
-            mixed = mixed.astype(np.int16)
+            start = 0
+            for key in missing:
+                count = len(chord_midi[key])
+                mixed = self._mix_chord(notes[start:start + count],
+                                        np.empty((num_samples, 2), dtype=np.float32))
+                rendered[key] = self.cache.put(key, mixed)
+                if self.disk_cache is not None:
+                    self.disk_cache.put(self._disk_key(chord_midi[key], instrument, num_samples), mixed)
+                start += count
+        
+        if out is not None:
+            for i, key in enumerate(keys):
+                out[i] = rendered[key]
+            return out
+        return [rendered[key] for key in keys]
+    
+    def cached_chords(self, chord_names, duration=0.8, instrument='Piano'):
+        """The memory-cached renders of chords, None for any not in the cache
+        
+        Nothing is rendered, so a caller can hand only the misses to another
+        process and keep the results with cache_chord().
+        """
+        keys = self._cache_keys(chord_names, instrument, int(self.sample_rate * duration))
+        return [self.cache.get(key) for key in keys]
+    
+    def cache_chord(self, chord_name, duration, instrument, mixed):
+        """Keep a chord rendered elsewhere in the memory cache; returns the cached array"""
+        key, = self._cache_keys([chord_name], instrument, int(self.sample_rate * duration))
+        return self.cache.put(key, mixed)
+    
+    def _cache_keys(self, chord_names, instrument, num_samples):
+        """Memory cache keys of chords rendered with the generator's current settings"""
+        # Only noisy instruments depend on the seed; the rest are shared by every song
+        seed = self.seed if instrument in NOISY_INSTRUMENTS else None
+        # Default to C major if chord not found
+        return [(name if self.is_chord(name) else 'C', instrument, num_samples, self.sample_rate, seed,
+                 float(self.tuning))
+                for name in chord_names]
+    
+    def _disk_key(self, midi, instrument, num_samples):
+        """On-disk cache key: chords with the same notes share an entry"""
+        key = (tuple(int(note) for note in midi), instrument, num_samples, self.sample_rate,
+               float(self.tuning), SYNTHESIS_VERSION)
+        if instrument in NOISY_INSTRUMENTS:
+            key += (self.seed,)
+        return key
+    
+    def _mix_chord(self, notes, out):
+        """Mix a (notes, samples) block of synthesized notes into out, a (samples, 2) array"""
+        # Mix all notes together, straight into the left channel
+        if len(notes):
+            np.sum(notes, axis=0, out=out[:, 0])
+            out[:, 0] /= len(notes)
+            out[:, 1] = out[:, 0]
         else:
             # Fallback to silence
-            mixed = np.zeros((int(self.sample_rate * duration), 2), dtype=np.int16)
+            out[:] = 0
         
-        # Convert to pygame Sound
-        sound = pygame.sndarray.make_sound(mixed)
-        return sound
+        return out
     
-    def add_reverb(self, audio, wet=0.15):
-        """Add simple reverb effect for depth"""
-        delay_samples = int(0.05 * self.sample_rate)  # 50ms delay
-        reverb = np.zeros_like(audio, dtype=np.float32)
-        reverb[:] = audio
-        
-        # Add delayed copies with decay
-        if len(audio) > delay_samples:
-            reverb[delay_samples:] += audio[:-delay_samples] * 0.3
-        
-        delay2 = int(0.08 * self.sample_rate)  # 80ms delay
-        if len(audio) > delay2:
-            reverb[delay2:] += audio[:-delay2] * 0.15
-        
-        # Mix dry and wet signals
-        output = audio * (1 - wet) + reverb * wet
-        return output
+    def is_chord(self, chord_name):
+        """True if the name is a chord symbol or single note the generator can build"""
+        try:
+            parse_chord(chord_name)
+        except (ValueError, KeyError):
+            return False
+        return True
     
-    def generate_melody_note(self, note_name, duration=0.5):
-        """Generate a single melody note"""
-        if note_name not in self.note_frequencies:
-            return None
-        
-        freq = self.note_frequencies[note_name]
-        wave = self.generate_tone(freq, duration, volume=0.4)
-        sound = pygame.sndarray.make_sound(wave)
-        return sound
+    def note_frequency(self, note_name):
+        """Frequency in Hz of a note name like 'A4' or 'C#5'"""
+        return float(midi_to_frequency(note_to_midi(note_name), self.tuning))
+    
+    def invalidate_cache(self, chord_name=None, instrument=None):
+        """Forget cached renders for a chord and/or instrument (everything if both are None)"""
+        if chord_name is None and instrument is None:
+            return self.cache.invalidate()
+        return self.cache.invalidate(
+            lambda key: (chord_name is None or key[0] == chord_name) and
+                        (instrument is None or key[1] == instrument))
+
+
+def _draw(rngs, distribution, low, high, size, dtype=np.float64):
+    """(notes, size) array with one row drawn from each note's generator
+
+    Per-sample noise is asked for in float32, parameters such as detune
+    keep double precision.
+    """
+    rows = np.empty((len(rngs), size), dtype=dtype)
+    for row, rng in zip(rows, rngs):
+        row[:] = getattr(rng, distribution)(low, high, size)
+    return rows
@@ -0,0 +1,371 @@
+"""
+DSP - Audio processors that work on a stream of blocks
+
+Every processor takes blocks of any length with time along the first axis,
+(samples,) or (samples, channels...), and carries whatever it needs between
+calls, so feeding a signal in chunks gives exactly the same samples as
+feeding it in one piece.
+"""
+
+import numpy as np
+from scipy.io import wavfile
+from scipy.ndimage import minimum_filter1d
+from scipy.signal import lfilter
+
+from resample import resample
+
+# Built-in rooms for ConvolutionReverb.preset(): reverb time to -60 dB and
+# pre-delay in seconds, brightness as a low-pass cutoff in Hz, early
+# reflections as (delay in seconds, gain) and the wet level it sounds right at
+REVERB_PRESETS = {
+    'Room': {'decay': 0.6, 'predelay': 0.004, 'brightness': 7000,
+             'early': [(0.011, 0.5), (0.019, 0.35), (0.030, 0.25)], 'wet': 0.25},
+    'Hall': {'decay': 2.2, 'predelay': 0.020, 'brightness': 4500,
+             'early': [(0.031, 0.4), (0.047, 0.3), (0.063, 0.25), (0.083, 0.2)], 'wet': 0.2},
+    'Plate': {'decay': 1.4, 'predelay': 0.0, 'brightness': 10000,
+              'early': [], 'wet': 0.18},
+}
+
+
+class Processor:
+    """Base class of the block processors
+
+    latency is how many samples the output lags the input, tail how long
+    the output keeps ringing after the input stops. After the last block,
+    flush() returns both. run() processes a whole buffer in one go and
+    returns it lined up with its input and cut to the same length.
+    """
+
+    latency = 0
+    tail = 0
+
+    def __init__(self):
+        self._shape = None  # Channel shape of the blocks seen since the last reset
+        self._dtype = None  # And their dtype, which flush() feeds zeros in
+
+    def reset(self):
+        """Forget the signal so far, as if nothing had been processed"""
+        self._shape = None
+        self._dtype = None
+
+    def process(self, block):
+        """Process the next block; returns a block of the same length"""
+        raise NotImplementedError
+
+    def flush(self):
+        """Return the output still inside the processor once the input has ended"""
+        if self._shape is None:
+            return np.zeros((0,))
+        return self.process(np.zeros((self.latency + self.tail,) + self._shape, dtype=self._dtype))
+
+    def run(self, audio, tail=False):
+        """Process a whole buffer from a clean state, without the latency
+
+        The output has the length of the input, plus the tail if asked for.
+        """
+        self.reset()
+        output = self.process(audio)
+        if tail:
+            output = np.concatenate((output, self.flush()))[self.latency:]
+        elif self.latency:
+            ending = self.process(np.zeros((self.latency,) + audio.shape[1:], dtype=audio.dtype))
+            if len(output) < self.latency or np.shares_memory(output, audio):
+                output = np.concatenate((output, ending))[self.latency:]
+            else:
+                # Shift in place rather than building a second whole-length
+                # copy, a step at a time as overlapping copies are buffered
+                kept = len(output) - self.latency
+                for start in range(0, kept, 65536):
+                    stop = min(start + 65536, kept)
+                    output[start:stop] = output[start + self.latency:stop + self.latency]
+                output[kept:] = ending
+        self.reset()
+        return output
+
+    def _track(self, block):
+        """Remember the channel shape the state was built for"""
+        if self._shape is None:
+            self._shape = block.shape[1:]
+            self._dtype = block.dtype
+            return True
+        if block.shape[1:] != self._shape:
+            raise ValueError(f"block has channels {block.shape[1:]}, expected {self._shape}")
+        return False
+
+
+class FIRFilter(Processor):
+    """Finite impulse response filter with the given taps
+
+    The last len(taps) - 1 input samples are kept between blocks. A
+    non-causal filter is centred by giving its delay as latency. Long blocks
+    are filtered block_size samples at a time, so the only whole-length
+    array made is the output.
+    """
+
+    block_size = 16384
+
+    def __init__(self, taps, latency=0):
+        super().__init__()
+        self.taps = np.asarray(taps, dtype=np.float64)
+        self.latency = latency
+        self.tail = len(self.taps) - 1 - latency
+        self._history = None
+
+    def reset(self):
+        super().reset()
+        self._history = None
+
+    def process(self, block):
+        dtype = np.result_type(block, np.float32)  # float32 audio stays float32
+        if self._track(block):
+            self._history = np.zeros((len(self.taps) - 1,) + block.shape[1:], dtype=dtype)
+        order = len(self._history)
+        taps = self.taps.astype(dtype)
+        output = np.zeros(block.shape, dtype=dtype)
+        for start in range(0, len(block), self.block_size):
+            buffered = np.concatenate((self._history, block[start:start + self.block_size]))
+            piece = output[start:start + self.block_size]
+            for delay, tap in enumerate(taps):
+                piece += buffered[order - delay:len(buffered) - delay] * tap
+            self._history = buffered[len(buffered) - order:]
+        return output
+
+
+class IIRFilter(Processor):
+    """Recursive filter with numerator b and denominator a, run by lfilter
+
+    The filter state (lfilter's zi) is carried from block to block in double
+    precision; float32 blocks come out as float32. The filter never quite
+    stops ringing, so flush() has nothing to add.
+    """
+
+    def __init__(self, b, a):
+        super().__init__()
+        self.b = np.asarray(b, dtype=np.float64)
+        self.a = np.asarray(a, dtype=np.float64)
+        self._zi = None
+
+    @classmethod
+    def lowpass(cls, cutoff, sample_rate, q=0.7071):
+        """Second-order (biquad) low-pass, from the Audio EQ Cookbook"""
+        cos_w, alpha = _biquad_terms(cutoff, sample_rate, q)
+        b = [(1 - cos_w) / 2, 1 - cos_w, (1 - cos_w) / 2]
+        return cls(b, [1 + alpha, -2 * cos_w, 1 - alpha])
+
+    def reset(self):
+        super().reset()
+        self._zi = None
+
+    def process(self, block):
+        if self._track(block):
+            order = max(len(self.a), len(self.b)) - 1
+            self._zi = np.zeros((order,) + block.shape[1:])
+        dtype = np.result_type(block, np.float32)
+        if len(block) == 0:
+            return np.zeros(block.shape, dtype=dtype)
+        output, self._zi = lfilter(self.b, self.a, block, axis=0, zi=self._zi)
+        return output.astype(dtype, copy=False)
+
+
+class ConvolutionReverb(Processor):
+    """Dry signal plus wet times the signal convolved with an impulse response
+
+    Uniformly partitioned overlap-save convolution: the impulse response is
+    cut into partition-sized pieces, and each partition of input is
+    transformed once and multiplied with the spectra of all the pieces, so
+    the cost per sample depends on the response length over the partition
+    size, not on the number of notes. Input is gathered into whole
+    partitions, so the output lags by one partition. A mono response is
+    applied to every channel; a multichannel one channel by channel. The
+    convolution runs in double precision, and float32 blocks come out as
+    float32.
+    """
+
+    def __init__(self, impulse, wet=0.2, dry=1.0, partition=4096):
+        super().__init__()
+        impulse = np.asarray(impulse, dtype=np.float64)
+        self.mono = impulse.ndim == 1
+        if self.mono:
+            impulse = impulse[:, np.newaxis]
+        self.wet = wet
+        self.dry = dry
+        self.partition = partition
+        self.latency = partition
+        self.tail = max(len(impulse) - 1, 0)
+
+        # Spectra of the zero-padded response pieces, (pieces, bins, channels)
+        count = max(1, -(-len(impulse) // partition))
+        pieces = np.zeros((count * partition, impulse.shape[1]))
+        pieces[:len(impulse)] = impulse
+        self._spectra = np.fft.rfft(pieces.reshape(count, partition, -1), n=2 * partition, axis=1)
+        self.reset()
+
+    @classmethod
+    def preset(cls, name, sample_rate, wet=None, partition=4096):
+        """One of the REVERB_PRESETS rooms"""
+        settings = REVERB_PRESETS[name]
+        impulse = synthetic_impulse(sample_rate, settings['decay'], settings['predelay'],
+                                    settings['brightness'], settings['early'])
+        return cls(impulse, settings['wet'] if wet is None else wet, partition=partition)
+
+    @classmethod
+    def from_file(cls, filename, sample_rate, wet=0.2, partition=4096):
+        """Impulse response from a WAV file, resampled and scaled to unit energy"""
+        rate, impulse = wavfile.read(filename)
+        if impulse.dtype.kind in 'iu':
+            impulse = impulse / float(np.iinfo(impulse.dtype).max)
+        impulse = resample(impulse.astype(np.float32), rate, sample_rate)
+        return cls(_unit_energy(impulse), wet, partition=partition)
+
+    def reset(self):
+        super().reset()
+        self._kernel = None  # Response spectra shaped for the blocks being processed
+        self._inputs = None  # Ring of input frame spectra, newest at _head
+        self._head = 0
+        self._previous = None  # Last whole input partition
+        self._pending = None  # Input not yet making up a whole partition
+        self._ready = None  # Output not handed out yet
+
+    def process(self, block):
+        if self._track(block):
+            self._start(block.shape[1:])
+        pending = np.concatenate((self._pending, block))
+        whole = len(pending) - len(pending) % self.partition
+        outputs = [self._ready]
+        for start in range(0, whole, self.partition):
+            outputs.append(self._convolve(pending[start:start + self.partition]))
+        self._pending = pending[whole:]
+        ready = np.concatenate(outputs)
+        self._ready = ready[len(block):]
+        return ready[:len(block)].astype(np.result_type(block, np.float32))
+
+    def _start(self, channels):
+        if self.mono:
+            kernel = self._spectra[:, :, 0].reshape(self._spectra.shape[:2] + (1,) * len(channels))
+        elif channels == self._spectra.shape[2:]:
+            kernel = self._spectra
+        else:
+            raise ValueError(f"impulse response has {self._spectra.shape[2]} channels, "
+                             f"blocks have {channels}")
+        # Pieces backwards, twice over, so the pieces lined up with the input
+        # ring are always a contiguous slice
+        self._kernel = np.concatenate((kernel[::-1], kernel[::-1]))
+        self._inputs = np.zeros(self._spectra.shape[:2] + channels, dtype=complex)
+        self._previous = np.zeros((self.partition,) + channels)
+        self._pending = np.zeros((0,) + channels)
+        self._ready = np.zeros((self.partition,) + channels)
+
+    def _convolve(self, piece):
+        """Output for one whole partition of input"""
+        count = len(self._inputs)
+        self._head = (self._head + 1) % count
+        self._inputs[self._head] = np.fft.rfft(np.concatenate((self._previous, piece)), axis=0)
+        self._previous = piece
+        # Newest input goes with the first piece of the response, and so on back
+        offset = (count - 1 - self._head) % count
+        kernel = self._kernel[offset:offset + count]
+        wet = np.fft.irfft(np.einsum('k...,k...->...', self._inputs, kernel), n=2 * self.partition, axis=0)
+        return piece * self.dry + wet[self.partition:] * self.wet
+
+
+def synthetic_impulse(sample_rate, decay, predelay=0.0, brightness=None, early=(), channels=2, seed=0):
+    """Impulse response of a made-up room, scaled to unit energy per channel
+
+    Exponentially decaying noise (down 60 dB after decay seconds), different
+    in each channel for width, behind a few early reflections. The noise is
+    seeded, so a preset always sounds the same.
+    """
+    rng = np.random.default_rng(seed)
+    length = int(decay * sample_rate)
+    t = np.arange(length) / sample_rate
+    impulse = rng.standard_normal((length, channels)) * (10.0 ** (-3.0 * t / decay))[:, np.newaxis]
+    if brightness:
+        impulse = IIRFilter.lowpass(brightness, sample_rate).run(impulse)
+    impulse = _unit_energy(impulse)
+    for delay, gain in early:
+        impulse[int(delay * sample_rate)] += gain
+    offset = int(predelay * sample_rate)
+    return _unit_energy(np.concatenate((np.zeros((offset, channels)), impulse)))
+
+
+def _unit_energy(impulse):
+    energy = np.sqrt(np.sum(np.square(impulse), axis=0, keepdims=True))
+    energy[energy == 0] = 1
+    return impulse / energy
+
+
+def reverb_processor(reverb, sample_rate, partition=4096):
+    """ConvolutionReverb for a preset name or an impulse response WAV file; None for none"""
+    if not reverb or reverb == 'None':
+        return None
+    if reverb in REVERB_PRESETS:
+        return ConvolutionReverb.preset(reverb, sample_rate, partition=partition)
+    return ConvolutionReverb.from_file(reverb, sample_rate, partition=partition)
+
+
+def smoothing_filter():
+    """The synthesizer's gentle centred 3-tap low-pass (0.1, 0.8, 0.1)"""
+    return FIRFilter([0.1, 0.8, 0.1], latency=1)
+
+
+def _biquad_terms(cutoff, sample_rate, q):
+    w = 2 * np.pi * cutoff / sample_rate
+    return np.cos(w), np.sin(w) / (2 * q)
+
+
+class LookaheadLimiter(Processor):
+    """Brick-wall peak limiter that processes audio in blocks of any size
+
+    The gain needed to keep each sample under the ceiling is turned into a
+    smooth gain curve with a sliding minimum followed by a moving average
+    over the same lookahead window, so gain reduction ramps in before a
+    peak arrives and never lets a peak through. The output lags the input
+    by `latency` samples; call flush() at the end to get the tail out.
+    """
+
+    def __init__(self, ceiling=0.9 * 32767, lookahead=441, channels=2):
+        super().__init__()
+        self.ceiling = ceiling
+        self.lookahead = lookahead
+        self.latency = lookahead - 1
+        self.channels = channels
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        history = self.lookahead - 1
+        self._required = np.ones(history)  # Required gain of the last input samples
+        self._minimum = np.ones(history)  # Sliding-minimum gain of the last samples
+        self._delay = np.zeros((history, self.channels), dtype=np.float32)
+
+    def process(self, block):
+        """Limit a (samples, channels) block; returns a block of the same length"""
+        if len(block) == 0:
+            return block.astype(np.float32)
+        history = self.lookahead - 1
+
+        # Gain each sample needs on its own (stereo-linked)
+        peak = np.max(np.abs(block), axis=1)
+        required = np.ones(len(block))
+        loud = peak > self.ceiling
+        required[loud] = self.ceiling / peak[loud]
+
+        # Sliding minimum over the current and previous lookahead - 1 samples
+        required = np.concatenate((self._required, required))
+        minimum = minimum_filter1d(required, self.lookahead, origin=(self.lookahead - 1) // 2)[history:]
+        self._required = required[len(required) - history:]
+
+        # Moving average of the minimum over the same window smooths the ramps
+        minimum = np.concatenate((self._minimum, minimum))
+        sums = np.cumsum(np.concatenate(([0.0], minimum)))
+        gain = (sums[self.lookahead:] - sums[:-self.lookahead]) / self.lookahead
+        self._minimum = minimum[len(minimum) - history:]
+
+        # Delay the audio so the gain curve lines up with the peaks it reacts to
+        delayed = np.concatenate((self._delay, block.astype(np.float32)))
+        self._delay = delayed[len(block):]
+        return delayed[:len(block)] * gain[:, np.newaxis].astype(np.float32)
+
+    def flush(self):
+        """Return the last `latency` samples still inside the limiter"""
+        return self.process(np.zeros((self.latency, self.channels), dtype=np.float32))
@@ -0,0 +1,93 @@
+"""
+Software Mixer - Sums every playing voice into one continuous output stream
+"""
+
+import threading
+
+import numpy as np
+
+from wavfile import to_int16
+
+
+class SoftwareMixer:
+    """Mixes voices into fixed-size blocks at sample-accurate offsets
+
+    There is no channel limit: every voice added is summed into the blocks
+    it overlaps, so dense arrangements never drop notes. An optional block
+    processor (e.g. a master reverb) runs over the mix before it is
+    converted; its latency and tail keep the mixer busy after the last voice.
+    Voices go through their track's fader in buses (a TrackBuses), read
+    afresh for every block, so fader, mute and solo changes are heard
+    within a block.
+    """
+
+    def __init__(self, block_size=1024, channels=2, gain=1.0, effect=None, buses=None):
+        self.block_size = block_size
+        self.channels = channels
+        self.gain = gain
+        self.effect = effect
+        self.buses = buses
+        self.position = 0  # Samples mixed so far (the stream clock)
+        self.late_voices = 0  # Voices that arrived after their start had been mixed
+        self._ringing_until = 0  # Stream sample where the effect falls silent
+
+        self._voices = []  # [start_sample, buffer, track] still playing
+        self._lock = threading.Lock()
+
+    @property
+    def active_voices(self):
+        return len(self._voices)
+
+    @property
+    def busy(self):
+        """True while voices are playing or the effect is still sounding"""
+        return bool(self._voices) or self.position < self._ringing_until
+
+    def add_voice(self, buffer, start_sample, track=0):
+        """Schedule a (samples, channels) buffer of a track to start at an absolute sample"""
+        with self._lock:
+            if start_sample < self.position:
+                # Too late for the start: skip what has already gone by so the
+                # rest of the voice stays in time
+                self.late_voices += 1
+            self._voices.append([start_sample, buffer, track])
+
+    def mix_block(self):
+        """Mix the next block of the stream and return it as int16"""
+        block_start = self.position
+        block_end = block_start + self.block_size
+        out = np.zeros((self.block_size, self.channels), dtype=np.float32)
+
+        with self._lock:
+            gains = {}
+            if self.buses is not None:
+                tracks = sorted({voice[2] for voice in self._voices})
+                gains = dict(zip(tracks, self.buses.gains(tracks)))
+            still_playing = []
+            for voice in self._voices:
+                start_sample, buffer, track = voice
+                voice_end = start_sample + len(buffer)
+                if start_sample < block_end:
+                    # Overlap of the voice with this block, in both coordinate systems
+                    src_start = max(block_start - start_sample, 0)
+                    dst_start = max(start_sample - block_start, 0)
+                    length = min(block_end, voice_end) - max(block_start, start_sample)
+                    if length > 0:
+                        gain = gains.get(track)  # None without buses
+                        if gain is None:
+                            out[dst_start:dst_start + length] += buffer[src_start:src_start + length]
+                        elif gain.any():
+                            out[dst_start:dst_start + length] += buffer[src_start:src_start + length] * gain
+                if voice_end > block_end:
+                    still_playing.append(voice)
+                if self.effect is not None:
+                    self._ringing_until = max(self._ringing_until,
+                                              voice_end + self.effect.latency + self.effect.tail)
+            self._voices = still_playing
+            self.position = block_end
+
+        if self.effect is not None:
+            out = self.effect.process(out).astype(np.float32)
+        if self.gain != 1.0:
+            out *= self.gain
+        return to_int16(out)
@@ -3,25 +3,36 @@ Music Composition App with Drag & Drop
 A simple, fast music creation tool with pre-defined chords
 """
 
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import pygame
-import numpy as np
+import importlib.util
+import sys
 import threading
+import time
 import os
-import json
-import wave
-from chord_generator import ChordGenerator
 
-class ChordBlock:
-    """Represents a chord block on the timeline"""
-    def __init__(self, chord_name, position, duration=1.0, track=0):
-        self.chord_name = chord_name
-        self.position = position  # Position in beats
-        self.duration = duration  # Duration in beats
-        self.track = track  # Track/row number (0, 1, 2, ...)
-        self.canvas_id = None
-        self.text_id = None
+try:
+    import tkinter as tk
+    from tkinter import ttk, messagebox, filedialog
+except ImportError:  # Headless install: only the render command is available
+    tk = None
+
+import numpy as np
+from chord_generator import DEFAULT_SAMPLE_RATE, INSTRUMENTS, ChordGenerator
+from dsp import REVERB_PRESETS, reverb_processor
+from scheduler import PlaybackScheduler
+from mixer import SoftwareMixer
+from render_cache import DiskRenderCache, default_cache_dir
+from renderer import IncrementalMixdown, export_wav, write_wav
+from resample import resample
+from arrangement import ChordBlock
+from buses import TrackBuses
+from song import Song
+from telemetry import PlaybackTelemetry
+from wavfile import SAMPLE_FORMATS
+from block_index import BlockIndex
+
+# Sample rates offered by the export dialog
+EXPORT_SAMPLE_RATES = [44100, 48000, 88200, 96000]
+
 
 class MusicApp:
     def __init__(self, root):
@@ -30,12 +41,18 @@ class MusicApp:
         self.root.geometry("1200x700")
         self.root.configure(bg='#2b2b2b')
         
-        # Initialize audio
-        pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
-        self.chord_generator = ChordGenerator()
+        # Initialize audio; synthesis and playback share one sample rate. pygame
+        # is only imported where the app plays audio, so 'python -m music_app
+        # render' never loads it or needs an audio subsystem
+        import pygame
+        self.sample_rate = DEFAULT_SAMPLE_RATE
+        pygame.mixer.init(frequency=self.sample_rate, size=-16, channels=2, buffer=512)
+        # Renders are also kept on disk, so reopening a song doesn't resynthesize it
+        self.disk_cache = DiskRenderCache(default_cache_dir())
+        self.chord_generator = ChordGenerator(sample_rate=self.sample_rate, disk_cache=self.disk_cache)
         
         # App state
-        self.chord_blocks = []
+        self.chord_blocks = BlockIndex()  # Keeps blocks indexed by track and beat
         self.dragging_chord = None
         self.is_playing = False
         self.repeat_mode = False
@@ -43,6 +60,22 @@ class MusicApp:
         self.current_key = "C"
         self.stretching_block = None
         self.stretch_start_x = 0
+        self.stretch_start_duration = None  # Duration before the stretch began
+        self._stretch_x = None  # Latest mouse x of the stretch, applied once per frame
+        self._stretch_redraw = None  # Pending after() for the next stretch frame
+        self.frame_interval = 16  # Milliseconds per display frame (about 60 Hz)
+        self.lookahead_beats = 8  # Playback renders this far ahead (2 bars of 4/4)
+        self.mixer_block_size = 1024  # Samples per block of the playback stream
+        self.export_workers = os.cpu_count() or 1  # Processes used to render exports
+        self.telemetry = PlaybackTelemetry()  # Timing record of the last playback
+        self.status_interval = 500  # ms between status panel updates while playing
+        self.export_normalize = 'limit'  # 'limit' (one pass) or 'peak' (two-pass peak scan)
+        self.export_sample_rate = None  # None exports at the engine rate, e.g. 96000 for masters
+        self.export_format = 'pcm16'  # 'pcm16', 'pcm24' or 'float32'
+        self.export_dither = True  # TPDF dither when rounding to PCM
+        self.mixdown = IncrementalMixdown(self.chord_generator, workers=self.export_workers)
+        self.track_buses = TrackBuses()  # Per-track gain, pan, mute and solo
+        self.mixer_window = None
         
         # Colors
         self.bg_color = '#2b2b2b'
@@ -158,6 +191,12 @@ class MusicApp:
                             width=8, height=2, relief=tk.RAISED, bd=3)
         load_btn.pack(side=tk.LEFT, padx=5, pady=10)
         
+        # Track mixer button
+        mixer_btn = tk.Button(control_frame, text="🎚 Mixer", command=self.open_track_mixer,
+                             bg='#795548', fg='white', font=('Arial', 13, 'bold'),
+                             width=8, height=2, relief=tk.RAISED, bd=3)
+        mixer_btn.pack(side=tk.LEFT, padx=5, pady=10)
+        
         # Clear button
         clear_btn = tk.Button(control_frame, text="🗑 Clear", command=self.clear_timeline,
                              bg='#FF9800', fg='white', font=('Arial', 14, 'bold'),
@@ -187,12 +226,32 @@ class MusicApp:
                 fg='white', font=('Arial', 12)).pack(side=tk.LEFT, padx=(30, 5))
         self.instrument_var = tk.StringVar(value='Piano')
         instrument_combo = ttk.Combobox(control_frame, textvariable=self.instrument_var,
-                                values=['Piano', 'Guitar', 'Strings', 'Organ', 'Synth', 'Bass',
-                                       'Flute', 'Saxophone', 'Trumpet', 'Trombone', 'Violin', 'Cello'],
+                                values=INSTRUMENTS,
                                 width=12, font=('Arial', 12), state='readonly')
         instrument_combo.pack(side=tk.LEFT, padx=5)
         instrument_combo.bind('<<ComboboxSelected>>', self.update_instrument)
         
+        # Master reverb selector (used for playback and export)
+        tk.Label(control_frame, text="Reverb:", bg=self.panel_color,
+                fg='white', font=('Arial', 12)).pack(side=tk.LEFT, padx=(30, 5))
+        self.reverb_var = tk.StringVar(value='Room')
+        reverb_combo = ttk.Combobox(control_frame, textvariable=self.reverb_var,
+                                   values=['None'] + list(REVERB_PRESETS),
+                                   width=8, font=('Arial', 12), state='readonly')
+        reverb_combo.pack(side=tk.LEFT, padx=5)
+        
+        # Status panel with live playback timing stats
+        status_frame = tk.Frame(self.root, bg=self.panel_color)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(0, 5))
+        self.status_label = tk.Label(status_frame, text=self.telemetry.status_text(),
+                                     bg=self.panel_color, fg='#cccccc', font=('Courier', 10),
+                                     anchor='w')
+        self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5, pady=3)
+        trace_btn = tk.Button(status_frame, text="📊 Save Trace", command=self.save_playback_trace,
+                              bg='#607D8B', fg='white', font=('Arial', 10, 'bold'),
+                              relief=tk.RAISED, bd=2)
+        trace_btn.pack(side=tk.RIGHT, padx=5, pady=3)
+        
         # Main content area
         content_frame = tk.Frame(self.root, bg=self.bg_color)
         content_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
@@ -284,21 +343,30 @@ class MusicApp:
                 bg=self.timeline_color, fg='#aaa', font=('Arial', 9)).pack(side=tk.LEFT, padx=20)
         
         # Horizontal scrollbar
-        h_scrollbar = ttk.Scrollbar(timeline_container, orient=tk.HORIZONTAL)
-        h_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.h_scrollbar = ttk.Scrollbar(timeline_container, orient=tk.HORIZONTAL)
+        self.h_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
         
         # Timeline canvas
         self.timeline = tk.Canvas(timeline_container, bg='#1a1a1a', 
                                  highlightthickness=1, highlightbackground='#555',
-                                 xscrollcommand=h_scrollbar.set)
+                                 xscrollcommand=self.on_timeline_xscroll,
+                                 yscrollcommand=self.on_timeline_yscroll)
         self.timeline.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
         
-        h_scrollbar.config(command=self.timeline.xview)
+        self.h_scrollbar.config(command=self.timeline.xview)
         
-        # Set scrollregion for infinite timeline (200 beats)
+        # Set scrollregion for infinite timeline (at least 200 beats, grows with the song)
         self.timeline_beats = 200
         self.beat_width = 80
         
+        # Only the visible part of the timeline (plus a margin) has canvas
+        # items; they are recycled as the view scrolls
+        self.timeline_margin = 0.5  # Extra viewport widths drawn on each side
+        self._grid_items = {}  # Kind of grid item -> its canvas items, spares hidden
+        self._spare_block_items = []  # (rect, text) of blocks that left the view
+        self._drawn_blocks = set()  # Blocks that currently own canvas items
+        self._timeline_refresh = None  # Pending after_idle redraw
+        
         # Bind timeline events
         self.timeline.bind('<Button-1>', self.timeline_click)
         self.timeline.bind('<B1-Motion>', self.timeline_drag)
@@ -330,21 +398,35 @@ class MusicApp:
         
     def initialize_timeline(self):
         """Initialize timeline with proper scroll region"""
-        width = self.timeline_beats * self.beat_width
-        height = max(500, self.timeline.winfo_height())
-        self.timeline.config(scrollregion=(0, 0, width, height))
-        self.draw_timeline_grid()
+        self.update_scrollregion()
+        self.refresh_timeline()
     
     def on_timeline_configure(self, event):
         """Handle timeline resize"""
-        width = self.timeline_beats * self.beat_width
-        height = max(500, event.height)
-        self.timeline.config(scrollregion=(0, 0, width, height))
+        self.update_scrollregion(event.height)
+        self.schedule_timeline_refresh()
+    
+    def on_timeline_xscroll(self, first, last):
+        """Keep the scrollbar in step and draw whatever scrolled into view"""
+        self.h_scrollbar.set(first, last)
+        self.schedule_timeline_refresh()
+    
+    def on_timeline_yscroll(self, first, last):
+        self.schedule_timeline_refresh()
+    
+    def update_scrollregion(self, view_height=None):
+        """Size the scroll region to fit the song, with room to keep composing"""
+        header_height = 25
+        track_height = 60
+        beats = max(self.timeline_beats, int(self.chord_blocks.last_beat()) + 32)
+        height = max(500, view_height or self.timeline.winfo_height(),
+                     header_height + (self.chord_blocks.track_count() + 1) * track_height)
+        self.timeline.config(scrollregion=(0, 0, beats * self.beat_width, height))
     
     def on_mousewheel(self, event):
         """Handle vertical mouse wheel (scroll horizontally with shift)"""
         # On Windows, event.delta is typically +-120 per notch
-        pass
+        self.timeline.yview_scroll(int(-1 * (event.delta / 120)), "units")
     
     def on_shift_mousewheel(self, event):
         """Handle shift+mouse wheel for horizontal scrolling"""
@@ -359,41 +441,103 @@ class MusicApp:
         """Scroll timeline to the right"""
         self.timeline.xview_scroll(5, "units")
     
+    def schedule_timeline_refresh(self):
+        """Redraw the visible timeline once the current burst of events is handled"""
+        if self._timeline_refresh is None:
+            self._timeline_refresh = self.root.after_idle(self.refresh_timeline)
+    
+    def refresh_timeline(self):
+        """Bring the grid and block items in line with the visible region"""
+        self._timeline_refresh = None
+        self.draw_timeline_grid()
+        
+        left, top, right, bottom = self.visible_region()
+        header_height = 25
+        track_height = 60
+        first_track = max(0, int((top - header_height) // track_height))
+        last_track = int((bottom - header_height) // track_height) + 1
+        visible = set()
+        for track in range(first_track, last_track):
+            visible.update(self.chord_blocks.blocks_between(track, left / self.beat_width,
+                                                            right / self.beat_width))
+        
+        for block in self._drawn_blocks - visible:
+            self.release_block_items(block)
+        for block in visible - self._drawn_blocks:
+            self.draw_chord_block(block)
+        
+        # Keep the grid under the blocks and the header on top
+        self.timeline.tag_lower('grid')
+        self.timeline.tag_raise('header')
+    
+    def visible_region(self):
+        """Canvas area that is on screen, widened by the drawing margin"""
+        left = self.timeline.canvasx(0)
+        right = self.timeline.canvasx(self.timeline.winfo_width())
+        top = self.timeline.canvasy(0)
+        bottom = self.timeline.canvasy(self.timeline.winfo_height())
+        margin_x = (right - left) * self.timeline_margin
+        margin_y = (bottom - top) * self.timeline_margin
+        return left - margin_x, top - margin_y, right + margin_x, bottom + margin_y
+    
+    def _grid_pool(self, kind, count, create):
+        """Return count canvas items of a kind, reusing hidden ones before creating more"""
+        items = self._grid_items.setdefault(kind, [])
+        while len(items) < count:
+            items.append(create())
+        for item in items[:count]:
+            self.timeline.itemconfigure(item, state='normal')
+        for item in items[count:]:
+            self.timeline.itemconfigure(item, state='hidden')
+        return items[:count]
+    
     def draw_timeline_grid(self):
-        """Draw the timeline grid"""
-        self.timeline.delete('grid')
-        self.timeline.delete('header')
+        """Draw the timeline grid for the visible region"""
+        left, top, right, bottom = self.visible_region()
         
         # Use full scrollable width
-        width = self.timeline_beats * self.beat_width
-        height = int(self.timeline.cget('scrollregion').split()[3]) if self.timeline.cget('scrollregion') else 500
+        region = self.timeline.cget('scrollregion')
+        width = int(float(region.split()[2])) if region else self.timeline_beats * self.beat_width
+        height = int(float(region.split()[3])) if region else 500
+        left, right = max(0, left), min(width, right)
+        top, bottom = max(0, top), min(height, bottom)
         
         # Draw header background for beat numbers
         header_height = 25
-        self.timeline.create_rectangle(0, 0, width, header_height, 
-                                      fill='#2a2a2a', outline='', tags='header')
-        
-        # Vertical lines (beats) - draw all beats
-        for i in range(0, width, self.beat_width):
+        header, = self._grid_pool('header', 1, lambda: self.timeline.create_rectangle(
+            0, 0, 0, 0, fill='#2a2a2a', outline='', tags='header'))
+        self.timeline.coords(header, left, 0, right, header_height)
+        
+        # Vertical lines (beats) - only the beats in view
+        first_beat = int(left // self.beat_width)
+        beats = range(first_beat, int(right // self.beat_width) + 1)
+        lines = self._grid_pool('beat_line', len(beats), lambda: self.timeline.create_line(
+            0, 0, 0, 0, fill='#333', tags='grid'))
+        numbers = self._grid_pool('beat_number', len(beats), lambda: self.timeline.create_text(
+            0, 0, fill='#FFD700', anchor='w', tags='header', font=('Arial', 10, 'bold')))
+        for beat_num, line, number in zip(beats, lines, numbers):
+            i = beat_num * self.beat_width
             # Draw line starting from header area
-            self.timeline.create_line(i, header_height, i, height, fill='#333', tags='grid')
-            beat_num = i // self.beat_width
+            self.timeline.coords(line, i, header_height, i, height)
             # Draw beat number in header area
-            self.timeline.create_text(i + 5, header_height//2, text=str(beat_num), 
-                                     fill='#FFD700', anchor='w', tags='header',
-                                     font=('Arial', 10, 'bold'))
+            self.timeline.coords(number, i + 5, header_height//2)
+            self.timeline.itemconfigure(number, text=str(beat_num))
         
         # Horizontal lines (tracks) - start below header
         track_height = 60
-        for i in range(header_height + track_height, height, track_height):
-            self.timeline.create_line(0, i, width, i, fill='#333', tags='grid')
-        
-        # Add track labels - adjust for header
-        for track_num in range(0, (height - header_height) // track_height):
-            self.timeline.create_text(5, header_height + track_num * track_height + 30, 
-                                     text=f'Track {track_num + 1}', 
-                                     fill='#555', anchor='w', tags='grid',
-                                     font=('Arial', 9, 'italic'))
+        first_track = max(0, int((top - header_height) // track_height))
+        tracks = range(first_track, min((height - header_height) // track_height,
+                                        int((bottom - header_height) // track_height) + 1))
+        lines = self._grid_pool('track_line', len(tracks), lambda: self.timeline.create_line(
+            0, 0, 0, 0, fill='#333', tags='grid'))
+        labels = self._grid_pool('track_label', len(tracks), lambda: self.timeline.create_text(
+            0, 0, fill='#555', anchor='w', tags='grid', font=('Arial', 9, 'italic')))
+        for track_num, line, label in zip(tracks, lines, labels):
+            y = header_height + (track_num + 1) * track_height
+            self.timeline.coords(line, left, y, right, y)
+            # Add track labels - adjust for header
+            self.timeline.coords(label, 5, header_height + track_num * track_height + 30)
+            self.timeline.itemconfigure(label, text=f'Track {track_num + 1}')
     
     def timeline_click(self, event):
         """Handle timeline click"""
@@ -408,18 +552,17 @@ class MusicApp:
             return
         
         # Check if clicking on the right edge of a block for stretching
-        for block in self.chord_blocks:
-            x = block.position * self.beat_width
-            width = block.duration * self.beat_width
-            right_edge = x + width
-            track_y = header_height + block.track * 60 + 5
-            track_y_end = track_y + 50
-            
-            # Check if near right edge (within 10 pixels) and on same track
-            if (abs(canvas_x - right_edge) < 10 and 
-                track_y <= canvas_y <= track_y_end):
+        track = int((canvas_y - header_height) // 60)
+        track_y = header_height + track * 60 + 5
+        track_y_end = track_y + 50
+        if track_y <= canvas_y <= track_y_end:
+            # Near a right edge (within 10 pixels) on this track
+            block = self.chord_blocks.block_ending_near(track, canvas_x / self.beat_width,
+                                                        10 / self.beat_width)
+            if block:
                 self.stretching_block = block
                 self.stretch_start_x = canvas_x
+                self.stretch_start_duration = block.duration
                 return
         
         if self.dragging_chord:
@@ -428,34 +571,53 @@ class MusicApp:
             track = int((canvas_y - header_height) // 60)  # Determine which track/row, accounting for header
             
             new_block = ChordBlock(self.dragging_chord, beat_position, duration=1.0, track=track)
-            self.chord_blocks.append(new_block)
-            self.draw_chord_block(new_block)
+            self.add_block(new_block)
             self.dragging_chord = None
     
     def timeline_drag(self, event):
         """Handle dragging on timeline"""
         if self.stretching_block:
-            # Get actual canvas coordinates
-            canvas_x = self.timeline.canvasx(event.x)
-            
-            # Calculate new duration based on drag
-            x = self.stretching_block.position * self.beat_width
-            new_width = canvas_x - x
-            new_duration = max(0.5, new_width / self.beat_width)  # Minimum 0.5 beats
-            
-            self.stretching_block.duration = new_duration
-            
-            # Redraw the block - delete both rectangle and text
-            if self.stretching_block.canvas_id:
-                self.timeline.delete(self.stretching_block.canvas_id)
-            if self.stretching_block.text_id:
-                self.timeline.delete(self.stretching_block.text_id)
-            self.draw_chord_block(self.stretching_block)
+            # Get actual canvas coordinates; motion events only record the
+            # position and the block is redrawn at most once per frame
+            self._stretch_x = self.timeline.canvasx(event.x)
+            if self._stretch_redraw is None:
+                self._stretch_redraw = self.root.after(self.frame_interval, self.apply_stretch)
+    
+    def apply_stretch(self):
+        """Resize the stretched block to the latest mouse position, in place"""
+        self._stretch_redraw = None
+        block = self.stretching_block
+        if block is None or self._stretch_x is None:
+            return
+        
+        # Calculate new duration based on drag
+        x = block.position * self.beat_width
+        new_width = self._stretch_x - x
+        new_duration = max(0.5, new_width / self.beat_width)  # Minimum 0.5 beats
+        
+        if new_duration != block.duration:
+            self.chord_blocks.resize(block, new_duration)
+            if block in self._drawn_blocks:
+                self.place_block_items(block)
     
     def timeline_release(self, event):
         """Handle release on timeline"""
         self.dragging_chord = None
+        block = self.stretching_block
+        if block:
+            # Apply the last motion now rather than a frame later
+            if self._stretch_redraw is not None:
+                self.root.after_cancel(self._stretch_redraw)
+            self.apply_stretch()
+            
+            # The mix changes once per stretch, over the old and the new extent
+            if block.duration != self.stretch_start_duration:
+                self.mixdown.mark_dirty(block.position, self.stretch_start_duration)
+                self.mixdown.mark_dirty(block.position, block.duration)
+                self.update_scrollregion()
+                self.schedule_timeline_refresh()  # It may have grown into view
         self.stretching_block = None
+        self._stretch_x = None
     
     def timeline_right_click(self, event):
         """Handle right-click to delete chord"""
@@ -467,63 +629,37 @@ class MusicApp:
         items = self.timeline.find_overlapping(canvas_x-5, canvas_y-5, 
                                                canvas_x+5, canvas_y+5)
         for item in items:
-            for block in self.chord_blocks:
-                if block.canvas_id == item or block.text_id == item:
-                    if block.canvas_id:
-                        self.timeline.delete(block.canvas_id)
-                    if block.text_id:
-                        self.timeline.delete(block.text_id)
-                    self.chord_blocks.remove(block)
-                    return
+            block = self.chord_blocks.block_for_item(item)
+            if block:
+                self.remove_block(block)
+                return
     
     def draw_chord_block(self, block):
-        """Draw a chord block on the timeline"""
-        x = block.position * self.beat_width
-        track_height = 60
-        header_height = 25
-        y = header_height + block.track * track_height + 5  # Position based on track number, below header
-        width = block.duration * self.beat_width - 4
-        height = track_height - 10  # Fit within track with padding
-        
+        """Draw a chord block on the timeline, reusing its own or spare items"""
         color = self.chord_color_map.get(block.chord_name, '#888')
         
-        rect = self.timeline.create_rectangle(x + 2, y, x + width, y + height,
-                                              fill=color, outline='white', width=2)
-        text = self.timeline.create_text(x + width/2, y + height/2,
-                                         text=block.chord_name, fill='white',
-                                         font=('Arial', 12, 'bold'))
+        if block in self._drawn_blocks:
+            rect, text = block.canvas_id, block.text_id
+        elif self._spare_block_items:
+            rect, text = self._spare_block_items.pop()
+            self.timeline.itemconfigure(rect, state='normal')
+            self.timeline.itemconfigure(text, state='normal')
+        else:
+            rect = self.timeline.create_rectangle(0, 0, 0, 0, outline='white', width=2)
+            text = self.timeline.create_text(0, 0, fill='white', font=('Arial', 12, 'bold'))
+            # Ensure header stays on top
+            self.timeline.tag_raise('header')
+        
+        self.timeline.itemconfigure(rect, fill=color)
+        self.timeline.itemconfigure(text, text=block.chord_name)
         block.canvas_id = rect
         block.text_id = text
-        
-        # Ensure header stays on top
-        self.timeline.tag_raise('header')
-    
-    def timeline_release(self, event):
-        """Handle release on timeline"""
-        self.dragging_chord = None
-        self.stretching_block = None
-    
-    def timeline_right_click(self, event):
-        """Handle right-click to delete chord"""
-        # Get actual canvas coordinates
-        canvas_x = self.timeline.canvasx(event.x)
-        canvas_y = self.timeline.canvasy(event.y)
-        
-        # Find chord at position
-        items = self.timeline.find_overlapping(canvas_x-5, canvas_y-5, 
-                                               canvas_x+5, canvas_y+5)
-        for item in items:
-            for block in self.chord_blocks:
-                if block.canvas_id == item or block.text_id == item:
-                    if block.canvas_id:
-                        self.timeline.delete(block.canvas_id)
-                    if block.text_id:
-                        self.timeline.delete(block.text_id)
-                    self.chord_blocks.remove(block)
-                    return
+        self.place_block_items(block)
+        self._drawn_blocks.add(block)
+        self.chord_blocks.map_items(block)
     
-    def draw_chord_block(self, block):
-        """Draw a chord block on the timeline"""
+    def place_block_items(self, block):
+        """Move a drawn block's rectangle and label to match its position and length"""
         x = block.position * self.beat_width
         track_height = 60
         header_height = 25
@@ -531,18 +667,33 @@ class MusicApp:
         width = block.duration * self.beat_width - 4
         height = track_height - 10  # Fit within track with padding
         
-        color = self.chord_color_map.get(block.chord_name, '#888')
-        
-        rect = self.timeline.create_rectangle(x + 2, y, x + width, y + height,
-                                              fill=color, outline='white', width=2)
-        text = self.timeline.create_text(x + width/2, y + height/2,
-                                         text=block.chord_name, fill='white',
-                                         font=('Arial', 12, 'bold'))
-        block.canvas_id = rect
-        block.text_id = text
-        
-        # Ensure header stays on top
-        self.timeline.tag_raise('header')
+        self.timeline.coords(block.canvas_id, x + 2, y, x + width, y + height)
+        self.timeline.coords(block.text_id, x + width/2, y + height/2)
+    
+    def release_block_items(self, block):
+        """Hide a block's canvas items and keep them for another block"""
+        if block not in self._drawn_blocks:
+            return
+        self._drawn_blocks.discard(block)
+        self.chord_blocks.unmap_items(block)
+        self.timeline.itemconfigure(block.canvas_id, state='hidden')
+        self.timeline.itemconfigure(block.text_id, state='hidden')
+        self._spare_block_items.append((block.canvas_id, block.text_id))
+        block.canvas_id = None
+        block.text_id = None
+    
+    def add_block(self, block):
+        """Add a block to the song; it is drawn once it is in view"""
+        self.chord_blocks.append(block)
+        self.mixdown.mark_dirty(block.position, block.duration)
+        self.update_scrollregion()
+        self.schedule_timeline_refresh()
+    
+    def remove_block(self, block):
+        """Remove a block from the song and the timeline"""
+        self.release_block_items(block)
+        self.chord_blocks.remove(block)
+        self.mixdown.mark_dirty(block.position, block.duration)
     
     def update_bpm(self):
         """Update BPM"""
@@ -551,6 +702,64 @@ class MusicApp:
         except:
             pass
     
+    def open_track_mixer(self):
+        """Show the track mixer: gain, pan, mute and solo for every track"""
+        if self.mixer_window is not None and self.mixer_window.winfo_exists():
+            self.mixer_window.lift()
+            self.refresh_track_mixer()
+            return
+        self.mixer_window = tk.Toplevel(self.root)
+        self.mixer_window.title("Track Mixer")
+        self.mixer_window.configure(bg=self.panel_color)
+        self.refresh_track_mixer()
+    
+    def refresh_track_mixer(self):
+        """Rebuild the track mixer's rows from the current tracks and settings"""
+        window = self.mixer_window
+        if window is None or not window.winfo_exists():
+            return
+        for child in window.winfo_children():
+            child.destroy()
+        
+        for column, heading in enumerate(['', 'Gain (dB)', 'Pan', 'Mute', 'Solo']):
+            tk.Label(window, text=heading, bg=self.panel_color, fg='white',
+                     font=('Arial', 10, 'bold')).grid(row=0, column=column, padx=5, pady=(5, 0))
+        
+        for track in range(max(self.chord_blocks.track_count(), 1)):
+            bus = self.track_buses[track]
+            row = track + 1
+            tk.Label(window, text=f'Track {track + 1}', bg=self.panel_color, fg='white',
+                     font=('Arial', 11)).grid(row=row, column=0, padx=5, sticky='w')
+            
+            gain_scale = tk.Scale(window, from_=-30, to=6, resolution=0.5, orient=tk.HORIZONTAL,
+                                  length=160, bg=self.panel_color, fg='white', highlightthickness=0,
+                                  command=lambda value, track=track: self.set_track_gain(track, value))
+            gain_scale.set(_gain_db(bus.gain))
+            gain_scale.grid(row=row, column=1, padx=5)
+            
+            pan_scale = tk.Scale(window, from_=-100, to=100, orient=tk.HORIZONTAL, length=120,
+                                 bg=self.panel_color, fg='white', highlightthickness=0,
+                                 command=lambda value, track=track: self.set_track_pan(track, value))
+            pan_scale.set(round(bus.pan * 100))
+            pan_scale.grid(row=row, column=2, padx=5)
+            
+            for column, name in ((3, 'mute'), (4, 'solo')):
+                var = tk.BooleanVar(value=getattr(bus, name))
+                tk.Checkbutton(window, variable=var, bg=self.panel_color, selectcolor='#555555',
+                               activebackground=self.panel_color,
+                               command=lambda var=var, track=track, name=name: self.track_buses.set(
+                                   track, **{name: var.get()})).grid(row=row, column=column, padx=5)
+    
+    def set_track_gain(self, track, value):
+        """Gain slider moved (dB); ignores the slider echoing a value it was set to"""
+        if abs(_gain_db(self.track_buses[track].gain) - float(value)) >= 0.25:
+            self.track_buses.set(track, gain=10 ** (float(value) / 20))
+    
+    def set_track_pan(self, track, value):
+        """Pan slider moved (-100 to 100); ignores the slider echoing a value it was set to"""
+        if abs(self.track_buses[track].pan * 100 - float(value)) >= 0.5:
+            self.track_buses.set(track, pan=float(value) / 100)
+    
     def update_key(self, event):
         """Update musical key"""
         self.current_key = self.key_var.get()
@@ -574,8 +783,13 @@ class MusicApp:
                                                      "Clear all chords?"):
             return
         self.timeline.delete('all')
+        self._grid_items.clear()
+        self._spare_block_items.clear()
+        self._drawn_blocks.clear()
         self.chord_blocks.clear()
-        self.draw_timeline_grid()
+        self.mixdown.invalidate()
+        self.update_scrollregion()
+        self.refresh_timeline()
     
     def play_music(self):
         """Play the music sequence"""
@@ -592,85 +806,132 @@ class MusicApp:
         # Play in separate thread
         thread = threading.Thread(target=self._play_sequence, daemon=True)
         thread.start()
+        self.root.after(self.status_interval, self.update_playback_status)
+    
+    def update_playback_status(self):
+        """Show the playback timing stats, and keep doing so while playing"""
+        self.status_label.config(text=self.telemetry.status_text(self.chord_generator.cache.stats()))
+        if self.is_playing:
+            self.root.after(self.status_interval, self.update_playback_status)
+    
+    def save_playback_trace(self):
+        """Save the timing trace of the last playback as JSON"""
+        if self.telemetry.started is None:
+            messagebox.showinfo("No Trace", "Play the song first to record a timing trace.")
+            return
+        
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+            title="Save Playback Trace"
+        )
+        
+        if filename:
+            try:
+                self.telemetry.dump(filename, self.chord_generator.cache.stats())
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to save trace: {str(e)}")
     
     def _play_sequence(self):
         """Play the chord sequence with multi-track support"""
+        import pygame
         try:
             if not self.chord_blocks:
                 return
             
             beat_duration = 60.0 / self.bpm  # Duration of one beat in seconds
+            stream_rate = pygame.mixer.get_init()[0]
             
-            # Loop if repeat mode is on
-            while True:
-                # Sort all blocks by their start time
-                sorted_blocks = sorted(self.chord_blocks, key=lambda b: b.position)
-                
-                # Find the total duration
-                if sorted_blocks:
-                    max_end_time = max(block.position + block.duration for block in sorted_blocks)
+            generator = self.chord_generator
+            
+            def render_block(block):
+                instrument = self.instrument_var.get() if hasattr(self, 'instrument_var') else 'Piano'
+                # Which cache served the render, told apart by their counters
+                misses = generator.cache.misses
+                disk_hits = generator.disk_cache.hits if generator.disk_cache else 0
+                started = time.perf_counter()
+                buffer = generator.render_chord(
+                    block.chord_name, 
+                    duration=block.duration * beat_duration,
+                    instrument=instrument
+                )
+                if generator.cache.misses == misses:
+                    cache = 'memory'
+                elif generator.disk_cache and generator.disk_cache.hits > disk_hits:
+                    cache = 'disk'
                 else:
-                    break
-                
-                # Pre-generate all sounds and their start times
-                scheduled_sounds = []
-                for block in sorted_blocks:
-                    start_time_ms = int(block.position * beat_duration * 1000)
-                    instrument = self.instrument_var.get() if hasattr(self, 'instrument_var') else 'Piano'
-                    sound = self.chord_generator.generate_chord(
-                        block.chord_name, 
-                        duration=block.duration * beat_duration,
-                        instrument=instrument
-                    )
-                    scheduled_sounds.append((start_time_ms, sound))
-                
-                # Sort by start time
-                scheduled_sounds.sort(key=lambda x: x[0])
-                
-                # Play all sounds with precise timing
-                start_ticks = pygame.time.get_ticks()
-                sound_index = 0
+                    cache = None
+                self.telemetry.record_render(block, time.perf_counter() - started, cache)
+                if block.velocity != 1.0:
+                    buffer = buffer * np.float32(block.velocity)
+                # The device may not have granted the rate we asked for
+                return resample(buffer, self.chord_generator.sample_rate, stream_rate)
+            
+            # Blocks are rendered just in time, a lookahead window ahead of the
+            # playhead; in repeat mode the next pass follows without a gap
+            scheduler = PlaybackScheduler(self.chord_blocks.to_arrangement, render_block,
+                                          beat_duration, stream_rate, self.lookahead_beats,
+                                          repeat=lambda: self.repeat_mode and self.is_playing)
+            if not scheduler.blocks:
+                return
+            
+            # Every voice is summed by one software mixer into a single stream,
+            # which goes through the master reverb
+            reverb = reverb_processor(self._reverb(), stream_rate, partition=self.mixer_block_size)
+            mixer = SoftwareMixer(block_size=self.mixer_block_size, effect=reverb,
+                                  buses=self.track_buses)
+            channel = pygame.mixer.Channel(0)
+            self.telemetry.start(stream_rate, mixer.block_size)
+            
+            # Only the first window has to be ready before the first note plays;
+            # the rest is rendered in the background while the stream runs
+            scheduler.render_window(mixer.position)
+            threading.Thread(target=self._render_ahead, args=(scheduler, mixer), daemon=True).start()
+            
+            while not (scheduler.finished and not mixer.busy):
+                if not self.is_playing:
+                    return
                 
-                while sound_index < len(scheduled_sounds):
-                    if not self.is_playing:
-                        return
-                    
-                    current_ticks = pygame.time.get_ticks()
-                    elapsed_ms = current_ticks - start_ticks
-                    
-                    # Play all sounds that should start now
-                    while sound_index < len(scheduled_sounds):
-                        scheduled_start_ms, sound = scheduled_sounds[sound_index]
-                        
-                        # If this sound's start time has arrived (with 50ms tolerance)
-                        if elapsed_ms >= scheduled_start_ms - 50:
-                            channel = pygame.mixer.find_channel()
-                            if channel:
-                                channel.play(sound)
-                            sound_index += 1
-                        else:
-                            break
-                    
-                    # Small sleep to prevent CPU spinning
-                    pygame.time.wait(10)
+                # Keep one block queued behind the one that is playing
+                if channel.get_busy() and channel.get_queue() is not None:
+                    pygame.time.wait(2)
+                    continue
                 
-                # Wait for all sounds to finish
-                final_duration_ms = int(max_end_time * beat_duration * 1000)
-                while pygame.time.get_ticks() - start_ticks < final_duration_ms:
-                    if not self.is_playing:
-                        return
-                    pygame.time.wait(50)
+                # Hand over every voice that starts inside the next block
+                for start_sample, end_sample, buffer, track in scheduler.due(mixer.position + mixer.block_size):
+                    self.telemetry.record_handoff(start_sample, len(buffer), mixer.position)
+                    mixer.add_voice(buffer, start_sample, track)
                 
-                # If not in repeat mode, break after one playthrough
-                if not self.repeat_mode:
-                    break
+                position = mixer.position
+                block = pygame.sndarray.make_sound(mixer.mix_block())
+                if channel.get_busy():
+                    channel.queue(block)
+                    self.telemetry.record_output(position, restarted=False)
+                else:
+                    # The device ran dry (or this is the first block)
+                    channel.play(block)
+                    self.telemetry.record_output(position, restarted=True)
+            
+            # Wait for the queued blocks to finish
+            while channel.get_busy():
+                if not self.is_playing:
+                    return
+                pygame.time.wait(10)
         
         finally:
             self.is_playing = False
             self.root.after(0, lambda: self.play_btn.config(state=tk.NORMAL))
     
+    def _render_ahead(self, scheduler, mixer):
+        """Keep the scheduler's lookahead window rendered while the stream plays"""
+        import pygame
+        while self.is_playing and not scheduler.all_rendered:
+            if not scheduler.render_next(mixer.position):
+                pygame.time.wait(5)
+    
     def stop_music(self):
         """Stop playing music"""
+        import pygame
         self.is_playing = False
         pygame.mixer.stop()
     
@@ -680,6 +941,9 @@ class MusicApp:
                                                           "Create new song? Current song will be lost if not saved."):
             return
         self.clear_timeline()
+        self.track_buses.reset()
+        self.chord_generator.seed = 0
+        self.refresh_track_mixer()
         self.root.title("Music Composer - New Song")
     
     def export_audio(self):
@@ -688,6 +952,9 @@ class MusicApp:
             messagebox.showinfo("Empty Song", "Nothing to export! Add some chords first.")
             return
         
+        if not self.ask_export_settings():
+            return
+        
         filename = filedialog.asksaveasfilename(
             defaultextension=".wav",
             filetypes=[("WAV Audio", "*.wav"), ("All files", "*.*")],
@@ -704,16 +971,23 @@ class MusicApp:
                         font=('Arial', 12), pady=20).pack()
                 progress_msg.update()
                 
-                # Render the audio
-                audio_data = self._render_audio_to_array()
-                
-                # Save as WAV
-                import wave
-                with wave.open(filename, 'wb') as wav_file:
-                    wav_file.setnchannels(2)  # Stereo
-                    wav_file.setsampwidth(2)   # 16-bit
-                    wav_file.setframerate(44100)
-                    wav_file.writeframes(audio_data.tobytes())
+                arrangement = self.chord_blocks.to_arrangement()
+                mixdown = self._export_mixdown()
+                if mixdown.fits(arrangement, self.bpm):
+                    # Bring the cached mixdown up to date (only edited ranges are
+                    # re-rendered), then write it out
+                    mixdown.render(arrangement, self.bpm, self._export_instrument(), self.track_buses)
+                    write_wav(filename, mixdown.emit_chunks, mixdown.sample_rate,
+                              normalize=self.export_normalize, sample_format=self.export_format,
+                              dither=self.export_dither, reverb=self._reverb())
+                else:
+                    # Too long to keep a mix of: stream it to the file chunk by chunk
+                    mixdown.invalidate()
+                    export_wav(filename, mixdown.generator, arrangement, self.bpm,
+                               self._export_instrument(), mixdown.sample_rate, self.export_workers,
+                               normalize=self.export_normalize, sample_format=self.export_format,
+                               dither=self.export_dither, reverb=self._reverb(),
+                               buses=self.track_buses)
                 
                 progress_msg.destroy()
                 messagebox.showinfo("Success", f"Audio exported successfully!\n{os.path.basename(filename)}")
@@ -722,36 +996,69 @@ class MusicApp:
                     progress_msg.destroy()
                 messagebox.showerror("Error", f"Failed to export audio: {str(e)}")
     
+    def ask_export_settings(self):
+        """Ask for the export sample rate, format and dither; False if cancelled"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Export Settings")
+        dialog.configure(bg=self.panel_color)
+        dialog.transient(self.root)
+        
+        rate_var = tk.StringVar(value=str(self.export_sample_rate or self.sample_rate))
+        format_var = tk.StringVar(value=self.export_format)
+        dither_var = tk.BooleanVar(value=self.export_dither)
+        
+        tk.Label(dialog, text="Sample rate:", bg=self.panel_color, fg='white',
+                 font=('Arial', 12)).grid(row=0, column=0, padx=10, pady=5, sticky='w')
+        ttk.Combobox(dialog, textvariable=rate_var, values=[str(rate) for rate in EXPORT_SAMPLE_RATES],
+                     width=8, font=('Arial', 12), state='readonly').grid(row=0, column=1, padx=10, pady=5)
+        tk.Label(dialog, text="Format:", bg=self.panel_color, fg='white',
+                 font=('Arial', 12)).grid(row=1, column=0, padx=10, pady=5, sticky='w')
+        ttk.Combobox(dialog, textvariable=format_var, values=list(SAMPLE_FORMATS),
+                     width=8, font=('Arial', 12), state='readonly').grid(row=1, column=1, padx=10, pady=5)
+        tk.Checkbutton(dialog, text="Dither PCM output", variable=dither_var, bg=self.panel_color,
+                       fg='white', selectcolor='#555555', activebackground=self.panel_color,
+                       font=('Arial', 12)).grid(row=2, column=0, columnspan=2, padx=10, pady=5, sticky='w')
+        
+        accepted = []
+        
+        def accept():
+            rate = int(rate_var.get())
+            self.export_sample_rate = None if rate == self.sample_rate else rate
+            self.export_format = format_var.get()
+            self.export_dither = dither_var.get()
+            accepted.append(True)
+            dialog.destroy()
+        
+        buttons = tk.Frame(dialog, bg=self.panel_color)
+        buttons.grid(row=3, column=0, columnspan=2, pady=10)
+        tk.Button(buttons, text="Export", command=accept, width=8).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Cancel", command=dialog.destroy, width=8).pack(side=tk.LEFT, padx=5)
+        
+        dialog.grab_set()
+        self.root.wait_window(dialog)
+        return bool(accepted)
+    
     def save_project(self):
-        """Save the current song project as JSON"""
+        """Save the current song project as JSON, or in the binary format as .song"""
         if not self.chord_blocks:
             messagebox.showinfo("Empty Song", "Nothing to save! Add some chords first.")
             return
         
         filename = filedialog.asksaveasfilename(
             defaultextension=".json",
-            filetypes=[("Project files", "*.json"), ("All files", "*.*")],
+            filetypes=[("Project files", "*.json"), ("Binary project files", "*.song"),
+                       ("All files", "*.*")],
             title="Save Project"
         )
         
         if filename:
-            song_data = {
-                'bpm': self.bpm,
-                'key': self.current_key,
-                'blocks': [
-                    {
-                        'chord_name': block.chord_name,
-                        'position': block.position,
-                        'duration': block.duration,
-                        'track': block.track
-                    }
-                    for block in self.chord_blocks
-                ]
-            }
+            # Unloaded blocks may still be mapped from the file being overwritten
+            self.chord_blocks.detach()
+            song = Song(self.bpm, self.current_key, self.chord_blocks.to_arrangement(), self.track_buses,
+                        self.chord_generator.seed)
             
             try:
-                with open(filename, 'w') as f:
-                    json.dump(song_data, f, indent=2)
+                song.save(filename)
                 self.root.title(f"Music Composer - {os.path.basename(filename)}")
                 messagebox.showinfo("Success", "Song saved successfully!")
             except Exception as e:
@@ -760,97 +1067,52 @@ class MusicApp:
     def load_song(self):
         """Load a song from a file"""
         filename = filedialog.askopenfilename(
-            filetypes=[("Music files", "*.json"), ("All files", "*.*")],
+            filetypes=[("Music files", "*.json *.song"), ("All files", "*.*")],
             title="Open Song"
         )
         
         if filename:
             try:
-                with open(filename, 'r') as f:
-                    song_data = json.load(f)
+                song = Song.load(filename)
                 
                 # Clear current song without confirmation
                 self.clear_timeline(confirm=False)
                 
                 # Load BPM and key
-                self.bpm = song_data.get('bpm', 120)
+                self.bpm = song.bpm
                 self.bpm_var.set(str(self.bpm))
-                self.current_key = song_data.get('key', 'C')
+                self.current_key = song.key
                 self.key_var.set(self.current_key)
+                self.track_buses = song.tracks
+                self.chord_generator.seed = song.seed
+                self.refresh_track_mixer()
                 
-                # Load blocks
-                for block_data in song_data.get('blocks', []):
-                    block = ChordBlock(
-                        chord_name=block_data['chord_name'],
-                        position=block_data['position'],
-                        duration=block_data.get('duration', 1.0),
-                        track=block_data.get('track', 0)
-                    )
-                    self.chord_blocks.append(block)
-                    self.draw_chord_block(block)
+                # Blocks are only created and drawn as they scroll into view
+                self.chord_blocks.load(song.blocks)
+                self.update_scrollregion()
+                self.schedule_timeline_refresh()
                 
                 self.root.title(f"Music Composer - {os.path.basename(filename)}")
                 messagebox.showinfo("Success", "Song loaded successfully!")
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to load song: {str(e)}")
     
-    def _render_audio_to_array(self):
-        """Render the entire song to a numpy array"""
-        # Sort blocks by position
-        sorted_blocks = sorted(self.chord_blocks, key=lambda b: (b.position, b.track))
-        
-        if not sorted_blocks:
-            return np.array([], dtype=np.int16)
-        
-        # Calculate total duration
-        max_end = max(block.position + block.duration for block in sorted_blocks)
-        beat_duration = 60.0 / self.bpm
-        total_duration = max_end * beat_duration
-        
-        # Create silence buffer
-        num_samples = int(44100 * total_duration)
-        final_audio = np.zeros((num_samples, 2), dtype=np.float32)
-        
-        # Process blocks by position to handle overlapping tracks
-        i = 0
-        while i < len(sorted_blocks):
-            current_block_position = sorted_blocks[i].position
-            blocks_at_position = []
-            
-            # Get all blocks at the same position
-            while i < len(sorted_blocks) and sorted_blocks[i].position == current_block_position:
-                blocks_at_position.append(sorted_blocks[i])
-                i += 1
-            
-            # Render each block at this position
-            for block in blocks_at_position:
-                # Generate chord audio
-                chord_duration = block.duration * beat_duration
-                instrument = self.instrument_var.get() if hasattr(self, 'instrument_var') else 'Piano'
-                sound = self.chord_generator.generate_chord(block.chord_name, duration=chord_duration, instrument=instrument)
-                
-                # Convert pygame sound to numpy array
-                sound_array = pygame.sndarray.array(sound)
-                
-                # Calculate position in samples
-                start_sample = int(block.position * beat_duration * 44100)
-                end_sample = min(start_sample + len(sound_array), num_samples)
-                
-                # Mix into final audio
-                sound_length = end_sample - start_sample
-                if sound_length > 0:
-                    final_audio[start_sample:end_sample] += sound_array[:sound_length].astype(np.float32)
-        
-        # Normalize to prevent clipping
-        max_val = np.max(np.abs(final_audio))
-        if max_val > 0:
-            final_audio = final_audio * (32767.0 / max_val) * 0.9  # Leave headroom
-        
-        # Convert to 16-bit integer
-        final_audio = final_audio.astype(np.int16)
-        
-        return final_audio
+    def _export_mixdown(self):
+        """The mixdown at the export rate; other rates are synthesized natively"""
+        rate = self.export_sample_rate or self.sample_rate
+        if self.mixdown.sample_rate != rate:
+            generator = (self.chord_generator if rate == self.chord_generator.sample_rate
+                         else ChordGenerator(sample_rate=rate, disk_cache=self.disk_cache))
+            self.mixdown = IncrementalMixdown(generator, workers=self.export_workers)
+        self.mixdown.generator.seed = self.chord_generator.seed
+        return self.mixdown
+    
+    def _export_instrument(self):
+        return self.instrument_var.get() if hasattr(self, 'instrument_var') else 'Piano'
     
+    def _reverb(self):
+        return self.reverb_var.get() if hasattr(self, 'reverb_var') else 'Room'
+
     def load_default_song(self):
         """Load Happy Birthday as default song"""
         # Happy Birthday melody in C major (actual notes)
@@ -906,8 +1168,7 @@ class MusicApp:
         ]
         
         for block in default_blocks:
-            self.chord_blocks.append(block)
-            self.draw_chord_block(block)
+            self.add_block(block)
         
         self.root.title("Music Composer - Happy Birthday")
     
@@ -915,10 +1176,26 @@ class MusicApp:
         """Run the application"""
         self.root.mainloop()
 
-def main():
+
+def _gain_db(gain):
+    """Linear gain as the mixer's slider shows it: dB, floored at -30"""
+    return max(-30.0, 20 * np.log10(gain)) if gain > 0 else -30.0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == 'render':
+        # Headless batch rendering: no window and no audio device
+        import render_cli
+        return render_cli.main(argv[1:])
+
+    if tk is None:
+        sys.exit("tkinter is not available; only 'python -m music_app render' works here")
+    if importlib.util.find_spec('pygame') is None:
+        sys.exit("pygame is not available; only 'python -m music_app render' works here")
     root = tk.Tk()
     app = MusicApp(root)
     app.run()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Render Cache - Keeps recently rendered audio buffers around for reuse, in memory and on disk
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class RenderCache:
+    """Byte-budgeted LRU cache of rendered audio buffers"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+
+        # Counters for checking how well the cache is doing
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()  # key -> numpy array, oldest first
+        self._lock = threading.Lock()  # Playback and export run on different threads
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Return the cached buffer for key, or None on a miss"""
+        with self._lock:
+            buffer = self._entries.get(key)
+            if buffer is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return buffer
+
+    def put(self, key, buffer):
+        """Store a buffer and evict the least recently used ones over budget"""
+        # Cached buffers are shared between callers, so nobody may change them
+        buffer.flags.writeable = False
+
+        # Buffers bigger than the whole budget are returned but not kept
+        if buffer.nbytes > self.max_bytes:
+            return buffer
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+
+            self._entries[key] = buffer
+            self.current_bytes += buffer.nbytes
+
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+
+        return buffer
+
+    def invalidate(self, predicate=None):
+        """Drop entries whose key matches predicate (all entries if None)"""
+        with self._lock:
+            if predicate is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self.current_bytes = 0
+                return removed
+
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                self.current_bytes -= self._entries.pop(key).nbytes
+            return len(stale)
+
+    def clear(self):
+        """Drop every entry and reset the counters"""
+        self.invalidate()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Return a snapshot of the cache counters"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def default_cache_dir():
+    """Per-user directory for the on-disk render cache"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'music_composer', 'renders')
+
+
+class DiskRenderCache:
+    """Content-addressed LRU cache of rendered buffers as .npy files, kept between sessions
+
+    Keys are hashed into file names, so a key must describe everything the
+    buffer depends on. Hits are memory-mapped rather than read. Several
+    processes may share a directory: files are written aside and renamed
+    into place, each process evicts by file modification time (refreshed on
+    every hit), and the size cap is only approximate while they overlap.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._files = None  # File name -> size, oldest first; scanned on first put
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached buffer for key (read-only, memory-mapped), or None on a miss"""
+        name = self._file_name(key)
+        path = os.path.join(self.directory, name)
+        try:
+            buffer = np.load(path, mmap_mode='r')
+            os.utime(path)  # Mark as recently used
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if self._files is not None and name in self._files:
+                self._files.move_to_end(name)
+        return buffer
+
+    def put(self, key, buffer):
+        """Store a buffer and evict the least recently used files over budget"""
+        if buffer.nbytes > self.max_bytes:
+            return
+        name = self._file_name(key)
+        path = os.path.join(self.directory, name)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                np.save(f, buffer)
+            os.replace(temp_path, path)
+            size = os.path.getsize(path)
+        except OSError:
+            return  # A cache that can't be written is just a cache miss next time
+
+        with self._lock:
+            self._scan()
+            self._bytes -= self._files.pop(name, 0)
+            self._files[name] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._files) > 1:
+                evicted, evicted_size = self._files.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+                try:
+                    os.remove(os.path.join(self.directory, evicted))
+                except OSError:
+                    pass  # Already evicted by another process, or still open elsewhere
+
+    def clear(self):
+        """Delete every cached file and reset the counters"""
+        with self._lock:
+            self._scan()
+            for name in self._files:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+            self._files.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Return a snapshot of the cache counters"""
+        with self._lock:
+            self._scan()
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._files),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _scan(self):
+        """Build the LRU order from the files on disk (once per process)"""
+        if self._files is not None:
+            return
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith('.npy'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.name, stat.st_size))
+        except OSError:
+            pass
+        self._files = OrderedDict((name, size) for _, name, size in sorted(entries))
+        self._bytes = sum(self._files.values())
+
+    @staticmethod
+    def _file_name(key):
+        return hashlib.sha1(repr(key).encode()).hexdigest() + '.npy'
@@ -0,0 +1,137 @@
+"""
+Render CLI - Renders song files to WAV without the GUI or an audio device
+
+    python -m music_app render song.json song.wav --instrument Piano
+    python -m music_app render sample_songs/ out/ --jobs 4
+    python -m music_app render "songs/*.json" out/
+    python -m music_app render song.json master.wav --sample-rate 96000 --format pcm24
+    python -m music_app render song.json wet.wav --reverb Hall
+    python -m music_app render song.json wet.wav --reverb my_church_ir.wav
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from chord_generator import DEFAULT_SAMPLE_RATE, INSTRUMENTS, ChordGenerator
+from dsp import REVERB_PRESETS
+from render_cache import DiskRenderCache, default_cache_dir
+from renderer import export_wav
+from wavfile import SAMPLE_FORMATS
+from song import BINARY_EXTENSION, Song
+
+
+def find_songs(inputs):
+    """Expand files, directories and glob patterns into a sorted list of song files"""
+    songs = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            matches = (glob.glob(os.path.join(pattern, '*.json'))
+                       + glob.glob(os.path.join(pattern, '*' + BINARY_EXTENSION)))
+        elif glob.has_magic(pattern):
+            matches = glob.glob(pattern)
+        else:
+            matches = [pattern]  # A missing file is reported when it fails to render
+        songs.extend(sorted(matches))
+    return list(dict.fromkeys(songs))
+
+
+def output_path(song_file, output, single):
+    """Where a song's WAV goes: output itself for one song, else a file inside it"""
+    if single and output.lower().endswith('.wav'):
+        return output
+    name = os.path.splitext(os.path.basename(song_file))[0] + '.wav'
+    return os.path.join(output, name)
+
+
+def render_file(song_file, wav_file, instrument, normalize, sample_rate=DEFAULT_SAMPLE_RATE,
+                sample_format='pcm16', dither=True, cache_dir=None, reverb='Room'):
+    """Render one song file to WAV; returns (audio seconds, wall seconds)
+
+    cache_dir is a render cache directory shared with the app and other
+    renders (None renders without one). reverb is a preset name, an
+    impulse response WAV file or None.
+    """
+    started = time.perf_counter()
+    song = Song.load(song_file)
+    disk_cache = DiskRenderCache(cache_dir) if cache_dir else None
+    generator = ChordGenerator(sample_rate=sample_rate, disk_cache=disk_cache)
+    generator.seed = song.seed
+    export_wav(wav_file, generator, song.blocks, song.bpm,
+               instrument=instrument, normalize=normalize, sample_format=sample_format,
+               dither=dither, reverb=reverb, buses=song.tracks)
+    length = song.blocks.end_beat() * 60.0 / song.bpm
+    return length, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m music_app render',
+        description="Render song JSON files to WAV audio without opening the app"
+    )
+    parser.add_argument('inputs', nargs='+', help="Song files, directories or glob patterns")
+    parser.add_argument('output', help="Output WAV file (one song) or directory")
+    parser.add_argument('--instrument', choices=INSTRUMENTS, default='Piano',
+                        help="Instrument to render with")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help="Songs rendered at the same time, one process each")
+    parser.add_argument('--normalize', choices=['limit', 'peak'], default='limit',
+                        help="Peak limiter (one pass) or two-pass peak normalization")
+    parser.add_argument('--sample-rate', type=int, default=DEFAULT_SAMPLE_RATE,
+                        help="Rate to synthesize and write at, e.g. 96000 for masters")
+    parser.add_argument('--format', choices=sorted(SAMPLE_FORMATS), default='pcm16',
+                        help="16/24-bit PCM or 32-bit float samples")
+    parser.add_argument('--no-dither', action='store_true',
+                        help="Round to PCM without TPDF dither")
+    parser.add_argument('--cache-dir', default=default_cache_dir(),
+                        help="Where rendered chords are cached between runs")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Synthesize everything without the on-disk render cache")
+    parser.add_argument('--reverb', default='Room',
+                        help="Master reverb: " + ", ".join(['None'] + list(REVERB_PRESETS))
+                             + ", or an impulse response WAV file")
+    args = parser.parse_args(argv)
+
+    if args.reverb not in REVERB_PRESETS and args.reverb != 'None' and not os.path.isfile(args.reverb):
+        parser.error(f"unknown reverb (not a preset or a file): {args.reverb}")
+
+    songs = find_songs(args.inputs)
+    if not songs:
+        parser.error("no song files found")
+    single = len(songs) == 1
+    if not single and args.output.lower().endswith('.wav') and not os.path.isdir(args.output):
+        parser.error(f"{len(songs)} songs need an output directory, not the file {args.output}")
+    targets = [(song_file, output_path(song_file, args.output, single)) for song_file in songs]
+    for _, wav_file in targets:
+        directory = os.path.dirname(wav_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    started = time.perf_counter()
+    failures = 0
+    audio_seconds = 0.0
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(targets)))) as pool:
+        futures = {pool.submit(render_file, song_file, wav_file, args.instrument, args.normalize,
+                               args.sample_rate, args.format, not args.no_dither,
+                               None if args.no_cache else args.cache_dir, args.reverb):
+                   (song_file, wav_file) for song_file, wav_file in targets}
+        for done, future in enumerate(as_completed(futures), 1):
+            song_file, wav_file = futures[future]
+            try:
+                length, took = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"[{done}/{len(targets)}] FAILED {song_file}: {e}", file=sys.stderr)
+                continue
+            audio_seconds += length
+            print(f"[{done}/{len(targets)}] {song_file} -> {wav_file} "
+                  f"({length:.1f}s of audio in {took:.1f}s)")
+
+    elapsed = time.perf_counter() - started
+    print(f"Rendered {len(targets) - failures} of {len(targets)} songs, "
+          f"{audio_seconds:.1f}s of audio in {elapsed:.1f}s"
+          + (f", {failures} failed" if failures else ""))
+    return 1 if failures else 0
@@ -0,0 +1,592 @@
+"""
+Offline Renderer - Renders a whole song to audio for export
+"""
+
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from arrangement import as_arrangement
+from buses import TrackBuses
+from chord_generator import ChordGenerator
+from dsp import LookaheadLimiter, reverb_processor
+from render_cache import DiskRenderCache
+from resample import resample, resampled_length
+from wavfile import WavWriter
+
+# Songs with fewer blocks than this are rendered serially; starting worker
+# processes costs more than it saves
+PARALLEL_MIN_BLOCKS = 32
+
+# Upper bound for the shared staging buffer of one parallel window
+STAGING_BYTES = 64 * 1024 * 1024
+
+# Samples per chunk when streaming a song out
+CHUNK_SIZE = 65536
+
+# Largest mix an IncrementalMixdown keeps in memory (about 12 minutes of
+# stereo float32 at 44.1 kHz); longer songs are exported by streaming them
+MIXDOWN_MAX_BYTES = 256 * 1024 * 1024
+
+# Budget for the per-track mixes an IncrementalMixdown keeps besides, so a
+# fader change only re-sums them (e.g. four tracks of up to 3 minutes)
+MIXDOWN_TRACK_BYTES = 256 * 1024 * 1024
+
+# How far ahead (in seconds) the export limiter looks for peaks
+LIMITER_LOOKAHEAD = 0.005
+
+# Partition size of the master reverb when rendering offline, where its
+# latency doesn't matter and longer partitions are cheaper
+REVERB_PARTITION = 8192
+
+
+def export_wav(filename, generator, blocks, bpm, instrument='Piano', sample_rate=None,
+               workers=1, chunk_size=CHUNK_SIZE, normalize='limit', sample_format='pcm16',
+               dither=True, reverb=None, buses=None):
+    """Render the song straight into a stereo WAV file, chunk by chunk
+
+    Memory stays bounded by the chunk size and the longest block, however
+    long the song is. normalize='limit' runs the mix through a lookahead
+    peak limiter in one pass; normalize='peak' renders twice, first to find
+    the song's peak, and scales it to 90% of full scale.
+    See WavWriter for sample_format and dither, write_wav for reverb and
+    mix_song for buses.
+    """
+    sample_rate = sample_rate or generator.sample_rate
+
+    def produce(emit):
+        return mix_song(generator, blocks, bpm, emit, instrument, sample_rate, workers, chunk_size,
+                        buses)
+
+    write_wav(filename, produce, sample_rate, normalize, sample_format, dither, reverb)
+
+
+def write_wav(filename, produce, sample_rate, normalize='limit', sample_format='pcm16', dither=True,
+              reverb=None):
+    """Write a raw float mix to a stereo WAV file as it is produced
+
+    produce(emit) passes the mix to emit in order, chunk by chunk, and
+    returns its length in samples; it is called twice for normalize='peak'.
+    reverb (a preset name or impulse response file, see reverb_processor)
+    is put on the master bus before normalization, and its tail is kept.
+    """
+    if normalize not in ('limit', 'peak'):
+        raise ValueError(f"Unknown normalize mode: {normalize}")
+    produce = process_stream(produce, reverb_processor(reverb, sample_rate, REVERB_PARTITION))
+
+    with WavWriter(filename, sample_rate, sample_format=sample_format, dither=dither) as wav_file:
+        write = wav_file.write
+
+        if normalize == 'peak':
+            peak = [0.0]
+
+            def scan(chunk):
+                peak[0] = max(peak[0], float(np.max(np.abs(chunk))))
+
+            produce(scan)
+
+            def write_scaled(chunk):
+                if peak[0] > 0:
+                    chunk = chunk * (32767.0 / peak[0]) * 0.9  # Leave headroom
+                write(chunk)
+
+            produce(write_scaled)
+        else:
+            limiter = LookaheadLimiter(lookahead=max(1, int(sample_rate * LIMITER_LOOKAHEAD)))
+            process_stream(produce, limiter)(write)
+
+
+def process_stream(produce, processor):
+    """A produce(emit) whose output goes through a block processor on the way
+
+    The processor's latency is taken off the front, so the output lines up
+    with the input, and its tail follows the end; the returned length
+    includes the tail. Every call starts the processor from scratch. With
+    no processor, produce is returned as it is.
+    """
+    if processor is None:
+        return produce
+
+    def processed(emit):
+        processor.reset()
+        skip = [processor.latency]  # Leading samples that are only the processor's delay
+
+        def emit_processed(chunk):
+            output = processor.process(chunk)
+            drop = min(skip[0], len(output))
+            skip[0] -= drop
+            if drop < len(output):
+                emit(output[drop:])
+
+        length = produce(emit_processed)
+        if not length:
+            return length
+        ending = processor.flush()[skip[0]:]
+        if len(ending):
+            emit(ending)
+        return length + processor.tail
+
+    return processed
+
+
+def mix_song(generator, blocks, bpm, emit, instrument='Piano', sample_rate=None,
+             workers=1, chunk_size=CHUNK_SIZE, buses=None):
+    """Render the song's raw float32 mix and pass it to emit in order, chunk by chunk
+
+    Every track is mixed on its own bus, and the buses are mixed through
+    their faders (buses, a TrackBuses; unity for every track if None).
+    Returns the song length in samples.
+    """
+    sample_rate = sample_rate or generator.sample_rate
+    arrangement = as_arrangement(blocks)  # Kept sorted by position
+
+    if not len(arrangement):
+        return 0
+
+    # Calculate total duration
+    max_end = arrangement.end_beat()
+    beat_duration = 60.0 / bpm
+    total_duration = max_end * beat_duration
+    num_samples = int(sample_rate * total_duration)
+
+    accumulator = ChunkAccumulator(num_samples, chunk_size, emit, buses=buses)
+
+    def mix(block, sound_array):
+        # Calculate position in samples
+        sound_array = resample(sound_array, generator.sample_rate, sample_rate)
+        if block.velocity != 1.0:
+            sound_array = sound_array * np.float32(block.velocity)
+        accumulator.add(int(block.position * beat_duration * sample_rate), sound_array, block.track)
+
+    batches = arrangement.batches()
+    if workers > 1 and len(arrangement) >= PARALLEL_MIN_BLOCKS:
+        _render_parallel(generator, batches, beat_duration, instrument, workers, mix)
+    else:
+        _render_serial(generator, batches, beat_duration, instrument, mix)
+    accumulator.finish()
+    return num_samples
+
+
+class ChunkAccumulator:
+    """Overlap-adds blocks that arrive in start order and emits finished chunks
+
+    Covers song samples origin to num_samples. A block is held (by
+    reference) until the last chunk it reaches into has been emitted, and
+    each chunk is summed from the blocks held, track by track in the order
+    they arrived, then mixed through buses (a TrackBuses). A chunk is
+    complete once a block starting at or after its end arrives. Nothing
+    grows or is shifted when a block is long; each chunk costs only its own
+    length times the blocks that reach into it. track_mixes, a {track:
+    (samples, channels) array} covering the song, also gets each of its
+    tracks' chunks before the faders, zeros where a track is silent.
+    """
+
+    def __init__(self, num_samples, chunk_size, emit, channels=2, buses=None, origin=0, track_mixes=None):
+        self.num_samples = num_samples
+        self.chunk_size = chunk_size
+        self.emit = emit
+        self.channels = channels
+        self.buses = buses if buses is not None else TrackBuses()
+        self.origin = origin  # Song sample where the next chunk starts
+        self.track_mixes = track_mixes
+        self._held = []  # (start, end, sound_array, track) of blocks reaching into that chunk
+
+    def add(self, start_sample, sound_array, track=0):
+        """Mix a block in at its song position; blocks must come in start order"""
+        while self.origin + self.chunk_size <= start_sample and self.origin < self.num_samples:
+            self._emit_chunk()
+
+        end_sample = min(start_sample + len(sound_array), self.num_samples)
+        if end_sample > max(start_sample, self.origin):
+            self._held.append((start_sample, end_sample, sound_array, track))
+
+    def finish(self):
+        """Emit everything up to the end of the song"""
+        while self.origin < self.num_samples:
+            self._emit_chunk()
+
+    def _emit_chunk(self):
+        chunk_start = self.origin
+        length = min(self.chunk_size, self.num_samples - chunk_start)
+        chunk_end = chunk_start + length
+        buffers = {}  # Track -> this chunk of the track's blocks
+        for start, end, sound_array, track in self._held:
+            first, last = max(start, chunk_start), min(end, chunk_end)
+            if first < last:
+                buffer = buffers.get(track)
+                if buffer is None:
+                    buffer = buffers[track] = np.zeros((length, self.channels), dtype=np.float32)
+                buffer[first - chunk_start:last - chunk_start] += sound_array[first - start:last - start]
+        if self.track_mixes is not None:
+            for track, track_mix in self.track_mixes.items():
+                track_mix[chunk_start:chunk_end] = buffers.get(track, 0)
+        if buffers:
+            chunk = self.buses.mix(buffers)
+        else:
+            chunk = np.zeros((length, self.channels), dtype=np.float32)
+
+        self._held = [held for held in self._held if held[1] > chunk_end]
+        self.origin = chunk_end
+        self.emit(chunk)
+
+
+def song_hash(blocks, bpm, instrument, sample_rate, seed=0):
+    """Content hash of everything that goes into a song's mix"""
+    arrangement = as_arrangement(blocks)
+    rows = arrangement.rows
+    content = hashlib.sha1(repr((bpm, instrument, sample_rate, seed)).encode())
+    content.update('\0'.join(arrangement.names().tolist()).encode())
+    for column in ('position', 'duration', 'track', 'velocity'):
+        content.update(np.ascontiguousarray(rows[column]).tobytes())
+    return content.hexdigest()
+
+
+class IncrementalMixdown:
+    """Cached raw mix of the song that re-renders only what was edited
+
+    Every block edit reports the old and new extent of the block with
+    mark_dirty(). render() then mixes just those sample ranges again from
+    every block that overlaps them (chord renders mostly come from the
+    generator's cache), each range through a ChunkAccumulator as mix_song
+    does, so the result is identical to a full render. An arrangement whose
+    content hash and faders match the cached mix is returned without any
+    work. The mix is the whole song in float32, so it is only kept for songs
+    that fit in max_bytes (see fits()).
+
+    Each track's mix before the faders is kept too while all of them fit in
+    track_bytes, and a fader change then only sums them again. Songs with
+    more or longer tracks keep just the mix, and a fader change re-mixes
+    every block from the generator's caches.
+    """
+
+    def __init__(self, generator, sample_rate=None, workers=1, max_bytes=MIXDOWN_MAX_BYTES,
+                 track_bytes=MIXDOWN_TRACK_BYTES):
+        self.generator = generator
+        self.sample_rate = sample_rate or generator.sample_rate
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self.track_bytes = track_bytes
+        self.tail_samples = 0  # Extra samples an edit reaches past a block's end
+        self.content_hash = None
+        self._settings = None  # (bpm, instrument, seed, tuning) the cached mix was made with
+        self._fader_key = None  # TrackBuses.key() of the faders the mix went through
+        self._mix = np.zeros((0, 2), dtype=np.float32)
+        self._track_mixes = None  # Track -> its mix before the faders, if kept
+        self._dirty = []  # (position, duration) in beats of edited block extents
+        self._full = True
+
+    def mark_dirty(self, position, duration):
+        """Record that a block spanning these beats was added, removed or changed"""
+        self._dirty.append((position, duration))
+
+    def invalidate(self):
+        """Drop the cached mix (and its memory); the next render starts from scratch"""
+        self._full = True
+        self._dirty.clear()
+        self.content_hash = None
+        self._mix = np.zeros((0, 2), dtype=np.float32)
+        self._track_mixes = None
+
+    def fits(self, blocks, bpm):
+        """True if the song is short enough for its mix to be kept in max_bytes"""
+        return self._num_samples(as_arrangement(blocks), bpm) * 2 * 4 <= self.max_bytes
+
+    def render(self, blocks, bpm, instrument='Piano', buses=None):
+        """Return the song's raw float32 mix, re-rendering only dirty ranges
+
+        buses (a TrackBuses) holds the track faders; None is unity for every
+        track. The returned array is the cache itself and must not be
+        modified.
+        """
+        buses = buses if buses is not None else TrackBuses()
+        fader_key = buses.key()
+        arrangement = as_arrangement(blocks)
+        num_samples = self._num_samples(arrangement, bpm)
+        if num_samples * 2 * 4 > self.max_bytes:
+            raise ValueError("Song is too long to keep a mixdown of; stream it with export_wav()")
+        seed = self.generator.seed
+        settings = (bpm, instrument, seed, float(self.generator.tuning))
+        content_hash = song_hash(arrangement, bpm, instrument, self.sample_rate, seed)
+        if (content_hash == self.content_hash and settings == self._settings
+                and fader_key == self._fader_key):
+            self._dirty.clear()
+            return self._mix
+
+        rows = arrangement.rows
+        tracks = np.unique(rows['track']).tolist()
+        keep_tracks = num_samples * 2 * 4 * len(tracks) <= self.track_bytes
+        beat_duration = 60.0 / bpm
+        if (self._settings != settings or (content_hash != self.content_hash and not self._dirty)
+                or (fader_key != self._fader_key and self._track_mixes is None)
+                or keep_tracks != (self._track_mixes is not None)):
+            # New tempo, sound, seed or tuning, or faders with no track mixes to
+            # sum again (or an edit nobody reported): everything changed
+            self.invalidate()
+        self._settings = settings
+
+        if self._full:
+            ranges = [(0, num_samples)]
+            self._mix = np.zeros((num_samples, 2), dtype=np.float32)
+        else:
+            ranges = [tuple(int(edge) for edge in self._extent(position, duration, beat_duration))
+                      for position, duration in self._dirty]
+            if num_samples > len(self._mix):
+                ranges.append((len(self._mix), num_samples))
+            ranges = _merge_ranges(ranges, num_samples)
+            self._mix = _resized(self._mix, num_samples)
+        if keep_tracks:
+            # Tracks that are gone only had blocks in dirty ranges; new ones start silent
+            old = self._track_mixes or {}
+            self._track_mixes = {track: _resized(old[track], num_samples) if track in old
+                                 else np.zeros((num_samples, 2), dtype=np.float32)
+                                 for track in tracks}
+
+        # Re-mix every batch that reaches into a dirty range
+        starts, ends = self._extent(rows['position'], rows['duration'], beat_duration)
+        wanted = np.zeros(len(rows), dtype=bool)
+        for start, end in ranges:
+            wanted |= (starts < end) & (start < ends)
+        batches = arrangement.batches(wanted)
+
+        # One accumulator per range, writing its chunks straight into the mix
+        pending = [(start, ChunkAccumulator(end, CHUNK_SIZE, _writer(self._mix, start), buses=buses,
+                                            origin=start, track_mixes=self._track_mixes))
+                   for start, end in ranges]
+
+        def mix(block, sound_array):
+            sound_array = resample(sound_array, self.generator.sample_rate, self.sample_rate)
+            if block.velocity != 1.0:
+                sound_array = sound_array * np.float32(block.velocity)
+            start_sample = int(block.position * beat_duration * self.sample_rate)
+            # Blocks come in start order, so ranges ending before this one starts are done
+            while pending and pending[0][1].num_samples <= start_sample:
+                pending.pop(0)[1].finish()
+            for start, accumulator in pending:
+                if start >= start_sample + len(sound_array):
+                    break
+                accumulator.add(start_sample, sound_array, block.track)
+
+        if self.workers > 1 and sum(len(batch) for batch in batches) >= PARALLEL_MIN_BLOCKS:
+            _render_parallel(self.generator, batches, beat_duration, instrument,
+                             self.workers, mix)
+        else:
+            _render_serial(self.generator, batches, beat_duration, instrument, mix)
+        for _, accumulator in pending:
+            accumulator.finish()
+
+        if fader_key != self._fader_key and not self._full:
+            # Only the kept track mixes are summed again through the new faders
+            for start in range(0, num_samples, CHUNK_SIZE):
+                end = start + CHUNK_SIZE
+                buses.mix({track: track_mix[start:end] for track, track_mix in self._track_mixes.items()},
+                          out=self._mix[start:end])
+
+        self._fader_key = fader_key
+        self._full = False
+        self._dirty.clear()
+        self.content_hash = content_hash
+        return self._mix
+
+    def _num_samples(self, arrangement, bpm):
+        """Length of the song's mix, as mix_song computes it"""
+        return int(self.sample_rate * (arrangement.end_beat() * (60.0 / bpm)))
+
+    def _extent(self, position, duration, beat_duration):
+        """Samples a block's audio covers, as mix_song places it (scalars or arrays)"""
+        start = np.trunc(np.asarray(position) * beat_duration * self.sample_rate).astype(np.int64)
+        # As render_chords does
+        length = np.trunc(self.generator.sample_rate * np.multiply(duration, beat_duration)).astype(np.int64)
+        length = resampled_length(length, self.generator.sample_rate, self.sample_rate)
+        return start, start + length + self.tail_samples
+
+    def emit_chunks(self, emit, chunk_size=CHUNK_SIZE):
+        """Pass the cached mix to emit chunk by chunk (a produce() for write_wav)"""
+        for start in range(0, len(self._mix), chunk_size):
+            emit(self._mix[start:start + chunk_size])
+        return len(self._mix)
+
+
+def _writer(target, start):
+    """An emit() that writes consecutive chunks into target from sample start on"""
+    position = [start]
+
+    def write(chunk):
+        target[position[0]:position[0] + len(chunk)] = chunk
+        position[0] += len(chunk)
+
+    return write
+
+
+def _resized(buffer, num_samples):
+    """A (samples, 2) buffer cut or zero-padded to num_samples"""
+    if num_samples <= len(buffer):
+        return buffer[:num_samples]
+    grown = np.zeros((num_samples, 2), dtype=np.float32)
+    grown[:len(buffer)] = buffer
+    return grown
+
+
+def _merge_ranges(ranges, limit):
+    """Sort, clip to [0, limit) and merge overlapping sample ranges"""
+    merged = []
+    for start, end in sorted(ranges):
+        start, end = max(start, 0), min(end, limit)
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+def _render_serial(generator, batches, beat_duration, instrument, mix):
+    """Render every batch on the calling thread and pass each block to mix"""
+    for batch in batches:
+        chord_arrays = generator.render_chords(
+            [block.chord_name for block in batch],
+            duration=batch[0].duration * beat_duration,
+            instrument=instrument
+        )
+        for block, chord_array in zip(batch, chord_arrays):
+            mix(block, chord_array)
+
+
+def _render_parallel(generator, batches, beat_duration, instrument, workers, mix):
+    """Render batches on a pool of worker processes and pass each block to mix
+
+    Chords already in the generator's memory cache are taken from it; only
+    the rest are sent to the workers, and what they render is added to the
+    cache, so a re-mix of the same song starts no work at all. Batches are
+    handled in windows whose misses fit in STAGING_BYTES. Workers write each
+    missing chord into its own slot of a shared-memory staging buffer, and
+    blocks are mixed in batch order once the whole window is done.
+    """
+    generator_rate = generator.sample_rate
+    disk_cache = generator.disk_cache
+    settings = (generator_rate, (disk_cache.directory, disk_cache.max_bytes) if disk_cache is not None
+                else None, generator.seed, generator.tuning)
+    start = 0
+    while start < len(batches):
+        # Lay out the window's missing chords back to back in the staging buffer
+        window = []  # (batch, duration, cached arrays, missing chord names, offset, length)
+        total = 0
+        while start < len(batches):
+            batch = batches[start]
+            names = [block.chord_name for block in batch]
+            duration = batch[0].duration * beat_duration
+            cached = generator.cached_chords(names, duration, instrument)
+            missing = list(dict.fromkeys(name for name, array in zip(names, cached) if array is None))
+            length = int(generator_rate * duration)  # As render_chords does
+            size = length * len(missing) * 2 * 4  # Stereo float32
+            if window and total + size > STAGING_BYTES:
+                break
+            window.append((batch, duration, cached, missing, total // 8, length))  # Offset in frames
+            total += size
+            start += 1
+
+        if not total:
+            for batch, _, cached, _, _, _ in window:
+                for block, array in zip(batch, cached):
+                    mix(block, array)
+            continue
+
+        staging = shared_memory.SharedMemory(create=True, size=total)
+        try:
+            frames = np.ndarray((total // 8, 2), dtype=np.float32, buffer=staging.buf)
+
+            # Split the window into a few contiguous tasks per worker
+            tasks = [(missing, duration, offset, length)
+                     for _, duration, _, missing, offset, length in window if missing]
+            per_task = max(1, len(tasks) // (workers * 4))
+            pool = _worker_pool(workers)
+            try:
+                futures = [pool.submit(_render_into_staging, staging.name, frames.shape,
+                                       tasks[i:i + per_task], instrument, settings)
+                           for i in range(0, len(tasks), per_task)]
+                for future in futures:
+                    future.result()
+            except BrokenProcessPool:
+                _discard_worker_pool(pool)
+                raise
+
+            # mix may hold on to a block after it returns (ChunkAccumulator
+            # does), so each chord is copied out before the window is freed
+            for batch, duration, cached, missing, offset, length in window:
+                rendered = {name: generator.cache_chord(name, duration, instrument,
+                                                        frames[offset + j * length:
+                                                               offset + (j + 1) * length].copy())
+                            for j, name in enumerate(missing)}
+                for block, array in zip(batch, cached):
+                    mix(block, array if array is not None else rendered[block.chord_name])
+            del frames
+        finally:
+            staging.close()
+            staging.unlink()
+
+
+# The worker processes, kept between renders as (workers, ProcessPoolExecutor)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _worker_pool(workers):
+    """The shared pool of render worker processes, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool[0] != workers:
+            if _pool is not None:
+                _pool[1].shutdown(wait=False)
+            _pool = (workers, ProcessPoolExecutor(max_workers=workers))
+        return _pool[1]
+
+
+def _discard_worker_pool(pool):
+    """Forget a pool whose workers died, so the next render starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool[1] is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+_worker_generators = {}  # (sample rate, cache_args) -> this worker's ChordGenerator
+
+
+def _worker_generator(sample_rate, cache_args, seed, tuning):
+    """The worker process's generator for these settings (and its render cache)
+
+    cache_args is (directory, max_bytes) of the parent's disk cache, which
+    the workers share. Generators outlive the render, so chords a worker
+    made stay in its memory cache for the next one.
+    """
+    generator = _worker_generators.get((sample_rate, cache_args))
+    if generator is None:
+        disk_cache = DiskRenderCache(*cache_args) if cache_args is not None else None
+        generator = ChordGenerator(sample_rate=sample_rate, disk_cache=disk_cache)
+        _worker_generators[sample_rate, cache_args] = generator
+    generator.seed = seed
+    generator.tuning = tuning
+    return generator
+
+
+def _render_into_staging(staging_name, shape, tasks, instrument, settings):
+    """Render batches of chords straight into the shared staging buffer
+
+    settings are the parent generator's (sample rate, cache_args, seed,
+    tuning), see _worker_generator().
+    """
+    generator = _worker_generator(*settings)
+    staging = shared_memory.SharedMemory(name=staging_name)
+    try:
+        frames = np.ndarray(shape, dtype=np.float32, buffer=staging.buf)
+        for chord_names, duration, offset, length in tasks:
+            slots = frames[offset:offset + len(chord_names) * length].reshape(len(chord_names), length, 2)
+            generator.render_chords(chord_names, duration=duration, instrument=instrument, out=slots)
+        del frames
+    finally:
+        staging.close()
@@ -0,0 +1,32 @@
+"""
+Resampler - Sample rate conversion wherever two parts of the engine run at different rates
+"""
+
+from math import gcd
+
+import numpy as np
+from scipy.signal import resample_poly
+
+
+def resampled_length(num_samples, from_rate, to_rate):
+    """Length of num_samples after resample(), without doing the work"""
+    return -(-num_samples * int(to_rate) // int(from_rate))
+
+
+def resample(audio, from_rate, to_rate):
+    """Convert (samples, channels) audio from one sample rate to another
+
+    Uses a polyphase FIR filter (Kaiser-windowed sinc), so pitch and length
+    are preserved and nothing above the lower Nyquist frequency aliases.
+    int16 input comes back as int16, anything else as float32.
+    """
+    from_rate, to_rate = int(from_rate), int(to_rate)
+    if from_rate == to_rate or len(audio) == 0:
+        return audio
+
+    factor = gcd(from_rate, to_rate)
+    converted = resample_poly(audio.astype(np.float32), to_rate // factor, from_rate // factor,
+                              axis=0, window=('kaiser', 8.0))
+    if audio.dtype == np.int16:
+        return np.clip(np.rint(converted), -32768, 32767).astype(np.int16)
+    return converted.astype(np.float32)
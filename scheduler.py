@@ -0,0 +1,89 @@
+"""
+Playback Scheduler - Renders song blocks just in time, ahead of the playhead
+"""
+
+from collections import deque
+
+from arrangement import as_arrangement
+
+
+class PlaybackScheduler:
+    """Keeps only a lookahead window of rendered blocks in memory
+
+    Blocks are rendered in start order once the playhead is within the
+    lookahead window of them, handed out when they are due and forgotten
+    after that, so start latency and memory do not grow with song length.
+    All times are in samples of the output stream.
+    """
+
+    def __init__(self, get_blocks, render_block, beat_duration, sample_rate,
+                 lookahead_beats=8.0, repeat=None):
+        self.get_blocks = get_blocks  # Returns the song's blocks for each pass
+        self.render_block = render_block  # Called with a block, returns its buffer
+        self.repeat = repeat  # Asked at the end of each pass; True starts another
+        self.beat_samples = beat_duration * sample_rate
+        self.lookahead = int(lookahead_beats * self.beat_samples)
+
+        self.offset = 0  # Stream sample where the current pass starts
+        self._next = 0  # Index of the next block to render
+        self._rendered = deque()  # (start, end, buffer, track) not handed out yet
+        self._exhausted = False  # No blocks left and no further pass
+        self._load()
+
+    def _load(self):
+        self.blocks = as_arrangement(self.get_blocks())  # Kept sorted by position
+        self.length = int(self.blocks.end_beat() * self.beat_samples)
+
+    @property
+    def all_rendered(self):
+        """True once the last block of the last pass has been rendered"""
+        return self._exhausted
+
+    @property
+    def finished(self):
+        """True once every block has been rendered and handed out"""
+        return self.all_rendered and not self._rendered
+
+    def render_next(self, playhead):
+        """Render the next block if it starts inside the lookahead window
+
+        Returns True if a block was rendered. Only one block is rendered per
+        call so the caller can keep servicing playback in between.
+        """
+        if self._exhausted:
+            return False
+
+        if self._next >= len(self.blocks):
+            if not (self.blocks and self.repeat and self.repeat()):
+                self._exhausted = True
+                return False
+            # The next pass starts exactly where this one ends
+            self.offset += self.length
+            self._next = 0
+            self._load()
+            if not self.blocks:
+                self._exhausted = True
+                return False
+
+        block = self.blocks[self._next]
+        start = self.offset + int(block.position * self.beat_samples)
+        if start > playhead + self.lookahead:
+            return False
+
+        buffer = self.render_block(block)
+        end = self.offset + int((block.position + block.duration) * self.beat_samples)
+        self._rendered.append((start, end, buffer, block.track))
+        self._next += 1
+        return True
+
+    def render_window(self, playhead):
+        """Render everything inside the lookahead window (used before starting)"""
+        while self.render_next(playhead):
+            pass
+
+    def due(self, until):
+        """Pop every rendered block that starts before the until sample"""
+        ready = []
+        while self._rendered and self._rendered[0][0] < until:
+            ready.append(self._rendered.popleft())
+        return ready
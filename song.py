@@ -0,0 +1,146 @@
+"""
+Song Model - Chord blocks and the song file format (no GUI or audio needed)
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+from arrangement import BLOCK_DTYPE, Arrangement
+from buses import TrackBuses
+
+# Binary project files: a fixed header, a JSON text section (tempo, key,
+# track faders, seed and chord name table), padding to 8 bytes, then one BLOCK_DTYPE record per
+# block, so the records can be memory-mapped straight into an Arrangement
+BINARY_EXTENSION = '.song'
+BINARY_MAGIC = b'MCSONG\x00\x00'
+BINARY_VERSION = 1
+_BINARY_HEADER = struct.Struct('<8sIIQ')  # Magic, version, text bytes, block count
+
+
+class Song:
+    """A song as stored on disk: tempo, key, chord blocks, track faders and seed
+
+    blocks can be any iterable of ChordBlocks; it is kept as an Arrangement.
+    tracks is a TrackBuses (every track at unity if None). seed picks the
+    random parts of noisy instruments (ChordGenerator.seed); any whole
+    number is kept as its low 32 bits, anything else raises ValueError.
+    """
+    def __init__(self, bpm=120, key="C", blocks=None, tracks=None, seed=0):
+        self.bpm = bpm
+        self.key = key
+        self.blocks = blocks if isinstance(blocks, Arrangement) else Arrangement(blocks or ())
+        self.tracks = tracks if tracks is not None else TrackBuses()
+        self.seed = _song_seed(seed)
+
+    @classmethod
+    def from_dict(cls, song_data):
+        blocks_data = song_data.get('blocks', [])
+        blocks = Arrangement.from_columns(
+            [block_data['chord_name'] for block_data in blocks_data],
+            position=[block_data['position'] for block_data in blocks_data],
+            duration=[block_data.get('duration', 1.0) for block_data in blocks_data],
+            track=[block_data.get('track', 0) for block_data in blocks_data],
+            velocity=[block_data.get('velocity', 1.0) for block_data in blocks_data]
+        )
+        return cls(song_data.get('bpm', 120), song_data.get('key', 'C'), blocks,
+                   TrackBuses.from_list(song_data.get('tracks', [])), song_data.get('seed', 0))
+
+    def to_dict(self):
+        rows = self.blocks.rows
+        blocks = []
+        for name, position, duration, track, velocity in zip(
+                self.blocks.names().tolist(), rows['position'].tolist(), rows['duration'].tolist(),
+                rows['track'].tolist(), rows['velocity'].tolist()):
+            block_data = {
+                'chord_name': name,
+                'position': position,
+                'duration': duration,
+                'track': track
+            }
+            if velocity != 1.0:
+                block_data['velocity'] = velocity
+            blocks.append(block_data)
+        song_data = {'bpm': self.bpm, 'key': self.key, 'blocks': blocks}
+        tracks = self.tracks.to_list()
+        if tracks:
+            song_data['tracks'] = tracks
+        if self.seed:
+            song_data['seed'] = self.seed
+        return song_data
+
+    @classmethod
+    def load(cls, filename):
+        """Load a song from a JSON or binary project file (told apart by content)"""
+        with open(filename, 'rb') as f:
+            binary = f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+        if binary:
+            return cls._load_binary(filename)
+        with open(filename, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, filename):
+        """Save the song as binary if the file name ends in .song, else as JSON"""
+        if filename.endswith(BINARY_EXTENSION):
+            self._save_binary(filename)
+            return
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def _load_binary(cls, filename):
+        """Read the header and map the block records; rows are only read when used"""
+        with open(filename, 'rb') as f:
+            magic, version, text_bytes, count = _BINARY_HEADER.unpack(f.read(_BINARY_HEADER.size))
+            if version != BINARY_VERSION:
+                raise ValueError(f"Unsupported song file version: {version}")
+            text = json.loads(f.read(text_bytes).decode('utf-8'))
+
+        offset = _records_offset(text_bytes)
+        if count:
+            # Copy-on-write, so edits to the arrangement never reach the file
+            rows = np.memmap(filename, dtype=BLOCK_DTYPE, mode='c', offset=offset, shape=(count,))
+        else:
+            rows = np.zeros(0, dtype=BLOCK_DTYPE)
+        blocks = Arrangement.from_rows(text['chord_names'], rows)
+        return cls(text.get('bpm', 120), text.get('key', 'C'), blocks,
+                   TrackBuses.from_list(text.get('tracks', [])), text.get('seed', 0))
+
+    def _save_binary(self, filename):
+        text = json.dumps({
+            'bpm': self.bpm,
+            'key': self.key,
+            'tracks': self.tracks.to_list(),
+            'seed': self.seed,
+            'chord_names': self.blocks.chord_names
+        }).encode('utf-8')
+        # The rows may be memory-mapped from the very file being replaced,
+        # which Windows refuses to do while the map is open
+        self.blocks.detach()
+        rows = self.blocks.rows
+
+        temp_filename = filename + '.tmp'
+        with open(temp_filename, 'wb') as f:
+            f.write(_BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(text), len(rows)))
+            f.write(text)
+            f.write(b'\x00' * (_records_offset(len(text)) - f.tell()))
+            f.write(np.ascontiguousarray(rows).tobytes())
+        os.replace(temp_filename, filename)
+
+
+def _song_seed(seed):
+    """The seed as an unsigned 32-bit int, which every random generator accepts"""
+    try:
+        whole = int(seed)
+    except (TypeError, ValueError):
+        raise ValueError(f"Song seed must be a whole number: {seed!r}") from None
+    if whole != seed:
+        raise ValueError(f"Song seed must be a whole number: {seed!r}")
+    return whole & 0xFFFFFFFF
+
+
+def _records_offset(text_bytes):
+    """File offset of the block records, 8-byte aligned"""
+    return -(-(_BINARY_HEADER.size + text_bytes) // 8) * 8
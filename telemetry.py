@@ -0,0 +1,165 @@
+"""
+Playback Telemetry - Records how well playback keeps time, for live stats and JSON traces
+"""
+
+import json
+import threading
+import time
+
+import numpy as np
+
+
+class PlaybackTelemetry:
+    """Timing record of one playback run
+
+    For every voice it keeps when it was due in the stream, how far ahead
+    of the mixer it was handed over and how late it was finally heard; for
+    every render how long it took and whether a cache served it; and every
+    underrun, i.e. a moment the output device ran dry and the stream had to
+    be restarted. Starts are measured against the stream's ideal timeline,
+    so a voice's start error is the underrun delay accumulated before it
+    played plus any part of it that arrived too late to be mixed.
+
+    Playback, rendering and the GUI run on different threads; every method
+    is safe to call from any of them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = None  # Wall-clock time the run began; None before any playback
+        self.sample_rate = None
+        self.block_size = None
+        self._origin = None
+        self._drift = 0.0
+        self._handed_over = []
+        self.voices = []
+        self.renders = []
+        self.underruns = []
+
+    def start(self, sample_rate, block_size):
+        """Forget the previous run and start recording a new one"""
+        with self._lock:
+            self.sample_rate = sample_rate
+            self.block_size = block_size
+            self.started = time.time()
+            self._origin = None  # perf_counter time at which stream sample 0 is heard
+            self._drift = 0.0  # Seconds the stream has fallen behind through underruns
+            self._handed_over = []  # Voices waiting for the block that plays their start
+            self.voices = []
+            self.renders = []
+            self.underruns = []
+
+    def record_render(self, block, seconds, cache):
+        """A block was rendered; cache is 'memory', 'disk' or None (synthesized)"""
+        with self._lock:
+            self.renders.append({
+                'chord': block.chord_name,
+                'position': block.position,
+                'duration': block.duration,
+                'render_ms': seconds * 1000,
+                'cache': cache,
+            })
+
+    def record_handoff(self, start_sample, length, position):
+        """A voice was given to the mixer while it was at stream sample position"""
+        late = max(0, position - start_sample)
+        with self._lock:
+            self._handed_over.append({
+                'start_sample': int(start_sample),
+                'scheduled_ms': start_sample / self.sample_rate * 1000,
+                'lead_ms': (start_sample - position) / self.sample_rate * 1000,
+                'late_ms': late / self.sample_rate * 1000,
+                'dropped': start_sample + length <= position,  # Over before it could be heard
+            })
+
+    def record_output(self, position, restarted):
+        """A mixed block starting at stream sample position went to the device
+
+        restarted is True if the device had run dry and the block started a
+        new stretch of output instead of being queued behind the last one.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            if restarted:
+                expected = now - position / self.sample_rate
+                if self._origin is None:
+                    self._origin = expected
+                elif expected > self._origin + self._drift:
+                    gap = expected - self._origin - self._drift
+                    self._drift += gap
+                    self.underruns.append({
+                        'position': int(position),
+                        'at_ms': (now - self._origin) * 1000,
+                        'gap_ms': gap * 1000,
+                    })
+            for voice in self._handed_over:
+                voice['start_error_ms'] = self._drift * 1000 + voice['late_ms']
+            self.voices.extend(self._handed_over)
+            self._handed_over = []
+
+    def summary(self, cache_stats=None):
+        """Percentiles and counters of the run so far
+
+        cache_stats, a render cache's stats(), adds its overall hit rate.
+        """
+        with self._lock:
+            start_errors = [voice['start_error_ms'] for voice in self.voices]
+            leads = [voice['lead_ms'] for voice in self.voices]
+            render_times = [render['render_ms'] for render in self.renders]
+            cached = sum(1 for render in self.renders if render['cache'])
+            summary = {
+                'voices': len(self.voices),
+                'late_voices': sum(1 for voice in self.voices if voice['late_ms'] > 0),
+                'dropped_voices': sum(1 for voice in self.voices if voice['dropped']),
+                'underruns': len(self.underruns),
+                'underrun_ms': sum(underrun['gap_ms'] for underrun in self.underruns),
+                'start_error_ms': _percentiles(start_errors),
+                'lead_ms': _percentiles(leads, (1, 5, 50)),
+                'render_ms': _percentiles(render_times),
+                'renders': len(self.renders),
+                'render_cache_hit_rate': cached / len(self.renders) if self.renders else 0.0,
+            }
+        if cache_stats is not None:
+            summary['cache_hit_rate'] = cache_stats['hit_rate']
+        return summary
+
+    def status_text(self, cache_stats=None):
+        """One line for the status panel"""
+        if self.started is None:
+            return "Playback: no data yet"
+        summary = self.summary(cache_stats)
+        error = summary['start_error_ms']
+        render = summary['render_ms']
+        return (f"Playback: {summary['voices']} voices | start error p50 {error['p50']:.1f} / "
+                f"p95 {error['p95']:.1f} / p99 {error['p99']:.1f} ms | render p50 {render['p50']:.1f} / "
+                f"p95 {render['p95']:.1f} ms | cache {summary['render_cache_hit_rate']:.0%} | "
+                f"late {summary['late_voices']}, dropped {summary['dropped_voices']}, "
+                f"underruns {summary['underruns']}")
+
+    def to_dict(self, cache_stats=None):
+        """The whole trace as JSON-ready data"""
+        summary = self.summary(cache_stats)
+        with self._lock:
+            return {
+                'started': self.started,
+                'sample_rate': self.sample_rate,
+                'block_size': self.block_size,
+                'summary': summary,
+                'voices': list(self.voices),
+                'renders': list(self.renders),
+                'underruns': list(self.underruns),
+            }
+
+    def dump(self, filename, cache_stats=None):
+        """Write the trace to a JSON file"""
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(cache_stats), f, indent=2)
+
+
+def _percentiles(values, points=(50, 95, 99)):
+    """{'p50': ..., 'max': ...} of a list (zeros when it is empty)"""
+    if not values:
+        return {**{f'p{p}': 0.0 for p in points}, 'max': 0.0}
+    stats = {f'p{p}': float(v) for p, v in zip(points, np.percentile(values, points))}
+    stats['max'] = float(np.max(values))
+    return stats
@@ -0,0 +1,41 @@
+"""Lookups on a loaded arrangement whose rows only become blocks when reached"""
+
+import numpy as np
+
+from arrangement import Arrangement
+from block_index import BlockIndex
+
+
+def make_arrangement(count=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return Arrangement.from_columns(['C'] * count, np.sort(rng.integers(0, 4000, count) / 4),
+                                    rng.choice([0.5, 1, 2, 4], count), rng.integers(0, 4, count))
+
+
+def test_block_ending_near_finds_pending_rows():
+    arrangement = make_arrangement()
+    rows = arrangement.rows
+    ends = rows['position'] + rows['duration']
+    index = BlockIndex()
+    index.load(arrangement)
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        track, beat = int(rng.integers(0, 4)), float(rng.integers(0, 4000)) / 4
+        block = index.block_ending_near(track, beat, 0.1)
+        expected = np.any((rows['track'] == track) & (np.abs(ends - beat) < 0.1))
+        assert (block is not None) == expected
+        if block is not None:
+            assert block.track == track
+            assert abs(block.position + block.duration - beat) < 0.1
+    assert len(index) == len(arrangement)
+
+
+def test_block_ending_near_only_loads_matching_rows():
+    arrangement = make_arrangement()
+    index = BlockIndex()
+    index.load(arrangement)
+    block = index.block_ending_near(2, 500.0, 0.01)
+    rows = arrangement.rows
+    matching = (rows['track'] == 2) & (np.abs(rows['position'] + rows['duration'] - 500.0) <= 0.01)
+    assert len(index._blocks) == np.count_nonzero(matching)
+    assert (block is None) == (not matching.any())
@@ -0,0 +1,17 @@
+"""Chord rendering and its caches"""
+
+import numpy as np
+
+from chord_generator import ChordGenerator
+
+
+def test_changing_tuning_bypasses_cached_renders():
+    generator = ChordGenerator()
+    at_440 = generator.render_chord('A4n', 0.5, 'Piano').copy()
+    generator.tuning = 432.0
+    at_432 = generator.render_chord('A4n', 0.5, 'Piano')
+
+    fresh = ChordGenerator()
+    fresh.tuning = 432.0
+    assert not np.array_equal(at_432, at_440)
+    assert np.array_equal(at_432, fresh.render_chord('A4n', 0.5, 'Piano'))
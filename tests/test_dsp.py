@@ -0,0 +1,77 @@
+"""Feeding a processor in chunks gives exactly the samples of one whole buffer"""
+
+import numpy as np
+import pytest
+
+from dsp import ConvolutionReverb, FIRFilter, IIRFilter, LookaheadLimiter, smoothing_filter
+
+SAMPLE_RATE = 22050
+
+# Odd sizes, so chunk edges fall everywhere relative to partitions and history
+CHUNK_SIZES = [1, 7, 300, 4097, 2, 999]
+
+
+def make_processors():
+    return {
+        'fir': FIRFilter(np.linspace(1, 0, 31) / 16, latency=15),
+        'smoothing': smoothing_filter(),
+        'iir': IIRFilter.lowpass(1000, SAMPLE_RATE),
+        'reverb': ConvolutionReverb.preset('Room', SAMPLE_RATE, partition=256),
+        'limiter': LookaheadLimiter(ceiling=8000, lookahead=40),
+    }
+
+
+def signal(num_samples, channels=2, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal((num_samples, channels)) * 6000).astype(np.float32)
+
+
+def in_chunks(processor, audio):
+    processor.reset()
+    chunks = []
+    start = 0
+    for size in CHUNK_SIZES * (len(audio) // sum(CHUNK_SIZES) + 1):
+        if start >= len(audio):
+            break
+        chunks.append(processor.process(audio[start:start + size]))
+        start += size
+    chunks.append(processor.flush())
+    return np.concatenate(chunks)
+
+
+def whole(processor, audio):
+    processor.reset()
+    return np.concatenate((processor.process(audio), processor.flush()))
+
+
+@pytest.mark.parametrize('name', sorted(make_processors()))
+def test_chunked_matches_whole_buffer(name):
+    audio = signal(20000)
+    chunked = in_chunks(make_processors()[name], audio)
+    expected = whole(make_processors()[name], audio)
+    assert chunked.dtype == expected.dtype
+    assert np.array_equal(chunked, expected)
+
+
+@pytest.mark.parametrize('name', sorted(make_processors()))
+def test_run_lines_output_up_with_input(name):
+    audio = signal(5000, seed=1)
+    processor = make_processors()[name]
+    expected = whole(processor, audio)[processor.latency:]
+    assert np.array_equal(processor.run(audio), expected[:len(audio)])
+    assert np.array_equal(processor.run(audio, tail=True), expected)
+
+
+@pytest.mark.parametrize('name', sorted(make_processors()))
+def test_float32_stays_float32(name):
+    processor = make_processors()[name]
+    assert processor.process(signal(1000)).dtype == np.float32
+    assert processor.process(signal(0)).dtype == np.float32
+    assert processor.flush().dtype == np.float32
+
+
+def test_fir_filter_keeps_float32():
+    audio = signal(FIRFilter.block_size * 2 + 5)
+    output = smoothing_filter().run(audio)
+    assert output.dtype == np.float32
+    assert output.shape == audio.shape
@@ -0,0 +1,44 @@
+"""The render command's argument handling"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import render_cli
+from chord_generator import INSTRUMENTS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SONGS = os.path.join(ROOT, 'sample_songs')
+
+
+@pytest.mark.parametrize('instrument', INSTRUMENTS)
+def test_every_instrument_is_accepted(tmp_path, instrument):
+    wav_file = tmp_path / 'song.wav'
+    song = os.path.join(SONGS, 'twinkle_twinkle.json')
+    assert render_cli.main([song, str(wav_file), '--instrument', instrument,
+                            '--no-cache', '--jobs', '1']) == 0
+    assert wav_file.stat().st_size > 44
+
+
+def test_unknown_instrument_is_a_usage_error(tmp_path):
+    with pytest.raises(SystemExit) as exit_info:
+        render_cli.main([os.path.join(SONGS, 'twinkle_twinkle.json'), str(tmp_path / 'song.wav'),
+                         '--instrument', 'Kazoo'])
+    assert exit_info.value.code == 2
+
+
+def test_several_songs_need_an_output_directory(tmp_path):
+    with pytest.raises(SystemExit) as exit_info:
+        render_cli.main([SONGS, str(tmp_path / 'out.wav')])
+    assert exit_info.value.code == 2
+    assert not (tmp_path / 'out.wav').exists()
+
+
+def test_render_command_never_imports_pygame(tmp_path):
+    script = ("import sys, music_app; "
+              f"status = music_app.main(['render', {os.path.join(SONGS, 'twinkle_twinkle.json')!r}, "
+              f"{str(tmp_path / 'song.wav')!r}, '--no-cache', '--jobs', '1']); "
+              "sys.exit(status or 'pygame' in sys.modules)")
+    assert subprocess.run([sys.executable, '-c', script], cwd=ROOT).returncode == 0
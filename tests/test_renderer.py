@@ -0,0 +1,150 @@
+"""The parallel and incremental render paths give the same mix as a plain serial render"""
+
+import numpy as np
+import pytest
+
+import renderer
+from arrangement import ChordBlock
+from buses import TrackBuses
+from chord_generator import ChordGenerator
+from renderer import MIXDOWN_TRACK_BYTES, IncrementalMixdown, mix_song
+
+BPM = 110
+
+
+def make_blocks(count=24, seed=3):
+    rng = np.random.default_rng(seed)
+    names = ['C', 'Am', 'G7', 'F4n', 'Dm7^1']
+    return [ChordBlock(names[i % len(names)], float(rng.integers(0, 40)) / 2,
+                       float(rng.choice([0.5, 1, 4])), int(rng.integers(0, 3)))
+            for i in range(count)]
+
+
+def full_mix(generator, blocks, buses=None, sample_rate=None, workers=1, instrument='Piano'):
+    chunks = []
+    mix_song(generator, blocks, BPM, chunks.append, instrument, sample_rate=sample_rate,
+             workers=workers, buses=buses)
+    return np.concatenate(chunks)
+
+
+@pytest.fixture
+def parallel(monkeypatch):
+    """Send even small songs through the worker processes"""
+    monkeypatch.setattr(renderer, 'PARALLEL_MIN_BLOCKS', 1)
+
+
+def tuned_generator(tuning, seed=7):
+    generator = ChordGenerator()
+    generator.tuning = tuning
+    generator.seed = seed
+    return generator
+
+
+@pytest.mark.parametrize('instrument', ['Piano', 'Guitar'])
+@pytest.mark.parametrize('tuning', [440.0, 432.0])
+def test_parallel_render_matches_serial(parallel, tuning, instrument):
+    blocks = make_blocks()
+    buses = TrackBuses()
+    buses.set(1, gain=0.5, pan=-0.4)
+    serial = full_mix(tuned_generator(tuning), blocks, buses, instrument=instrument)
+    parallel_mix = full_mix(tuned_generator(tuning), blocks, buses, workers=2, instrument=instrument)
+    assert np.array_equal(parallel_mix, serial)
+
+
+def test_parallel_remix_takes_chords_from_the_cache(parallel, monkeypatch):
+    generator = ChordGenerator()
+    blocks = make_blocks()
+    first = full_mix(generator, blocks, workers=2)
+
+    def no_workers(workers):
+        raise AssertionError("every chord should come from the generator's cache")
+
+    monkeypatch.setattr(renderer, '_worker_pool', no_workers)
+    assert np.array_equal(full_mix(generator, blocks, workers=2), first)
+
+
+@pytest.mark.parametrize('track_bytes', [MIXDOWN_TRACK_BYTES, 0])  # With and without track mixes
+@pytest.mark.parametrize('sample_rate, workers', [(None, 1), (22050, 1), (None, 2)])
+def test_incremental_mixdown_matches_full_mix(parallel, sample_rate, workers, track_bytes):
+    generator = ChordGenerator()
+    blocks = make_blocks()
+    buses = TrackBuses()
+    mixdown = IncrementalMixdown(generator, sample_rate=sample_rate, workers=workers,
+                                 track_bytes=track_bytes)
+
+    def check():
+        expected = full_mix(generator, blocks, buses, sample_rate)
+        assert np.array_equal(mixdown.render(blocks, BPM, 'Piano', buses), expected)
+
+    check()
+
+    # Move a block
+    block = blocks[4]
+    mixdown.mark_dirty(block.position, block.duration)
+    block.position += 3.5
+    mixdown.mark_dirty(block.position, block.duration)
+    check()
+
+    # Faders
+    buses.set(1, gain=0.3, pan=0.7)
+    buses.set(2, solo=True)
+    check()
+
+    # Remove a track and make the song longer
+    for block in [block for block in blocks if block.track == 2]:
+        mixdown.mark_dirty(block.position, block.duration)
+        blocks.remove(block)
+    added = ChordBlock('Dm7', 60, 4, 0)
+    blocks.append(added)
+    mixdown.mark_dirty(added.position, added.duration)
+    check()
+
+    # Shorter again, and a velocity change
+    blocks.remove(added)
+    mixdown.mark_dirty(added.position, added.duration)
+    blocks[0].velocity = 0.4
+    mixdown.mark_dirty(blocks[0].position, blocks[0].duration)
+    check()
+
+    # A new track and a fader change at once
+    added = ChordBlock('Am', 6, 2, 5)
+    blocks.append(added)
+    mixdown.mark_dirty(added.position, added.duration)
+    buses.set(5, gain=0.5)
+    buses.set(2, solo=False)
+    check()
+
+
+def test_fader_change_only_sums_the_track_mixes_again(monkeypatch):
+    generator = ChordGenerator()
+    blocks = make_blocks()
+    buses = TrackBuses()
+    mixdown = IncrementalMixdown(generator)
+    mixdown.render(blocks, BPM, 'Piano', buses)
+
+    def no_rendering(*args, **kwargs):
+        raise AssertionError("a fader change should not render any chord")
+
+    buses.set(0, gain=0.5, pan=-1)
+    buses.set(1, mute=True)
+    with monkeypatch.context() as patch:
+        patch.setattr(generator, 'render_chords', no_rendering)
+        mixed = mixdown.render(blocks, BPM, 'Piano', buses)
+    assert np.array_equal(mixed, full_mix(ChordGenerator(), blocks, buses))
+
+
+def test_mixdown_follows_a_tuning_change():
+    generator = ChordGenerator()
+    blocks = make_blocks()
+    mixdown = IncrementalMixdown(generator)
+    mixdown.render(blocks, BPM)
+    generator.tuning = 432.0
+    assert np.array_equal(mixdown.render(blocks, BPM), full_mix(tuned_generator(432.0, seed=0), blocks))
+
+
+def test_mixdown_refuses_songs_over_its_budget():
+    blocks = make_blocks()
+    mixdown = IncrementalMixdown(ChordGenerator(), max_bytes=1024)
+    assert not mixdown.fits(blocks, BPM)
+    with pytest.raises(ValueError):
+        mixdown.render(blocks, BPM)
@@ -0,0 +1,144 @@
+"""
+Music Theory - Notes as MIDI numbers and chords built from root, quality and inversion
+"""
+
+import re
+
+import numpy as np
+
+# Tuning reference: MIDI note 69 is A4
+A4_MIDI = 69
+A4_FREQUENCY = 440.0
+
+# Semitones of each natural note above C
+NOTE_OFFSETS = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+
+# Chord qualities as semitones above the root. Power chords keep the
+# palette's voicing: an octave and a fifth below the root, then the root
+CHORD_QUALITIES = {
+    '': (0, 4, 7),
+    'm': (0, 3, 7),
+    'dim': (0, 3, 6),
+    'aug': (0, 4, 8),
+    'sus2': (0, 2, 7),
+    'sus4': (0, 5, 7),
+    '5': (-12, -5, 0),
+    '6': (0, 4, 7, 9),
+    'm6': (0, 3, 7, 9),
+    '7': (0, 4, 7, 10),
+    'maj7': (0, 4, 7, 11),
+    'm7': (0, 3, 7, 10),
+    'mmaj7': (0, 3, 7, 11),
+    'dim7': (0, 3, 6, 9),
+    'm7b5': (0, 3, 6, 10),
+    '7sus4': (0, 5, 7, 10),
+    'add9': (0, 4, 7, 14),
+    '9': (0, 4, 7, 10, 14),
+    'm9': (0, 3, 7, 10, 14),
+    'maj9': (0, 4, 7, 11, 14),
+    '11': (0, 4, 7, 10, 14, 17),
+    '13': (0, 4, 7, 10, 14, 21),
+}
+
+# Octave the root of a chord symbol sits in (C4 = middle C)
+CHORD_OCTAVE = 4
+
+# Lowest and highest MIDI note numbers
+MIDI_MIN = 0
+MIDI_MAX = 127
+
+# How transposed names are spelled, one per pitch class
+NOTE_NAMES = ('C', 'C#', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab', 'A', 'Bb', 'B')
+
+_NOTE_RE = re.compile(r'([A-G])([#b]*)(-?\d+)$')
+_CHORD_RE = re.compile(r'([A-G])([#b]*)(.*?)(?:\^(\d))?(?:/([A-G][#b]*))?$')
+
+
+def note_to_midi(name):
+    """MIDI number of a note name like 'C4', 'F#3' or 'B#4'
+
+    Raises ValueError for names that can't be parsed or fall outside the
+    MIDI range (C-1 to G9).
+    """
+    match = _NOTE_RE.match(name)
+    if not match:
+        raise ValueError(f"Not a note name: {name}")
+    letter, accidentals, octave = match.groups()
+    midi = _pitch_class(letter, accidentals) + 12 * (int(octave) + 1)
+    if not MIDI_MIN <= midi <= MIDI_MAX:
+        raise ValueError(f"Note out of MIDI range: {name}")
+    return midi
+
+
+def midi_to_frequency(midi, a4=A4_FREQUENCY):
+    """Equal-tempered frequency in Hz of MIDI note numbers (scalar or array)"""
+    return a4 * np.power(2.0, (np.asarray(midi, dtype=np.float64) - A4_MIDI) / 12.0)
+
+
+def build_chord(root, quality='', inversion=0, bass=None):
+    """MIDI notes of a chord, lowest first
+
+    root is a MIDI number, quality a key of CHORD_QUALITIES. Each inversion
+    moves the lowest note up an octave. bass (a MIDI number, only its pitch
+    class matters) makes a slash chord: that note is played just below the
+    rest of the chord, taking the place of the chord tone it doubles.
+    """
+    notes = np.array(CHORD_QUALITIES[quality], dtype=np.int16) + root
+    for _ in range(inversion % len(notes)):
+        notes = np.append(notes[1:], notes[0] + 12)
+    if bass is not None:
+        lowest = notes[0]
+        notes = notes[(notes - bass) % 12 != 0]
+        notes = np.insert(notes, 0, lowest - (lowest - bass) % 12)
+    return notes
+
+
+def parse_chord(name):
+    """MIDI notes for a chord symbol ('Am', 'Cmaj7', 'C/E', 'F#m7b5') or single note ('A4n')
+
+    A '^' and a digit after the quality pick an inversion: 'C^1' is C major
+    in first inversion, 'Am7^2/G' an inverted slash chord. Raises ValueError
+    for names that can't be parsed.
+    """
+    if name.endswith('n'):
+        return np.array([note_to_midi(name[:-1])], dtype=np.int16)
+
+    letter, accidentals, quality, inversion, bass = _split_chord(name)
+    root = _pitch_class(letter, accidentals) + 12 * (CHORD_OCTAVE + 1)
+    if not MIDI_MIN <= root <= MIDI_MAX:
+        raise ValueError(f"Chord root out of MIDI range: {name}")
+    if bass is not None:
+        bass = _pitch_class(bass[0], bass[1:]) + 12 * CHORD_OCTAVE
+    return build_chord(root, quality, int(inversion or 0), bass)
+
+
+def transpose_chord(name, semitones):
+    """Name of a chord symbol or single note moved by a number of semitones
+
+    Single notes change octave as they go; chord symbols have no octave, so
+    only their root and slash bass are respelled. Raises ValueError for
+    names that can't be parsed.
+    """
+    if name.endswith('n'):
+        midi = note_to_midi(name[:-1]) + semitones
+        return f"{NOTE_NAMES[midi % 12]}{midi // 12 - 1}n"
+
+    letter, accidentals, quality, inversion, bass = _split_chord(name)
+    symbol = NOTE_NAMES[(_pitch_class(letter, accidentals) + semitones) % 12] + quality
+    if inversion is not None:
+        symbol += f"^{inversion}"
+    if bass is not None:
+        symbol += f"/{NOTE_NAMES[(_pitch_class(bass[0], bass[1:]) + semitones) % 12]}"
+    return symbol
+
+
+def _split_chord(name):
+    """(letter, accidentals, quality, inversion, bass) of a chord symbol; raises ValueError"""
+    match = _CHORD_RE.match(name)
+    if not match or match.group(3) not in CHORD_QUALITIES:
+        raise ValueError(f"Not a chord name: {name}")
+    return match.groups()
+
+
+def _pitch_class(letter, accidentals):
+    return NOTE_OFFSETS[letter] + accidentals.count('#') - accidentals.count('b')
@@ -0,0 +1,59 @@
+"""
+Wavetable - Band-limited single-cycle oscillators for the sustained instruments
+"""
+
+import threading
+
+import numpy as np
+
+
+class WavetableBank:
+    """Precomputes single-cycle tables once and plays them back by table lookup"""
+
+    def __init__(self, table_size=2048):
+        self.table_size = table_size
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tables)
+
+    def table(self, instrument, amplitudes):
+        """Return the single-cycle table for a harmonic spectrum
+
+        amplitudes[k] is the level of harmonic k + 1 of the table's
+        fundamental. Harmonics that would alias at a given pitch are already
+        zeroed by the caller, so each distinct spectrum is one pitch range.
+        """
+        amplitudes = np.asarray(amplitudes, dtype=np.float64)
+        key = (instrument, amplitudes.tobytes())
+        table = self._tables.get(key)
+        if table is None:
+            # Guard samples at the end so interpolation never has to wrap, even
+            # when a phase just below 1.0 rounds up in single precision
+            phase = 2 * np.pi * np.arange(self.table_size + 2) / self.table_size
+            harmonics = np.arange(1, len(amplitudes) + 1)[:, np.newaxis]
+            table = (amplitudes[:, np.newaxis] * np.sin(harmonics * phase)).sum(axis=0)
+            table = table.astype(np.float32)
+            with self._lock:
+                self._tables[key] = table
+        return table
+
+    def lookup(self, table, frequency, t, block_size=16384):
+        """Play a table at frequency over the times t with linear interpolation
+
+        The phase (frequency * t, in cycles of the table's fundamental) is
+        worked out in double precision a block at a time; only its
+        fractional part matters.
+        """
+        out = np.empty(t.shape, dtype=np.float32)
+        for start in range(0, len(t), block_size):
+            cycles = frequency * t[start:start + block_size]
+            position = cycles - np.floor(cycles)
+            position = position.astype(np.float32)
+            position *= self.table_size
+            index = position.astype(np.intp)
+            position -= index  # Fraction between the two neighbouring samples
+            left = table[index]
+            out[start:start + block_size] = left + position * (table[index + 1] - left)
+        return out
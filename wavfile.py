@@ -0,0 +1,95 @@
+"""
+WAV Writer - Streams audio into WAV files as 16/24-bit PCM or 32-bit float
+"""
+
+import struct
+
+import numpy as np
+
+# Sample format -> (bytes per sample, WAVE format tag)
+SAMPLE_FORMATS = {
+    'pcm16': (2, 1),
+    'pcm24': (3, 1),
+    'float32': (4, 3),
+}
+
+
+class WavWriter:
+    """Writes a WAV file chunk by chunk and fills in the sizes on close
+
+    Chunks are float (samples, channels) arrays at 16-bit scale (full scale
+    is 32768), which is how the renderer mixes. PCM output is rounded to the
+    target word length, with TPDF dither by default so quiet passages fade
+    into noise instead of distortion; float output is written as is.
+    """
+
+    def __init__(self, filename, sample_rate, channels=2, sample_format='pcm16', dither=True, seed=0):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"Unknown sample format: {sample_format}")
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_format = sample_format
+        self.dither = dither and sample_format != 'float32'
+        self.frames = 0
+        self._rng = np.random.default_rng(seed)  # Same dither for the same render
+        self._file = open(filename, 'wb')
+        self._write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_header(self):
+        width, tag = SAMPLE_FORMATS[self.sample_format]
+        data_bytes = self.frames * self.channels * width
+        block_align = self.channels * width
+        fmt = struct.pack('<HHIIHH', tag, self.channels, self.sample_rate,
+                          self.sample_rate * block_align, block_align, width * 8)
+        chunks = b''
+        if tag != 1:
+            # Non-PCM formats carry a (empty) extension and a fact chunk
+            fmt += struct.pack('<H', 0)
+            chunks = b'fact' + struct.pack('<II', 4, self.frames)
+        header = (b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt + chunks
+                  + b'data' + struct.pack('<I', data_bytes))
+        self._file.seek(0)
+        self._file.write(b'RIFF' + struct.pack('<I', len(header) + data_bytes) + header)
+
+    def write(self, chunk):
+        """Append (samples, channels) float audio at 16-bit scale"""
+        if len(chunk) == 0:
+            return
+        if self.sample_format == 'float32':
+            data = (np.asarray(chunk, dtype=np.float32) / 32768.0).astype('<f4').tobytes()
+        else:
+            scale, low, high = ((1.0, -32768, 32767) if self.sample_format == 'pcm16'
+                                else (256.0, -8388608, 8388607))
+            samples = np.asarray(chunk, dtype=np.float64) * scale
+            if self.dither:
+                # Triangular (TPDF) dither, +-1 LSB
+                samples += self._rng.random(samples.shape) - self._rng.random(samples.shape)
+            samples = np.clip(np.rint(samples), low, high)
+            if self.sample_format == 'pcm16':
+                data = samples.astype('<i2').tobytes()
+            else:
+                # Low three bytes of each little-endian 32-bit sample
+                data = samples.astype('<i4').view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+        self._file.write(data)
+        self.frames += len(chunk)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._write_header()
+        self._file.close()
+
+
+def to_int16(audio):
+    """Round float audio at 16-bit scale to int16, clipping anything past full scale
+
+    For the boundaries that need 16-bit samples (the audio device, pygame
+    Sounds); everything before them stays float.
+    """
+    return np.clip(np.rint(audio), -32768, 32767).astype(np.int16)